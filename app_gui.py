@@ -5,6 +5,7 @@ from tkinter import scrolledtext
 from tkinter import filedialog
 from tkinter import ttk
 import threading
+import queue
 import time 
 import sys
 import os 
@@ -12,14 +13,6 @@ import configparser
 from datetime import datetime
 
 
-try:
-    import pandas as pd
-    PD_AVAILABLE = True
-except ImportError:
-    pd = None
-    PD_AVAILABLE = False
-    print("WARNING: 'pandas' no está instalado.")
-
 # Importar matplotlib
 try:
     import matplotlib.pyplot as plt
@@ -33,10 +26,18 @@ except ImportError:
 
 # Importar funciones de los otros módulos
 from enroll_test import enroll_user 
-from identify import identify_user_automatically
-from db_utils import get_all_alumnos_details, connect_db, get_clockings_for_month, reset_all_delays, get_alumno_details_by_rut, update_alumno_details, promote_students
+from identify import identify_user_automatically, verify_user
+from db_utils import init_db, db_connection, close_db_pool, reset_all_delays, get_alumno_details_by_rut, update_alumno_details, promote_students, get_attendance_totals, get_course_summary, get_student_summary, count_clockings, get_clockings_page, CLOCKINGS_PAGE_COLUMNS, CLOCKINGS_STATE_FILTERS, count_alumnos, get_alumnos_page, get_course_names, STUDENTS_PAGE_COLUMNS
 from validation_utils import is_valid_rut
-from report_utils import send_report_by_email 
+from table_utils import PagedTable
+from report_utils import send_report_by_email, export_clockings_to_excel, export_range, OPENPYXL_AVAILABLE
+from gallery_utils import get_gallery, get_gallery_planner, get_arrival_model, load_gallery_settings
+from printer_utils import get_print_spooler, get_printer_session
+from device_utils import FingerprintDeviceSession
+from kiosk_utils import AutoScanWorker, load_kiosk_settings
+from metrics_utils import get_latency_recorder
+from log_utils import LogPanel
+from task_utils import TaskExecutor, load_task_settings
 import gi
 
 try:
@@ -46,6 +47,12 @@ except (ValueError, ImportError):
     FPrint = None
     print("WARNING: 'FPrint' no está disponible.")
 
+try:
+    gi.require_version('Gio', '2.0')
+    from gi.repository import Gio
+except (ValueError, ImportError):
+    Gio = None  # Sin Gio la verificación solo se puede cancelar antes de empezar
+
 # ----------------------------------------------------
 # 0. CLASE BASE DE FRAME ESTABLE
 # ----------------------------------------------------
@@ -161,12 +168,20 @@ class FingerprintApp(tk.Tk):
         
         self.logo_img = None
         self.next_destination = None
+
+        # Todo el trabajo en segundo plano de la GUI pasa por aquí; los resultados vuelven
+        # al hilo de Tk con after()
+        self.tasks = TaskExecutor(load_task_settings())
+        self.tasks.start_polling(self)
         
         if FPrint:
             self.fprint_context = FPrint.Context()
             self.fprint_context.enumerate()
+            # El lector se abre una vez y se comparte (bajo fprint_lock) entre identificar, verificar y enrolar
+            self.fprint_session = FingerprintDeviceSession(self.fprint_context, self.fprint_lock)
         else:
             self.fprint_context = None
+            self.fprint_session = None
             self.log_message("ERROR: No se pudo inicializar el contexto de FPrint.")
 
         # Contenedor para los Frames
@@ -182,8 +197,31 @@ class FingerprintApp(tk.Tk):
             frame.grid(row=0, column=0, sticky="nsew")
 
         self.log_messages_widget = self._create_log_widget()
+        self.log_panel = LogPanel.from_settings(self.log_messages_widget)
+        self.log_panel.start()
         self._check_and_reset_annual_delays() # Comprobar y resetear atrasos al iniciar el AÑO
+        self._load_template_gallery() # Deserializar las plantillas una sola vez
+        # La cola de impresión informa su estado al log (desde su propio hilo; log_message es seguro entre hilos)
+        get_print_spooler().set_status_callback(self.log_message)
+        self._start_auto_scan()
         self.show_frame(MainMenuFrame)
+
+    def _start_auto_scan(self):
+        """Inicia el modo kiosco (identificación continua) si está habilitado en [Kiosco]."""
+        self.kiosk_settings = load_kiosk_settings()
+        self.auto_scan = None
+        if not self.kiosk_settings['auto_scan']:
+            return
+        if not self.fprint_session:
+            self.log_message("Modo kiosco desactivado: no hay lector de huellas disponible.")
+            return
+        # Cada escaneo es una tarea de la cola 'hardware' (ver AutoScanWorker)
+        self.auto_scan = AutoScanWorker(self.fprint_session, self.tasks,
+                                        cooldown_seconds=self.kiosk_settings['cooldown_seconds'],
+                                        error_backoff=self.kiosk_settings['error_backoff_seconds'])
+        self.auto_scan.start()
+        self.frames[MainMenuFrame].start_auto_scan_polling(self.auto_scan, self.kiosk_settings['poll_interval_ms'])
+        self.log_message("Modo kiosco activo: el lector queda armado mientras se muestra el menú principal.")
     
     def _load_admin_password(self):
         """
@@ -239,6 +277,40 @@ class FingerprintApp(tk.Tk):
         else:
             self.log_message("El contador de atrasos ya está actualizado para este año.")
 
+    def _load_template_gallery(self):
+        """
+        Construye la galería en memoria en segundo plano. Las plantillas se deserializan por
+        lotes en paralelo y se puede identificar contra la parte ya cargada; el log muestra el avance.
+        """
+        _log = self.log_message
+
+        last_step = [-1]
+        def _progress(loaded, total):
+            # Informar cada 10% para no llenar el log en colegios grandes
+            step = (loaded * 10 // total) if total else 10
+            if step != last_step[0]:
+                last_step[0] = step
+                _log(f"Cargando galería de huellas: {loaded}/{total} ({step * 10}%).")
+
+        def _run():
+            try:
+                start = time.time()
+                # La instantánea en disco evita releer todas las plantillas desde SQLite
+                snapshot_path = load_gallery_settings()['instantanea']
+                if snapshot_path:
+                    loaded = get_gallery().build_from_snapshot(snapshot_path, logger=_log, progress=_progress)
+                else:
+                    loaded = get_gallery().build_from_db(logger=_log, progress=_progress)
+                get_latency_recorder().record('galeria/carga_inicial', time.time() - start, plantillas=loaded)
+                _log(f"Galería de huellas cargada: {loaded} plantillas en {time.time() - start:.2f} s.")
+                # Frecuencias de llegada para ordenar la galería (y excluir a quienes ya marcaron hoy)
+                slots = get_arrival_model().load_from_db()
+                _log(f"Modelo de llegadas cargado: {slots} franjas horarias con historial.")
+            except Exception as e:
+                _log(f"Error al cargar la galería de huellas: {e}")
+
+        self.tasks.submit('database', _run, name='carga_galeria')
+
     def _toggle_fullscreen(self, event=None):
         """Alterna el estado de pantalla completa (F11)."""
         self._is_fullscreen = not getattr(self, '_is_fullscreen', False)
@@ -275,25 +347,40 @@ class FingerprintApp(tk.Tk):
     def show_frame(self, cont, **kwargs):
         """Muestra el frame solicitado y le pasa argumentos opcionales."""
         frame = self.frames[cont]
+        # El escaneo automático solo corre en el menú principal; el resto de pantallas usa el lector
+        auto_scan = getattr(self, 'auto_scan', None)
+        if auto_scan and cont is not MainMenuFrame:
+            auto_scan.pause()
         if hasattr(frame, 'on_show'):
             frame.on_show(**kwargs)
         frame.tkraise()
+        if auto_scan and cont is MainMenuFrame:
+            auto_scan.resume()
 
     def log_message(self, message):
-        """Añade un mensaje al log."""
-        timestamp = datetime.now().strftime("[%H:%M:%S]")
-        full_message = f"{timestamp} {message}\n"
-        
+        """Añade un mensaje al log. Se puede llamar desde cualquier hilo: el panel lo muestra en el siguiente bombeo."""
         try:
-            self.log_messages_widget.config(state='normal')
-            self.log_messages_widget.insert(tk.END, full_message)
-            self.log_messages_widget.see(tk.END)
-            self.log_messages_widget.config(state='disabled')
+            self.log_panel.log(message)
         except AttributeError:
-             print(f"ERROR LOG: {full_message.strip()}") # Falla si se llama antes de _create_log_widget
+            # Antes de crear el panel de log
+            print(f"ERROR LOG: {datetime.now().strftime('[%H:%M:%S]')} {message}")
         
     def quit_app(self):
         self.log_message("Saliendo de la aplicación...")
+        if getattr(self, 'auto_scan', None):
+            self.auto_scan.stop()
+        self.tasks.shutdown(timeout=1.0)
+        for stage, stats in get_gallery_planner().get_stats().items():
+            if stats['intentos']:
+                print(f"Galería '{stage}': {stats['intentos']} intentos, {stats['tasa_acierto']:.0%} aciertos, "
+                      f"{stats['latencia_promedio_s']:.2f} s promedio, {stats['candidatos_promedio']:.0f} candidatos.")
+        get_print_spooler().stop()
+        get_printer_session().close()
+        if self.fprint_session:
+            self.fprint_session.close()
+        get_latency_recorder().close()
+        self.log_panel.close()
+        close_db_pool()
         self.quit()
         sys.exit(0) 
 
@@ -358,6 +445,10 @@ class FingerprintApp(tk.Tk):
 # 2. FRAME: MENÚ PRINCIPAL (MainMenuFrame)
 # ----------------------------------------------------
 class MainMenuFrame(BaseFrame):
+    # Texto bajo los botones mientras el modo kiosco está activo
+    AUTO_SCAN_PROMPT = "Coloque su dedo en el lector para marcar asistencia."
+    AUTO_SCAN_RETRY_PROMPT = "Procesando... apoye el dedo de nuevo."
+
     def __init__(self, parent, controller):
         super().__init__(parent, controller)
         self.identification_lock = threading.Lock()
@@ -431,7 +522,12 @@ class MainMenuFrame(BaseFrame):
         self.attendance_button = tk.Button(buttons_frame, text="MARCAR ASISTENCIA",
                                            command=lambda: self.controller.show_frame(NumericPadFrame),
                                            bg="#4CAF50", fg="white", font=("Helvetica", 24, "bold"))
-        self.attendance_button.grid(row=1, column=0, sticky="n", pady=(10, 60), ipady=60)
+        self.attendance_button.grid(row=1, column=0, sticky="n", pady=(10, 20), ipady=60)
+
+        # Estado del modo kiosco (vacío si el escaneo automático está desactivado)
+        self.auto_scan_label = tk.Label(buttons_frame, text="", font=("Helvetica", 16), bg="#E0E0E0", fg="#333")
+        self.auto_scan_label.grid(row=2, column=0, sticky="n", pady=(0, 40))
+        self.auto_scan = None
 
         self.all_buttons = [self.attendance_button, self.menu_button]
 
@@ -570,8 +666,8 @@ class MainMenuFrame(BaseFrame):
         self.controller.next_destination = destination
         self.controller.show_frame(PasswordCheckFrame)
 
-    def _start_identification_thread(self):
-        """Inicia el proceso de identificación en un hilo para no congelar la GUI."""
+    def _start_identification(self):
+        """Encola la identificación en la cola 'hardware' para no congelar la GUI."""
         if not self.identification_lock.acquire(blocking=False):
             self.controller.log_message("Identificación ya en progreso.")
             return
@@ -579,28 +675,71 @@ class MainMenuFrame(BaseFrame):
         self._lock_all_buttons()  # Bloquear todos los botones
         self.attendance_button.config(text="PROCESANDO...")
         self.controller.log_message("Iniciando escaneo de huella para IDENTIFICACIÓN...")
-        thread = threading.Thread(target=self._run_identification, args=(self.controller.fprint_context,))
-        thread.daemon = True
-        thread.start()
-    
-    def _run_identification(self, fprint_context):
-        """Ejecuta la lógica de identificación y vuelve a habilitar la GUI."""
+        self.controller.tasks.submit(
+            'hardware', identify_user_automatically, self.controller.fprint_context,
+            lock=self.controller.fprint_lock, session=self.controller.fprint_session,
+            name='identificacion', on_success=self._on_identification_result,
+            on_error=self._on_identification_error, on_done=self._on_identification_done)
+
+    def _on_identification_result(self, identified_rut):
+        """Muestra el resultado de la identificación (en el hilo principal)."""
+        if identified_rut:
+            self.controller.log_message(f"Identificación Exitosa para RUT: {identified_rut}. Ticket enviado a impresión.")
+            self.controller.show_timed_messagebox("Éxito", "¡Bienvenido(a)! Asistencia registrada.", duration=3000)
+        else:
+            self.controller.log_message("Identificación Fallida. Huella no reconocida o DB vacía.")
+            messagebox.showerror("Error", "Huella no reconocida o error en el proceso.")
+
+    def _on_identification_error(self, e):
+        self.controller.log_message(f"Error durante la identificación: {e}")
+        messagebox.showerror("Error", "Huella no reconocida o error en el proceso.")
+
+    def _on_identification_done(self):
+        self.identification_lock.release()
+        self._enable_button()
+
+    # --- Modo kiosco (escaneo automático) ---
+    def start_auto_scan_polling(self, auto_scan, interval_ms):
+        """Comienza a revisar periódicamente los resultados del escaneo automático."""
+        self.auto_scan = auto_scan
+        self._auto_scan_interval = interval_ms
+        self.auto_scan_label.config(text=self.AUTO_SCAN_PROMPT)
+        self.after(interval_ms, self._poll_auto_scan)
+
+    def _poll_auto_scan(self):
+        """Vacía la cola de resultados del worker desde el hilo de Tkinter."""
         try:
-            # identify_user_automatically ahora también recibe el lock
-            identified_rut = identify_user_automatically(
-                fprint_context, 
-                lock=self.controller.fprint_lock) 
-            
-            if identified_rut:
-                self.controller.log_message(f"Identificación Exitosa para RUT: {identified_rut}. Ticket impreso.")
-                self.controller.show_timed_messagebox("Éxito", "¡Bienvenido(a)! Asistencia registrada.", duration=3000)
+            while True:
+                self._handle_scan_outcome(self.auto_scan.results.get_nowait())
+        except queue.Empty:
+            pass
+        self.after(self._auto_scan_interval, self._poll_auto_scan)
+
+    def _handle_scan_outcome(self, outcome):
+        """Muestra el resultado de un escaneo automático (siempre en el hilo principal)."""
+        if outcome.evento == 'reintentar':
+            # Sin coincidencia en una galería parcial: no es un rechazo, el próximo toque usa la siguiente
+            self.controller.log_message(f"Modo kiosco: {outcome.mensaje}")
+            self.auto_scan_label.config(text=self.AUTO_SCAN_RETRY_PROMPT)
+            return
+        self.auto_scan_label.config(text=self.AUTO_SCAN_PROMPT)
+        if outcome.evento == 'marcado':
+            result = outcome.resultado
+            if result.registrado:
+                self.controller.log_message(f"Identificación Exitosa para RUT: {outcome.rut} ({result.estado}). Ticket enviado a impresión.")
+                message = f"¡Bienvenido(a), {result.nombre}!\nAsistencia registrada."
             else:
-                self.controller.log_message("Identificación Fallida. Huella no reconocida o DB vacía.")
-                messagebox.showerror("Error", "Huella no reconocida o error en el proceso.")
-        finally:
-            # Re-habilitar el botón en el hilo principal de Tkinter
-            self.controller.after(100, self._enable_button)
-            self.identification_lock.release()
+                self.controller.log_message(f"RUT {outcome.rut} ya había registrado asistencia hoy.")
+                message = f"{result.nombre}\nYa registraste tu asistencia hoy."
+            self.controller.show_timed_messagebox("Éxito", message, duration=2000)
+        elif outcome.evento == 'enfriamiento':
+            self.controller.log_message(f"RUT {outcome.rut} identificado nuevamente; se ignora para evitar una doble marcación.")
+            self.controller.show_timed_messagebox("Asistencia", "Ya registraste tu asistencia hoy.", duration=2000)
+        elif outcome.evento == 'no_reconocido':
+            self.controller.log_message(f"Identificación Fallida. {outcome.mensaje}")
+            self.controller.show_timed_messagebox("Error", "Huella no reconocida.\nIntente nuevamente.", duration=2000)
+        else:
+            self.controller.log_message(f"Modo kiosco: {outcome.mensaje}")
 
     def _enable_button(self):
         """Vuelve a habilitar todos los botones."""
@@ -775,9 +914,8 @@ class EnrollmentFrame(BaseFrame):
         # 2. Validación de campos obligatorios
         # --- NUEVA VALIDACIÓN: Comprobar si hay un dispositivo ANTES de continuar ---
         try:
-            self.controller.fprint_context.enumerate()
-            devices = self.controller.fprint_context.get_devices()
-            if not devices:
+            # La sesión no re-enumera si el lector ya está abierto
+            if not self.controller.fprint_session or not self.controller.fprint_session.is_available():
                 self.controller.log_message("ERROR: No se detectó ningún lector de huellas conectado.")
                 messagebox.showerror("Error de Hardware", "No se encontró ningún lector de huellas. Por favor, conecte el dispositivo e intente de nuevo.")
                 return
@@ -851,7 +989,8 @@ class EnrollmentFrame(BaseFrame):
         try:
             enroll_user(p_n, s_n, a_p, a_m, rut_clean, hora_max, max_warn, curso,
                     logger=self.controller.log_message, 
-                    fprint_context=self.controller.fprint_context)
+                    fprint_context=self.controller.fprint_context,
+                    session=self.controller.fprint_session)
         finally:
             self.controller.after(100, self._finish_enrollment_and_return)
 
@@ -955,12 +1094,15 @@ class ModifyStudentFrame(BaseFrame):
         self._disable_form()
         self.current_rut_clean = None
 
-    def on_show(self, **kwargs):
-        """Resetear vista al mostrar."""
+    def on_show(self, rut=None, **kwargs):
+        """Resetear vista al mostrar. Con 'rut' (desde el listado de alumnos) se busca de inmediato."""
         self.search_rut_entry.delete(0, tk.END)
         self._clear_form()
         self._disable_form()
         self.search_rut_entry.focus_set()
+        if rut:
+            self.search_rut_entry.insert(0, rut)
+            self._search_student()
 
     def _create_entry_field(self, parent, label_text, row):
         tk.Label(parent, text=label_text, font=("Helvetica", 12)).grid(row=row, column=0, padx=10, pady=10, sticky="w")
@@ -1013,14 +1155,13 @@ class ModifyStudentFrame(BaseFrame):
         
         # Buscar en DB
         try:
-            conn = connect_db()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT primer_nombre, segundo_nombre, apellido_paterno, apellido_materno, hora_max_tardanza, max_atrasos_warning, curso
-                FROM ALUMNOS WHERE rut = ?
-            """, (rut_clean,))
-            row = cursor.fetchone()
-            conn.close()
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT primer_nombre, segundo_nombre, apellido_paterno, apellido_materno, hora_max_tardanza, max_atrasos_warning, curso
+                    FROM ALUMNOS WHERE rut = ?
+                """, (rut_clean,))
+                row = cursor.fetchone()
 
             if row:
                 self._enable_form()
@@ -1214,13 +1355,15 @@ class NumericPadFrame(BaseFrame):
         self.controller.show_frame(VerificationStatusFrame, rut=rut_clean)
     
     def _verify_rut_exists(self, rut_clean):
-        """Verifica si el RUT existe en la base de datos."""
+        """Verifica si el RUT tiene huella enrolada (en memoria; consulta la BD solo si la galería no terminó de cargar)."""
+        gallery = get_gallery()
+        if gallery.is_complete:
+            return gallery.contains(rut_clean)
         try:
-            conn = connect_db()
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM ALUMNOS WHERE rut = ?", (rut_clean,))
-            count = cursor.fetchone()[0]
-            conn.close()
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) FROM ALUMNOS WHERE rut = ?", (rut_clean,))
+                count = cursor.fetchone()[0]
             return count > 0
         except Exception as e:
             self.controller.log_message(f"Error al verificar RUT en DB: {e}")
@@ -1271,10 +1414,15 @@ class AdminFrame(BaseFrame):
         # Menú desplegable de Año
         tk.Label(selection_frame, text="Año:", font=("Helvetica", 12)).pack(side=tk.LEFT, padx=5)
         tk.OptionMenu(selection_frame, self.year_var, *years).pack(side=tk.LEFT, padx=15)
+
+        # Año completo: todas las marcaciones del año seleccionado en un solo archivo
+        self.full_year_var = tk.BooleanVar(self, value=False)
+        tk.Checkbutton(selection_frame, text="Año completo", variable=self.full_year_var,
+                       font=("Helvetica", 12)).pack(side=tk.LEFT, padx=15)
         
         # Botón de Exportar
         tk.Button(export_frame, text="GENERAR EXCEL Y EXPORTAR", 
-                  command=self._export_to_excel_thread, 
+                  command=self._export_to_excel, 
                   bg="#1E88E5", fg="white", font=("Helvetica", 12, "bold"), height=2).pack(fill=tk.X, pady=5)
                   
         # --- SECCIÓN VER USUARIOS ---
@@ -1307,6 +1455,18 @@ class AdminFrame(BaseFrame):
         tk.Button(graph_frame, text="VER TABLA DE ASISTENCIAS MENSUAL", 
                   command=self._view_clockings_graphically, 
                   bg="#6A5ACD", fg="white", font=("Helvetica", 12, "bold"), height=2).pack(fill=tk.X)
+
+        tk.Button(graph_frame, text="VER RESUMEN POR CURSO Y ALUMNO", 
+                  command=self._view_attendance_summary, 
+                  bg="#483D8B", fg="white", font=("Helvetica", 12, "bold"), height=2).pack(fill=tk.X, pady=(5, 0))
+
+        # --- SECCIÓN DIAGNÓSTICO: LATENCIAS POR ETAPA ---
+        metrics_frame = tk.LabelFrame(main_content_frame, text="Diagnóstico", padx=10, pady=10, font=("Helvetica", 12, "bold"))
+        metrics_frame.pack(padx=50, pady=10, fill=tk.X)
+
+        tk.Button(metrics_frame, text="VER LATENCIAS DE HOY (p50 / p95 / p99)", 
+                  command=self._view_latency_stats, 
+                  bg="#455A64", fg="white", font=("Helvetica", 12, "bold"), height=2).pack(fill=tk.X)
                   
         # --- SECCIÓN CONFIGURACIÓN DE CORREO REMITENTE ---
         sender_config_frame = tk.LabelFrame(main_content_frame, text="Configuración de Correo Remitente", padx=10, pady=10, font=("Helvetica", 12, "bold"))
@@ -1332,7 +1492,7 @@ class AdminFrame(BaseFrame):
         
         # Botón para la nueva funcionalidad (usando grid)
         email_button = tk.Button(email_frame, text="GENERAR Y ENVIAR REPORTE POR CORREO", 
-                  command=self._export_and_email_thread,
+                  command=self._export_and_email,
                   bg="#D32F2F", fg="white", font=("Helvetica", 12, "bold"), height=2)
         email_button.grid(row=1, column=0, columnspan=2, sticky="ew", pady=10, padx=5)
 
@@ -1398,8 +1558,8 @@ class AdminFrame(BaseFrame):
             self.controller.log_message(f"{error_msg}")
             messagebox.showerror("Error", error_msg)
         
-    def _export_and_email_thread(self):
-        """Inicia la exportación y envío de correo en un hilo."""
+    def _export_and_email(self):
+        """Exporta a Excel y envía el archivo por correo (en las colas 'reporting' y 'network')."""
         self.controller.log_message("Iniciando exportación y envío de correo...")
         
         # Validar que los campos de correo no estén vacíos
@@ -1407,279 +1567,351 @@ class AdminFrame(BaseFrame):
             messagebox.showerror("Error", "Debe ingresar un correo de destinatario.")
             return
             
-        t = threading.Thread(target=self._export_to_excel, kwargs={'send_email': True})
-        t.daemon = True
-        t.start()
+        self._start_export(recipient=self.email_receiver_entry.get())
 
-    def _export_to_excel_thread(self):
-        """Inicia la exportación en un hilo para no congelar la GUI."""
+    def _export_to_excel(self):
+        """Exporta a Excel en la cola 'reporting' para no congelar la GUI."""
         self.controller.log_message("Iniciando exportación de datos a Excel...")
-        t = threading.Thread(target=self._export_to_excel)
-        t.daemon = True
-        t.start()
+        self._start_export()
 
-    def _export_to_excel(self, send_email=False):
+    def _start_export(self, recipient=None):
         """
-        Obtiene los registros de asistencia para el mes/año, los ordena cronológicamente 
-        y los exporta a un archivo Excel.
+        Exporta a Excel las marcaciones del mes/año seleccionado (o del año completo),
+        ordenadas cronológicamente. Las filas pasan directo de la BD al archivo (report_utils).
+        Los valores de la pantalla se leen aquí, en el hilo de Tk; la tarea solo escribe el archivo.
         """
-        if not PD_AVAILABLE:
-            self.controller.log_message("Error: Pandas no está instalado. No se puede generar el Excel.")
-            messagebox.showerror("Error", "La librería 'pandas' no está instalada. No se puede generar el Excel.")
+        if not OPENPYXL_AVAILABLE:
+            self.controller.log_message("Error: openpyxl no está instalado. No se puede generar el Excel.")
+            messagebox.showerror("Error", "La librería 'openpyxl' no está instalada. No se puede generar el Excel.")
             return
 
-        month = int(self.month_var.get())
+        month = None if self.full_year_var.get() else int(self.month_var.get())
         year = int(self.year_var.get())
+        periodo = f"{year}" if month is None else f"{month:02d}/{year}"
+        start_date, end_date, filename = export_range(year, month)
+        filepath = os.path.join(os.getcwd(), filename) # Guardar en el directorio actual
+
+        def _on_error(e):
+            self.controller.log_message(f"Error durante la exportación a Excel: {e}")
+            messagebox.showerror("Error", f"Ocurrió un error inesperado al generar el Excel: {e}")
+
+        self.controller.tasks.submit(
+            'reporting', export_clockings_to_excel, filepath, start_date, end_date, name='exportar_excel',
+            on_success=lambda exported: self._on_export_finished(exported, filepath, periodo, month, recipient),
+            on_error=_on_error)
+
+    def _on_export_finished(self, exported, filepath, periodo, month, recipient):
+        """Informa el resultado de la exportación y, si corresponde, encola el envío por correo."""
+        if exported is None:
+            messagebox.showerror("Error", "Ocurrió un error al generar el Excel. Revise el log.")
+            return
+        if not exported:
+            messagebox.showinfo("Reporte Vacío", f"No hay marcaciones para {periodo}.")
+            return
         
-        try:
-            # 1. Obtener los datos sin procesar de la DB
-            # Esto retorna: rut, Nombre_Completo, fecha, hora_entrada, estado
-            columns, results = get_clockings_for_month(month, year)
-            
-            if not results:
-                messagebox.showinfo("Reporte Vacío", f"No hay marcaciones para {month}/{year}.")
-                return
+        self.controller.log_message(f"Reporte Excel generado: {filepath} ({exported} marcaciones)")
+        
+        if not recipient:
+            messagebox.showinfo("Exportado", f"Excel de marcaciones detallado generado: {filepath}")
+            return
 
-            # 2. Crear un DataFrame de Pandas
-            df = pd.DataFrame(results, columns=columns)
-            
-            # 3. CONSOLIDAR y CAMBIAR NOMBRES DE COLUMNAS
-            df.rename(columns={
-                'rut': 'RUT', 
-                'Nombre_Completo': 'Nombre Completo',
-                'fecha': 'Fecha', 
-                'hora_entrada': 'Hora de Entrada',
-                'estado': 'Estado de Asistencia'
-            }, inplace=True)
-
-            # 4. ORDENAR CRONOLÓGICAMENTE (de la más antigua a la más nueva)
-            # Primero por Fecha, luego por Hora de Entrada
-            df['Hora de Entrada'] = df['Hora de Entrada'].astype(str)
-            df['Fecha'] = pd.to_datetime(df['Fecha'])
-            
-            # La columna Fecha ya es la columna "pivote" cronológica
-            df = df.sort_values(by=['Fecha', 'Hora de Entrada'], ascending=[True, True])
-            
-            # Opcional: Reordenar las columnas para que RUT y Nombre aparezcan primero
-            df = df[['RUT', 'Nombre Completo', 'Fecha', 'Hora de Entrada', 'Estado de Asistencia']]
-            
-            # 5. Exportar a Excel
-            filename = f"Marcaciones_Detalle_{year}_{month:02d}.xlsx"
-            filepath = os.path.join(os.getcwd(), filename) # Guardar en el directorio actual
-            
-            df.to_excel(filepath, index=False)
-            
-            self.controller.log_message(f"Reporte Excel generado: {filepath}")
-            
-            if send_email:
-                # 6. Enviar por correo si se solicita
-                recipient = self.email_receiver_entry.get()
-                subject = f"Reporte Detallado de Marcaciones {month:02d}/{year}"
-                body = f"Adjunto encontrarás el reporte detallado de todas las marcaciones (fecha y hora) para el mes de {month}/{year}."
-                
-                success, msg = send_report_by_email(
-                    recipient_email=recipient,
-                    subject=subject,
-                    body=body,
-                    attachment_path=filepath
-                )
-                if success:
-                    messagebox.showinfo("Correo Enviado", f"Reporte enviado exitosamente a {recipient}")
-                else:
-                    messagebox.showerror("Error de Correo", f"Fallo al enviar el correo: {msg}")
+        # Enviar por correo si se solicita
+        subject = f"Reporte Detallado de Marcaciones {periodo}"
+        body = f"Adjunto encontrarás el reporte detallado de todas las marcaciones (fecha y hora) para {'el año' if month is None else 'el mes de'} {periodo}."
+
+        def _on_sent(result):
+            success, msg = result
+            if success:
+                messagebox.showinfo("Correo Enviado", f"Reporte enviado exitosamente a {recipient}")
             else:
-                messagebox.showinfo("Exportado", f"Excel de marcaciones detallado generado: {filepath}")
+                messagebox.showerror("Error de Correo", f"Fallo al enviar el correo: {msg}")
 
-        except Exception as e:
-            self.controller.log_message(f"Error durante la exportación a Excel: {e}")
-            messagebox.showerror("Error", f"Ocurrió un error inesperado al generar el Excel: {e}")
+        def _on_error(e):
+            self.controller.log_message(f"Error al enviar el reporte por correo: {e}")
+            messagebox.showerror("Error de Correo", f"Fallo al enviar el correo: {e}")
+
+        self.controller.tasks.submit(
+            'network', send_report_by_email, name='enviar_reporte', on_success=_on_sent, on_error=_on_error,
+            recipient_email=recipient, subject=subject, body=body, attachment_path=filepath)
 
 
+    # Espera tras la última tecla antes de consultar la BD (búsqueda incremental)
+    SEARCH_DEBOUNCE_MS = 250
+
     def _view_enrolled_users(self):
-        """Muestra una ventana temporal con el listado de todos los alumnos."""
+        """
+        Directorio de alumnos paginado con búsqueda incremental por nombre, RUT y curso.
+        Doble clic en un alumno abre la pantalla para modificar sus datos.
+        """
         try:
-            columns, results = get_all_alumnos_details()
-
-            if not results:
+            total = count_alumnos()
+            if not total:
                 messagebox.showinfo("Alumnos", "No hay alumnos registrados en la base de datos.")
                 return
-
-            user_list = "ALUMNOS REGISTRADOS:\n\n"
-            
-            # Buscamos los índices de las columnas para mayor robustez
-            col_rut = columns.index('rut') if 'rut' in columns else 4 
-            col_pn = columns.index('primer_nombre') if 'primer_nombre' in columns else 0
-            col_ap = columns.index('apellido_paterno') if 'apellido_paterno' in columns else 2
-            col_hm = columns.index('hora_max_tardanza') if 'hora_max_tardanza' in columns else 5
-            col_sn = columns.index('segundo_nombre') if 'segundo_nombre' in columns else 1 # Segundo nombre
-            col_am = columns.index('apellido_materno') if 'apellido_materno' in columns else 3 # Apellido materno
-
-            for row in results:
-                rut = row[col_rut]
-                pn = row[col_pn]
-                sn = row[col_sn]
-                ap = row[col_ap]
-                am = row[col_am]
-                hm = row[col_hm]
-
-                nombre_completo = f"{pn} {sn} {ap} {am}".strip()
-                user_list += f" - {nombre_completo} | RUT: {rut} | Hora Máx: {hm}\n"
-            
-            # Mostramos en una nueva ventana (Toplevel)
-            list_window = tk.Toplevel(self.controller)
-            list_window.title("Listado de Alumnos")
-            
-            list_text = scrolledtext.ScrolledText(list_window, width=80, height=30, font=("Courier", 11))
-            list_text.insert(tk.END, user_list)
-            list_text.config(state='disabled')
-            list_text.pack(padx=10, pady=10)
-            
-            tk.Button(list_window, text="Cerrar", command=list_window.destroy).pack(pady=5)
-            
+            cursos = get_course_names()
         except Exception as e:
             self.controller.log_message(f"Error al mostrar listado de alumnos: {e}")
             messagebox.showerror("Error", f"No se pudo cargar la lista de alumnos: {e}")
+            return
+
+        list_window = tk.Toplevel(self.controller)
+        list_window.title(f"Listado de Alumnos ({total} registrados)")
+        list_window.geometry("900x600")
+
+        search_frame = tk.Frame(list_window)
+        search_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+        texto_var = tk.StringVar(list_window)
+        curso_var = tk.StringVar(list_window, value='Todos')
+        tk.Label(search_frame, text="Buscar (nombre, RUT o curso):", font=("Helvetica", 11)).pack(side=tk.LEFT)
+        search_entry = ttk.Entry(search_frame, textvariable=texto_var, width=30)
+        search_entry.pack(side=tk.LEFT, padx=(4, 12))
+        tk.Label(search_frame, text="Curso:", font=("Helvetica", 11)).pack(side=tk.LEFT)
+        curso_combo = ttk.Combobox(search_frame, textvariable=curso_var, values=['Todos'] + cursos,
+                                   state='readonly', width=14)
+        curso_combo.pack(side=tk.LEFT, padx=4)
+        count_label = tk.Label(search_frame, text="", font=("Helvetica", 11))
+        count_label.pack(side=tk.RIGHT)
+
+        headings = {'rut': ('RUT', 120, 'center'), 'nombre': ('Nombre Completo', 380, 'w'),
+                    'curso': ('Curso', 120, 'center'), 'hora_max_tardanza': ('Hora Máx', 100, 'center')}
+        columns = [(key,) + headings[key] + (True,) for key in STUDENTS_PAGE_COLUMNS]
+        table = PagedTable(list_window, columns,
+                           lambda **filters: count_alumnos(**filters),
+                           lambda offset, limit, order_by, descending, **filters:
+                               get_alumnos_page(offset, limit, order_by, descending, **filters),
+                           order_by='curso')
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        pending = [None]  # after() de la búsqueda pendiente
+
+        def _search():
+            pending[0] = None
+            try:
+                table.set_filters(texto=texto_var.get().strip(),
+                                  curso='' if curso_var.get() == 'Todos' else curso_var.get())
+            except Exception as e:
+                self.controller.log_message(f"Error al buscar alumnos: {e}")
+                return
+            count_label.config(text=f"{table.total} alumnos")
+
+        def _schedule_search(*_args):
+            # Cada tecla reinicia la espera: solo se consulta cuando el usuario deja de escribir
+            if pending[0] is not None:
+                list_window.after_cancel(pending[0])
+            pending[0] = list_window.after(self.SEARCH_DEBOUNCE_MS, _search)
+
+        def _modify_selected(_event=None):
+            row = table.selected_row()
+            if row:
+                self.controller.show_frame(ModifyStudentFrame, rut=row[0])
+                list_window.destroy()
+
+        texto_var.trace_add('write', _schedule_search)
+        curso_combo.bind('<<ComboboxSelected>>', lambda _event: _search())
+        table.tree.bind('<Double-1>', _modify_selected)
+        table.tree.bind('<Return>', _modify_selected)
+
+        btn_frame = tk.Frame(list_window)
+        btn_frame.pack(fill=tk.X, pady=(0, 8))
+        tk.Button(btn_frame, text="Cerrar", command=list_window.destroy).pack(side=tk.RIGHT, padx=10)
+        tk.Button(btn_frame, text="Modificar Seleccionado", command=_modify_selected).pack(side=tk.RIGHT)
+
+        _search()
+        search_entry.focus_set()
 
     def _view_clockings_graphically(self):
-        """Muestra una tabla con las marcaciones del mes/año seleccionado, ordenada por fecha y hora."""
+        """
+        Muestra las marcaciones del mes/año seleccionado en una tabla paginada: el orden
+        (clic en un encabezado) y los filtros por curso, estado y RUT se resuelven en SQLite.
+        """
         month = int(self.month_var.get())
         year = int(self.year_var.get())
+        start_date, end_date, _filename = export_range(year, month)
 
         try:
-            columns, results = get_clockings_for_month(month, year)
-            if not results:
+            # El total sale del resumen por curso y día, sin recorrer las marcaciones
+            totals = get_attendance_totals(start_date, end_date)
+            if not totals['total']:
                 self.controller.log_message(f"No se encontraron marcaciones para {month:02d}/{year}.")
                 messagebox.showinfo("Marcaciones", f"No se encontraron marcaciones para {month:02d}/{year}.")
                 return
+            cursos = [row[0] for row in get_course_summary(start_date, end_date)]
+        except Exception as e:
+            self.controller.log_message(f"Error al mostrar marcaciones en tabla: {e}")
+            messagebox.showerror("Error", f"Ocurrió un error al mostrar las marcaciones: {e}")
+            return
+        total_atrasos = totals['tardanzas']
+
+        # Crear ventana con tabla
+        table_win = tk.Toplevel(self.controller)
+        table_win.title(f"Marcaciones - {month:02d}/{year} - Total Atrasos: {total_atrasos}")
+        table_win.geometry("1000x600")
+
+        # Filtros (se aplican en la consulta, no sobre filas ya cargadas)
+        filter_frame = tk.Frame(table_win)
+        filter_frame.pack(fill=tk.X, padx=8, pady=(8, 0))
+        curso_var = tk.StringVar(table_win, value='Todos')
+        estado_var = tk.StringVar(table_win, value='Todos')
+        rut_var = tk.StringVar(table_win)
+        tk.Label(filter_frame, text="Curso:").pack(side=tk.LEFT)
+        curso_combo = ttk.Combobox(filter_frame, textvariable=curso_var, values=['Todos'] + cursos,
+                                   state='readonly', width=14)
+        curso_combo.pack(side=tk.LEFT, padx=(2, 10))
+        tk.Label(filter_frame, text="Estado:").pack(side=tk.LEFT)
+        estado_combo = ttk.Combobox(filter_frame, textvariable=estado_var, state='readonly', width=12,
+                                    values=['Todos'] + list(CLOCKINGS_STATE_FILTERS))
+        estado_combo.pack(side=tk.LEFT, padx=(2, 10))
+        tk.Label(filter_frame, text="RUT:").pack(side=tk.LEFT)
+        rut_entry = ttk.Entry(filter_frame, textvariable=rut_var, width=14)
+        rut_entry.pack(side=tk.LEFT, padx=(2, 10))
+        count_label = tk.Label(filter_frame, text="")
+        count_label.pack(side=tk.RIGHT)
+
+        def _count(**filters):
+            return count_clockings(start_date, end_date, **filters)
+
+        def _fetch(offset, limit, order_by, descending, **filters):
+            return get_clockings_page(start_date, end_date, offset, limit, order_by, descending, **filters)
+
+        def _is_late(row):
+            return bool(row[5]) and str(row[5]).lower() in ('atraso', 'tardanza')
+
+        columns = [(key, key.replace('_', ' ').title(), 200 if key == 'Nombre_Completo' else 120,
+                    'w' if key == 'Nombre_Completo' else 'center', True) for key in CLOCKINGS_PAGE_COLUMNS]
+        columns.append(('es_atraso', 'Atraso', 80, 'center', False))
+        table = PagedTable(table_win, columns, _count, _fetch, order_by='fecha',
+                           format_row=lambda row: tuple(row) + ('✓' if _is_late(row) else '',),
+                           row_tags=lambda row: ('atraso',) if _is_late(row) else ())
+        table.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        # Configurar estilo para atrasos
+        table.tree.tag_configure('atraso', background='#ffcccc')
+
+        def _apply_filters(*_args):
+            try:
+                table.set_filters(curso='' if curso_var.get() == 'Todos' else curso_var.get(),
+                                  estado='' if estado_var.get() == 'Todos' else estado_var.get(),
+                                  rut=rut_var.get().strip())
+            except Exception as e:
+                self.controller.log_message(f"Error al filtrar las marcaciones: {e}")
+                messagebox.showerror("Error", f"Ocurrió un error al filtrar las marcaciones: {e}", parent=table_win)
+                return
+            count_label.config(text=f"{table.total} marcaciones")
+
+        curso_combo.bind('<<ComboboxSelected>>', _apply_filters)
+        estado_combo.bind('<<ComboboxSelected>>', _apply_filters)
+        rut_entry.bind('<Return>', _apply_filters)
+        ttk.Button(filter_frame, text="Filtrar", command=_apply_filters).pack(side=tk.LEFT)
+        _apply_filters()
+
+        # Botones de acción
+        btn_frame = tk.Frame(table_win)
+        btn_frame.pack(fill=tk.X, pady=6)
+        ttk.Button(btn_frame, text="Cerrar", command=table_win.destroy).pack(side=tk.RIGHT, padx=8)
+
+        # Exportar a CSV (con el orden y los filtros de la tabla, por lotes)
+        def _export_csv():
+            fp = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+            if not fp:
+                return
+            try:
+                import csv
+                with open(fp, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow([c[0] for c in columns])
+                    for rows in table.iter_rows():
+                        writer.writerows(tuple(row) + ('✓' if _is_late(row) else '',) for row in rows)
+                    # Agregar estadísticas al final
+                    writer.writerow([])
+                    writer.writerow(['TOTAL ATRASOS', total_atrasos])
+                self.controller.log_message(f"Exportación CSV exitosa: {fp}")
+                messagebox.showinfo("Exportado", f"CSV generado: {fp}")
+            except Exception as e:
+                self.controller.log_message(f"Error exportando CSV: {e}")
+                messagebox.showerror("Error", f"No se pudo exportar: {e}")
 
-            # Identificar índices útiles en la tupla de resultados
-            col_names = list(columns)
-            idx_fecha = col_names.index('fecha') if 'fecha' in col_names else None
-            idx_hora = col_names.index('hora_entrada') if 'hora_entrada' in col_names else None
-            idx_estado = col_names.index('estado') if 'estado' in col_names else None
-
-            # Agregar columna de atrasos después de estado
-            if idx_estado is not None:
-                col_names.insert(idx_estado + 1, 'es_atraso')
-            else:
-                col_names.append('es_atraso')
+        ttk.Button(btn_frame, text="Exportar CSV", command=_export_csv).pack(side=tk.RIGHT, padx=8)
 
-            # Ordenar por fecha y hora (si existen índices válidos)
-            def _parse_dt(row):
-                try:
-                    f = row[idx_fecha] if idx_fecha is not None else ''
-                    h = row[idx_hora] if idx_hora is not None else ''
-                    if not f:
-                        return datetime.min
-                    # Normalizar hora si viene sin segundos
-                    if h and len(str(h).split(':')) == 2:
-                        h = str(h) + ":00"
-                    return datetime.strptime(str(f) + ' ' + str(h), '%Y-%m-%d %H:%M:%S')
-                except Exception:
-                    return datetime.min
-
-            sorted_results = sorted(results, key=_parse_dt)
-
-            # Agregar indicador de atraso a cada fila
-            total_atrasos = 0
-            enhanced_results = []
-            for row in sorted_results:
-                row_list = list(row)
-                es_atraso = ''
-                if idx_estado is not None and row[idx_estado] and str(row[idx_estado]).lower() in ['atraso', 'tardanza']:
-                    es_atraso = '✓'
-                    total_atrasos += 1
-                
-                if idx_estado is not None:
-                    row_list.insert(idx_estado + 1, es_atraso)
-                else:
-                    row_list.append(es_atraso)
-                
-                enhanced_results.append(row_list)
-
-            # Crear ventana con tabla
-            table_win = tk.Toplevel(self.controller)
-            table_win.title(f"Marcaciones - {month:02d}/{year} - Total Atrasos: {total_atrasos}")
-            table_win.geometry("1000x600")
-
-            # Frame para la tabla y scrollbars
-            frame = tk.Frame(table_win)
-            frame.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
-
-            cols = col_names
-            tree = ttk.Treeview(frame, columns=cols, show='headings', selectmode='browse')
-            vsb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
-            hsb = ttk.Scrollbar(frame, orient="horizontal", command=tree.xview)
-            tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-
-            # Configurar encabezados y anchos razonables
-            for c in cols:
-                if c == 'es_atraso':
-                    heading = 'Atraso'
-                    tree.heading(c, text=heading)
-                    tree.column(c, width=80, anchor='center')
-                else:
-                    heading = c.replace('_', ' ').title()
-                    tree.heading(c, text=heading)
-                    if c in ('fecha', 'hora_entrada', 'estado'):
-                        tree.column(c, width=120, anchor='center')
-                    elif c in ('rut',):
-                        tree.column(c, width=120, anchor='center')
-                    else:
-                        tree.column(c, width=200, anchor='w')
-
-            tree.grid(row=0, column=0, sticky='nsew')
-            vsb.grid(row=0, column=1, sticky='ns')
-            hsb.grid(row=1, column=0, sticky='ew')
-
-
-            frame.grid_rowconfigure(0, weight=1)
-            frame.grid_columnconfigure(0, weight=1)
-
-            # Insertar filas ya ordenadas
-            for row in enhanced_results:
-                display_row = [str(item) if item is not None else '' for item in row]
-                item_id = tree.insert('', tk.END, values=display_row)
-                
-                # Resaltar atrasos en rojo
-                idx_atraso_col = col_names.index('es_atraso')
-                if row[idx_atraso_col] == '✓':
-                    tree.item(item_id, tags=('atraso',))
-            
-            # Configurar estilo para atrasos
-            tree.tag_configure('atraso', background='#ffcccc')
-
-            # Botones de acción
-            btn_frame = tk.Frame(table_win)
-            btn_frame.pack(fill=tk.X, pady=6)
-            ttk.Button(btn_frame, text="Cerrar", command=table_win.destroy).pack(side=tk.RIGHT, padx=8)
-
-            # Exportar a CSV
-            def _export_csv():
-                fp = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")])
-                if not fp:
-                    return
-                try:
-                    import csv
-                    with open(fp, 'w', newline='', encoding='utf-8') as f:
-                        writer = csv.writer(f)
-                        writer.writerow(cols)
-                        for r in enhanced_results:
-                            writer.writerow([r[i] if i < len(r) else '' for i in range(len(cols))])
-                        # Agregar estadísticas al final
-                        writer.writerow([])
-                        writer.writerow(['TOTAL ATRASOS', total_atrasos])
-                    self.controller.log_message(f"Exportación CSV exitosa: {fp}")
-                    messagebox.showinfo("Exportado", f"CSV generado: {fp}")
-                except Exception as e:
-                    self.controller.log_message(f"Error exportando CSV: {e}")
-                    messagebox.showerror("Error", f"No se pudo exportar: {e}")
-
-            ttk.Button(btn_frame, text="Exportar CSV", command=_export_csv).pack(side=tk.RIGHT, padx=8)
+    def _view_attendance_summary(self):
+        """Muestra presentes/tardanzas/ausentes por curso y por alumno del mes (o año) seleccionado."""
+        month = None if self.full_year_var.get() else int(self.month_var.get())
+        year = int(self.year_var.get())
+        periodo = f"{year}" if month is None else f"{month:02d}/{year}"
+        start_date, end_date, _filename = export_range(year, month)
 
+        try:
+            # Los resúmenes ya están agregados: unas pocas filas por curso y una por alumno
+            course_rows = get_course_summary(start_date, end_date)
+            student_rows = get_student_summary(start_date[:7], end_date[:7])
         except Exception as e:
-            self.controller.log_message(f"Error al mostrar marcaciones en tabla: {e}")
-            messagebox.showerror("Error", f"Ocurrió un error al mostrar las marcaciones: {e}")
+            self.controller.log_message(f"Error al leer el resumen de asistencia: {e}")
+            messagebox.showerror("Error", f"Ocurrió un error al leer el resumen de asistencia: {e}")
+            return
+        if not course_rows:
+            messagebox.showinfo("Resumen", f"No se encontraron marcaciones para {periodo}.")
+            return
+
+        summary_win = tk.Toplevel(self.controller)
+        summary_win.title(f"Resumen de Asistencia - {periodo}")
+        summary_win.geometry("1000x600")
+        notebook = ttk.Notebook(summary_win)
+        notebook.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+
+        def _add_tab(title, cols, headings, rows):
+            frame = tk.Frame(notebook)
+            notebook.add(frame, text=title)
+            tree = ttk.Treeview(frame, columns=cols, show='headings')
+            vsb = ttk.Scrollbar(frame, orient='vertical', command=tree.yview)
+            tree.configure(yscrollcommand=vsb.set)
+            for c, heading in zip(cols, headings):
+                numeric = c not in ('curso', 'rut', 'nombre')
+                tree.heading(c, text=heading)
+                tree.column(c, width=90 if numeric else 200, anchor='e' if numeric else 'w')
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            vsb.pack(side=tk.RIGHT, fill=tk.Y)
+            for row in rows:
+                tree.insert('', tk.END, values=[item if item is not None else '' for item in row])
+
+        _add_tab("Por Curso", ('curso', 'dias', 'presentes', 'tardanzas', 'ausentes', 'total'),
+                 ("Curso", "Días", "Presentes", "Tardanzas", "Ausentes", "Total"), course_rows)
+        _add_tab("Por Alumno", ('rut', 'nombre', 'curso', 'presentes', 'tardanzas', 'ausentes', 'total'),
+                 ("RUT", "Nombre", "Curso Actual", "Presentes", "Tardanzas", "Ausentes", "Total"), student_rows)
+
+        ttk.Button(summary_win, text="Cerrar", command=summary_win.destroy).pack(side=tk.RIGHT, padx=8, pady=6)
+
+    def _view_latency_stats(self):
+        """Muestra los percentiles de latencia del día por etapa (identificación, enrolamiento, impresión)."""
+        stats_win = tk.Toplevel(self.controller)
+        stats_win.title("Latencias por Etapa (Hoy)")
+        stats_win.geometry("820x420")
+
+        frame = tk.Frame(stats_win)
+        frame.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        cols = ('etapa', 'n', 'p50', 'p95', 'p99', 'promedio', 'max')
+        headings = {'etapa': 'Etapa', 'n': 'Mediciones', 'p50': 'p50 (ms)', 'p95': 'p95 (ms)',
+                    'p99': 'p99 (ms)', 'promedio': 'Promedio (ms)', 'max': 'Máx (ms)'}
+        tree = ttk.Treeview(frame, columns=cols, show='headings')
+        vsb = ttk.Scrollbar(frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=vsb.set)
+        for c in cols:
+            tree.heading(c, text=headings[c])
+            tree.column(c, width=260 if c == 'etapa' else 90, anchor='w' if c == 'etapa' else 'e')
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+
+        def _refresh():
+            tree.delete(*tree.get_children())
+            summary = get_latency_recorder().get_summary()
+            if not summary:
+                tree.insert('', tk.END, values=("Sin mediciones hoy", '', '', '', '', '', ''))
+            for stage, data in summary.items():
+                tree.insert('', tk.END, values=(stage, data['n']) + tuple(
+                    f"{data[key] * 1000:.1f}" for key in ('p50_s', 'p95_s', 'p99_s', 'promedio_s', 'max_s')))
+
+        btn_frame = tk.Frame(stats_win)
+        btn_frame.pack(fill=tk.X, pady=6)
+        ttk.Button(btn_frame, text="Cerrar", command=stats_win.destroy).pack(side=tk.RIGHT, padx=8)
+        ttk.Button(btn_frame, text="Actualizar", command=_refresh).pack(side=tk.RIGHT, padx=8)
+        _refresh()
 
     def _reset_delays_confirmation(self):
         """Muestra diálogo de confirmación y resetea los atrasos si se confirma."""
@@ -1720,39 +1952,39 @@ class EnrollmentStatusFrame(BaseFrame):
         self.status_label.config(text="Coloque el dedo en el lector cuando se le solicite.")
         self.back_button.config(state=tk.DISABLED)
         
-        # 2. Iniciar el hilo de enrolamiento
-        threading.Thread(target=self._run_enrollment_thread, daemon=True).start()
+        # 2. Encolar el enrolamiento en la cola del lector
+        self.controller.tasks.submit(
+            'hardware', self._run_enrollment, data, name='enrolamiento',
+            on_success=self._on_enrollment_result,
+            on_error=lambda e: self._handle_enrollment_error(f"Error crítico: {e}"))
 
     def _update_log_message(self, message):
         """Método de log que se pasa al enroll_user para actualizar la GUI."""
-        # Se usa after para asegurar que la actualización del log se hace en el hilo principal de Tkinter
-        self.controller.after(0, lambda: self.controller.log_message(message))
-        self.controller.after(0, lambda: self.status_label.config(text=message.replace('\n', ' ')))
-
-    def _run_enrollment_thread(self):
-        """Ejecuta la función de enrolamiento en el hilo secundario."""
-        try:
-            # Desempaquetar los datos del alumno
-            p_n, s_n, a_p, a_m, rut_clean, hora_max, max_warn, curso = self.alumno_data
-            
-            # Llamar a la función de enrolamiento con el lock y el logger
-            success, message = enroll_user(
-                p_n, s_n, a_p, a_m, rut_clean, hora_max, max_warn, curso,
-                logger=self._update_log_message, # Usar el logger de este frame
-                fprint_context=self.controller.fprint_context,
-                lock=self.controller.fprint_lock # Pasar el lock
-            )
-            
-            if success:
-                # Si tiene éxito, el hilo llama a la finalización
-                self.controller.after(100, lambda: self._finish_process(f"{message}"))
-            else:
-                # Si falla, mostrar error y permitir volver
-                self.controller.after(100, lambda: self._handle_enrollment_error(message))
-
-        except Exception as e:
-            # Si hay una excepción no controlada
-            self.controller.after(100, lambda: self._handle_enrollment_error(f"Error crítico: {e}"))
+        # El log es seguro entre hilos; la etiqueta se actualiza en el hilo principal de Tkinter
+        self.controller.log_message(message)
+        self.controller.tasks.call_in_ui(self.status_label.config, text=message.replace('\n', ' '))
+
+    def _run_enrollment(self, alumno_data):
+        """Ejecuta la función de enrolamiento (en la cola 'hardware'). Retorna (éxito, mensaje)."""
+        # Desempaquetar los datos del alumno
+        p_n, s_n, a_p, a_m, rut_clean, hora_max, max_warn, curso = alumno_data
+        
+        # Llamar a la función de enrolamiento con el lock y el logger
+        return enroll_user(
+            p_n, s_n, a_p, a_m, rut_clean, hora_max, max_warn, curso,
+            logger=self._update_log_message, # Usar el logger de este frame
+            fprint_context=self.controller.fprint_context,
+            lock=self.controller.fprint_lock, # Pasar el lock
+            session=self.controller.fprint_session # Lector compartido ya abierto
+        )
+
+    def _on_enrollment_result(self, result):
+        success, message = result
+        if success:
+            self._finish_process(f"{message}")
+        else:
+            # Si falla, mostrar error y permitir volver
+            self._handle_enrollment_error(message)
             
     def _handle_enrollment_error(self, error_message):
         """Maneja el error de enrolamiento en la GUI."""
@@ -1791,6 +2023,7 @@ class VerificationStatusFrame(BaseFrame):
     def __init__(self, parent, controller):
         super().__init__(parent, controller)
         self.rut_to_verify = None
+        self._task = None  # Verificación en curso (TaskHandle)
 
         tk.Label(self, text="VERIFICACIÓN DE ASISTENCIA", font=("Helvetica", 20, "bold"), fg="#4CAF50").pack(pady=(50, 20))
         
@@ -1810,41 +2043,62 @@ class VerificationStatusFrame(BaseFrame):
         # Bloquear botones del menú principal
         self.controller.lock_main_menu_buttons()
         
-        # Iniciar el hilo de verificación
-        threading.Thread(target=self._run_verification_thread, daemon=True).start()
+        # Encolar la verificación en la cola del lector; "Cancelar" interrumpe la espera del dedo
+        cancellable = Gio.Cancellable() if Gio else None
+        task = self.controller.tasks.submit(
+            'hardware', self._run_verification, rut, cancellable, name='verificacion',
+            on_success=lambda verification: self._on_verification_result(task, rut, verification),
+            on_error=lambda e: self._on_verification_error(task, e))
+        if cancellable is not None:
+            task.token.on_cancel(cancellable.cancel)
+        self._task = task
 
     def _update_status_message(self, message):
-        """Actualiza el mensaje de estado en la GUI."""
-        self.controller.after(0, lambda: self.status_label.config(text=message))
-        self.controller.after(0, lambda: self.controller.log_message(message))
-
-    def _run_verification_thread(self):
-        """Ejecuta la lógica de verificación en un hilo secundario."""
-        try:
-            self._update_status_message("Por favor, coloque su dedo en el lector...")
-            
-            identified_rut = identify_user_automatically(
-                self.controller.fprint_context, 
-                rut_to_verify=self.rut_to_verify,
-                lock=self.controller.fprint_lock
-            )
-            
-            if identified_rut:
-                msg = f"¡Bienvenido(a)! Asistencia registrada para {identified_rut}."
-                self._update_status_message(msg)
-                self.controller.show_timed_messagebox("Éxito", msg, duration=3000)
+        """Actualiza el mensaje de estado en la GUI (se puede llamar desde la tarea)."""
+        self.controller.tasks.call_in_ui(self.status_label.config, text=message)
+        self.controller.log_message(message)
+
+    def _run_verification(self, rut, cancellable):
+        """Ejecuta la verificación 1:1 con una sola plantilla (verify_sync) en la cola 'hardware'."""
+        self._update_status_message("Por favor, coloque su dedo en el lector...")
+        return verify_user(
+            rut,
+            session=self.controller.fprint_session,
+            fprint_context=self.controller.fprint_context,
+            lock=self.controller.fprint_lock,
+            cancellable=cancellable
+        )
+
+    def _on_verification_result(self, task, rut, verification):
+        """Muestra el resultado de la verificación (en el hilo principal)."""
+        if verification and verification.coincide and verification.resultado:
+            msg = f"¡Bienvenido(a)! Asistencia registrada para {verification.resultado.nombre}."
+            self._update_status_message(msg)
+            self.controller.log_message(f"Verificación 1:1 de {rut} en {verification.latencia_s:.2f} s.")
+            self.controller.show_timed_messagebox("Éxito", msg, duration=3000)
+            if not task.cancelled:
                 self.controller.after(3000, self._finish_process) # Solo en caso de éxito, volver al menú
-            else:
-                msg = "La huella no coincide con el RUT ingresado."
-                self._update_status_message(f"{msg}")
-                # Mostrar el error y luego volver al pad numérico
-                self.controller.after(2000, self._return_to_rut_pad)
+            return
+        if task.cancelled:
+            # El usuario ya volvió al menú
+            return
+        if verification is None:
+            msg = "No se pudo verificar: no hay huella registrada para este RUT o falló el lector."
+        elif verification.coincide:
+            msg = "La huella coincide, pero no se pudo registrar la asistencia."
+        else:
+            msg = "La huella no coincide con el RUT ingresado."
+        self._update_status_message(f"{msg}")
+        # Mostrar el error y luego volver al pad numérico
+        self.controller.after(2000, self._return_to_rut_pad)
 
-        except Exception as e:
-            error_msg = f"Error durante la verificación: {e}"
-            self._update_status_message(f"{error_msg}")
-            # En caso de error, también volver al pad numérico
-            self.controller.after(2000, self._return_to_rut_pad)
+    def _on_verification_error(self, task, e):
+        if task.cancelled:
+            return
+        error_msg = f"Error durante la verificación: {e}"
+        self._update_status_message(f"{error_msg}")
+        # En caso de error, también volver al pad numérico
+        self.controller.after(2000, self._return_to_rut_pad)
 
     def _finish_process(self):
         """Desbloquea botones y vuelve al menú principal."""
@@ -1853,6 +2107,8 @@ class VerificationStatusFrame(BaseFrame):
 
     def _cancel_process(self):
         """Cancela el proceso y vuelve al menú principal."""
+        if self._task is not None:
+            self._task.cancel()
         self._finish_process()
 
     def _return_to_rut_pad(self):
@@ -1868,8 +2124,8 @@ class VerificationStatusFrame(BaseFrame):
 
 if __name__ == "__main__":
     try:
-        # Inicializa la base de datos (crea ALUMNOS y ASISTENCIAS)
-        connect_db().close() 
+        # Inicializa la base de datos una sola vez (crea tablas y aplica migraciones)
+        init_db()
         app = FingerprintApp()
         app.mainloop()
     except Exception as db_err:
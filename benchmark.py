@@ -0,0 +1,430 @@
+# benchmark.py (Carga sintética y mediciones de rendimiento con lector e impresora simulados)
+#
+# Uso:
+#   python3 benchmark.py                          # 1.000, 10.000 y 50.000 alumnos, 1 año de historial
+#   python3 benchmark.py --alumnos 1000 --anos 3 --salida bench_results.json
+#   python3 benchmark.py --alumnos 1000 --comparar bench_anterior.json
+#
+# Cada tamaño se mide en un proceso aparte (la galería, el pool de conexiones y la cola de
+# impresión son únicos por proceso). Los resultados quedan en un JSON para comparar versiones.
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import date, datetime, timedelta
+
+from reproduce_enrollment import MockDevice, MockContext
+
+BENCH_FORMAT_VERSION = 1
+DEFAULT_SIZES = (1000, 10000, 50000)
+CURSOS = ('1ro Medio', '2do Medio', '3ro Medio', '4to Medio')
+HORA_MAX_TARDANZA = '08:00:00'
+TASA_ASISTENCIA = 0.92
+
+# Métricas que se comparan con --comparar: (sección, clave, True si mayor es mejor)
+TRACKED_METRICS = (
+    ('inicio', 'galeria_bd_s', False),
+    ('inicio', 'galeria_instantanea_s', False),
+    ('identificacion', 'por_segundo', True),
+    ('identificacion', 'p95_ms', False),
+    ('marcacion', 'por_segundo', True),
+    ('reporte_mensual', 'consulta_s', False),
+    ('reporte_mensual', 'excel_s', False),
+    ('reporte_mensual', 'resumen_s', False),
+    ('reporte_anual', 'excel_s', False),
+    ('promocion', 'promocion_s', False),
+)
+
+
+# --- BACKEND SIMULADO DE LIBFPRINT ---
+
+class MockPrint:
+    """Plantilla simulada: la 'coincidencia' es comparar el RUT guardado como username."""
+
+    def __init__(self, data=b''):
+        self.data = data
+        self.username = None
+
+    @staticmethod
+    def deserialize(data):
+        return MockPrint(data)
+
+    def set_username(self, username):
+        self.username = username
+
+    def get_username(self):
+        return self.username
+
+
+class _MockProps:
+    removed = False
+    finger_status = 0
+
+
+class BenchDevice(MockDevice):
+    """
+    MockDevice de reproduce_enrollment.py con identify_sync/verify_sync. El dedo apoyado es
+    el RUT en 'finger'; identify_sync recorre la galería como un driver que se detiene en
+    la primera coincidencia, con un costo opcional por comparación.
+    """
+
+    def __init__(self, compare_cost_s=0.0):
+        super().__init__()
+        self.props = _MockProps()
+        self.finger = None
+        self.compare_cost_s = compare_cost_s
+        self.comparisons = 0
+
+    def is_open(self):
+        return self.is_opened()
+
+    def connect(self, signal, callback):
+        return 0
+
+    def disconnect(self, handler):
+        pass
+
+    def _compare(self):
+        self.comparisons += 1
+        if self.compare_cost_s:
+            end = time.perf_counter() + self.compare_cost_s
+            while time.perf_counter() < end:
+                pass
+
+    def identify_sync(self, prints, cancellable=None):
+        capture = MockPrint()
+        for candidate in prints:
+            self._compare()
+            if candidate.get_username() == self.finger:
+                return candidate, capture
+        return None, capture
+
+    def verify_sync(self, template, cancellable=None):
+        self._compare()
+        return template.get_username() == self.finger, MockPrint()
+
+
+class BenchContext(MockContext):
+    def __init__(self, compare_cost_s=0.0):
+        self.device = BenchDevice(compare_cost_s)
+
+    def connect(self, signal, callback):
+        return 0
+
+
+def install_mock_fprint():
+    """Registra un módulo 'gi' simulado antes de importar identify/gallery_utils (como verify_delays.py)."""
+    gi = types.ModuleType('gi')
+    gi.require_version = lambda namespace, version: None
+    repository = types.ModuleType('gi.repository')
+    repository.FPrint = types.SimpleNamespace(
+        Print=MockPrint, FingerStatusFlags=types.SimpleNamespace(PRESENT=1))
+    repository.GLib = types.SimpleNamespace()
+    repository.Gio = None
+    gi.repository = repository
+    sys.modules['gi'] = gi
+    sys.modules['gi.repository'] = repository
+
+
+# --- GENERACIÓN DE DATOS ---
+
+def _school_days(years, today):
+    """Días hábiles de marzo a mediados de diciembre de los últimos 'years' años (hasta ayer)."""
+    day = today - timedelta(days=int(365 * years))
+    while day < today:
+        if day.weekday() < 5 and (3 <= day.month <= 11 or (day.month == 12 and day.day <= 15)):
+            yield day
+        day += timedelta(days=1)
+
+def generate_database(db_utils, students, years, template_bytes, seed):
+    """Crea 'students' alumnos con plantilla y 'years' años de ASISTENCIAS. Retorna las filas de asistencia."""
+    rng = random.Random(seed)
+    db_utils.init_db()
+    habitual = {}
+    with db_utils.db_connection() as conn:
+        conn.execute("BEGIN")
+        alumnos = []
+        for i in range(1, students + 1):
+            habitual[i] = 7 * 60 + 20 + rng.randint(0, 50)  # Minuto habitual de llegada
+            alumnos.append((i, f"Nombre{i}", None, f"Paterno{i % 997}", f"Materno{i % 991}",
+                            f"{10000000 + i}-{i % 10}", CURSOS[i % len(CURSOS)], HORA_MAX_TARDANZA))
+        conn.executemany("""
+            INSERT INTO ALUMNOS (id_alumno, primer_nombre, segundo_nombre, apellido_paterno,
+                                 apellido_materno, rut, curso, hora_max_tardanza)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, alumnos)
+        conn.executemany("INSERT INTO PLANTILLAS (id_alumno, plantilla) VALUES (?, ?)",
+                         ((i, rng.randbytes(template_bytes)) for i in range(1, students + 1)))
+
+        counter = [0]
+        def _asistencias():
+            for day in _school_days(years, date.today()):
+                fecha = day.isoformat()
+                for i in range(1, students + 1):
+                    if rng.random() > TASA_ASISTENCIA:
+                        continue
+                    minute = habitual[i] + int(rng.gauss(0, 6))
+                    hora = f"{minute // 60:02d}:{minute % 60:02d}:{rng.randint(0, 59):02d}"
+                    counter[0] += 1
+                    yield (i, fecha, hora, 'tardanza' if hora > HORA_MAX_TARDANZA else 'presente',
+                           CURSOS[i % len(CURSOS)])
+        # Carga masiva: los resúmenes se calculan al final con una sola pasada
+        conn.execute("UPDATE META SET valor = 1 WHERE clave = 'resumen_en_lote'")
+        conn.executemany("""
+            INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado, curso) VALUES (?, ?, ?, ?, ?)
+        """, _asistencias())
+        conn.execute("UPDATE META SET valor = 0 WHERE clave = 'resumen_en_lote'")
+        conn.commit()
+    db_utils.rebuild_attendance_summaries()
+    with db_utils.db_connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("ANALYZE")
+    return counter[0]
+
+
+# --- MEDICIONES ---
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))]
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def run_size(students, years, template_bytes, operations, compare_cost_s, workdir, seed):
+    """Genera la BD de un tamaño y ejecuta todas las mediciones. Retorna un diccionario de resultados."""
+    install_mock_fprint()
+    import db_utils
+    db_utils.DB_NAME = os.path.join(workdir, f"bench_{students}.db")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_utils.DB_NAME + suffix):
+            os.remove(db_utils.DB_NAME + suffix)
+
+    import printer_utils
+    import gallery_utils
+    from device_utils import FingerprintDeviceSession
+    from identify import identify_and_clock
+
+    result = {'alumnos': students, 'anos_historial': years}
+    asistencias, result['generacion_s'] = _timed(generate_database, db_utils, students, years, template_bytes, seed)
+    result['asistencias'] = asistencias
+    result['tamano_bd_mb'] = round(os.path.getsize(db_utils.DB_NAME) / 1e6, 1)
+
+    # 1. Inicio: galería desde SQLite, instantánea (primera vez y al día) y modelo de llegadas
+    quiet = lambda message: None
+    inicio = {}
+    _, inicio['galeria_bd_s'] = _timed(gallery_utils.TemplateGallery().build_from_db, logger=quiet)
+    snapshot_path = os.path.join(workdir, f"bench_{students}.snapshot")
+    if os.path.exists(snapshot_path):
+        os.remove(snapshot_path)
+    _, inicio['instantanea_creacion_s'] = _timed(gallery_utils.TemplateGallery().build_from_snapshot, snapshot_path, logger=quiet)
+    _, inicio['galeria_instantanea_s'] = _timed(gallery_utils.TemplateGallery().build_from_snapshot, snapshot_path, logger=quiet)
+    gallery = gallery_utils.get_gallery()
+    gallery.build_from_db(logger=quiet)
+    _, inicio['modelo_llegadas_s'] = _timed(gallery_utils.get_arrival_model().load_from_db)
+    result['inicio'] = inicio
+
+    # Impresora simulada: la cola de impresión real con una función que no toca USB
+    printed = []
+    spooler = printer_utils.PrintSpooler(print_func=lambda *job: printed.append(job) or True,
+                                         status_callback=quiet)
+    spooler.start()
+    printer_utils._spooler = spooler
+
+    rng = random.Random(seed + 1)
+    ruts = [rut for rut in gallery.ruts()]
+    rng.shuffle(ruts)
+    operations = min(operations, len(ruts) // 2)
+    identify_ruts, clocking_ruts = ruts[:operations], ruts[operations:2 * operations]
+
+    # 2. Identificación 1:N de punta a punta (galería por etapas, marcación y ticket en cola)
+    context = BenchContext(compare_cost_s)
+    session = FingerprintDeviceSession(context)
+    latencies, touches = [], 0
+    start = time.perf_counter()
+    for rut in identify_ruts:
+        context.device.finger = rut
+        t0 = time.perf_counter()
+        for _ in range(len(gallery_utils.STAGE_NAMES) + 1):
+            touches += 1
+            outcome = identify_and_clock(session)
+            if outcome.evento != 'no_reconocido':
+                break
+        if outcome.evento != 'marcado':
+            raise RuntimeError(f"Identificación de {rut} terminó en '{outcome.evento}': {outcome.mensaje}")
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    result['identificacion'] = {
+        'operaciones': len(identify_ruts), 'toques': touches,
+        'comparaciones': context.device.comparisons,
+        'por_segundo': round(len(identify_ruts) / elapsed, 1),
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(_percentile(latencies, 95) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+    }
+
+    # 3. Marcaciones directas (sin lector): capacidad de escritura de record_attendance
+    start = time.perf_counter()
+    for rut in clocking_ruts:
+        if db_utils.record_attendance(rut) is None:
+            raise RuntimeError(f"No se pudo registrar la marcación de {rut}")
+    elapsed = time.perf_counter() - start
+    result['marcacion'] = {'operaciones': len(clocking_ruts), 'por_segundo': round(len(clocking_ruts) / elapsed, 1)}
+
+    deadline = time.monotonic() + 10
+    while spooler.pending_count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    spooler.stop()
+    result['tickets_impresos'] = len(printed)
+
+    # 4. Reporte mensual: el último mes con historial (mejor de 3)
+    with db_utils.db_connection() as conn:
+        last = conn.execute("SELECT MAX(fecha) FROM ASISTENCIAS WHERE fecha < ?",
+                            (date.today().replace(day=1).isoformat(),)).fetchone()[0]
+    if last:
+        month_date = datetime.strptime(last, '%Y-%m-%d')
+        runs = [_timed(db_utils.get_clockings_for_month, month_date.month, month_date.year) for _ in range(3)]
+        result['reporte_mensual'] = {'mes': month_date.strftime('%Y-%m'), 'filas': len(runs[0][0][1]),
+                                     'consulta_s': round(min(t for _, t in runs), 4)}
+
+        # Resumen por curso y por alumno del mismo mes, leído de las tablas agregadas
+        mes = month_date.strftime('%Y-%m')
+        def _monthly_summary():
+            return (db_utils.get_course_summary(f"{mes}-01", f"{mes}-31"),
+                    db_utils.get_student_summary(mes, mes))
+        runs = [_timed(_monthly_summary) for _ in range(3)]
+        result['reporte_mensual']['resumen_s'] = round(min(t for _, t in runs), 4)
+        result['reporte_mensual']['recalculo_resumen_s'] = round(_timed(db_utils.rebuild_attendance_summaries)[1], 3)
+
+        # Exportación a Excel en streaming: el mes anterior y el año completo de todo el colegio
+        import report_utils
+        if report_utils.OPENPYXL_AVAILABLE:
+            for section, month in (('reporte_mensual', month_date.month), ('reporte_anual', None)):
+                start_date, end_date, filename = report_utils.export_range(month_date.year, month)
+                filas, elapsed = _timed(report_utils.export_clockings_to_excel,
+                                        os.path.join(workdir, filename), start_date, end_date)
+                result.setdefault(section, {'ano': month_date.year})
+                result[section].update(excel_filas=filas, excel_s=round(elapsed, 3))
+
+    # 5. Promoción anual (al final: modifica cursos y elimina egresados)
+    promocion = {}
+    (_, promovidos, egresados), promocion['simulacion_s'] = _timed(db_utils.promote_students, dry_run=True)
+    _, promocion['promocion_s'] = _timed(db_utils.promote_students)
+    promocion.update(promovidos=promovidos, egresados=egresados)
+    result['promocion'] = promocion
+
+    db_utils.close_db_pool()
+    for section in ('inicio', 'promocion'):
+        result[section] = {k: round(v, 4) if isinstance(v, float) else v for k, v in result[section].items()}
+    result['generacion_s'] = round(result['generacion_s'], 2)
+    return result
+
+
+# --- EJECUCIÓN Y COMPARACIÓN ---
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def compare_results(current, previous, tolerance):
+    """Compara con una ejecución anterior. Retorna la lista de regresiones mayores a 'tolerance'."""
+    before = {r['alumnos']: r for r in previous.get('resultados', [])}
+    regressions = []
+    for result in current['resultados']:
+        old = before.get(result['alumnos'])
+        if old is None:
+            continue
+        for section, key, higher_is_better in TRACKED_METRICS:
+            new_value = result.get(section, {}).get(key)
+            old_value = old.get(section, {}).get(key)
+            if not new_value or not old_value:
+                continue
+            change = (old_value / new_value - 1) if higher_is_better else (new_value / old_value - 1)
+            marker = "REGRESIÓN" if change > tolerance else "ok"
+            print(f"  {result['alumnos']:>6} alumnos  {section + '.' + key:<34} {old_value:>10} -> {new_value:>10}  [{marker}]")
+            if change > tolerance:
+                regressions.append((result['alumnos'], f"{section}.{key}", old_value, new_value))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del marcador de asistencia con lector e impresora simulados.")
+    parser.add_argument('--alumnos', type=int, nargs='+', default=list(DEFAULT_SIZES), help="Tamaños a medir")
+    parser.add_argument('--anos', type=float, default=1.0, help="Años de historial de ASISTENCIAS")
+    parser.add_argument('--operaciones', type=int, default=500, help="Identificaciones y marcaciones por tamaño")
+    parser.add_argument('--bytes-plantilla', type=int, default=2048, help="Tamaño de cada plantilla simulada")
+    parser.add_argument('--costo-comparacion-us', type=float, default=0.0,
+                        help="Costo simulado de cada comparación del lector (microsegundos)")
+    parser.add_argument('--semilla', type=int, default=1234)
+    parser.add_argument('--directorio', help="Dónde crear las BD (por defecto, un directorio temporal)")
+    parser.add_argument('--salida', default='bench_results.json', help="Archivo JSON con los resultados")
+    parser.add_argument('--comparar', help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="Empeoramiento tolerado al comparar (0.2 = 20%%)")
+    parser.add_argument('--un-tamano', type=int, help=argparse.SUPPRESS)  # Uso interno: proceso hijo
+    args = parser.parse_args(argv)
+
+    if args.un_tamano:
+        result = run_size(args.un_tamano, args.anos, args.bytes_plantilla, args.operaciones,
+                          args.costo_comparacion_us / 1e6, args.directorio, args.semilla)
+        # Última línea de stdout: el resultado para el proceso padre
+        print(json.dumps(result))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workdir = args.directorio or tmp_dir
+        os.makedirs(workdir, exist_ok=True)
+        results = []
+        for students in args.alumnos:
+            print(f"Midiendo {students} alumnos ({args.anos:g} años de historial)...")
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--un-tamano', str(students), '--anos', str(args.anos),
+                 '--operaciones', str(args.operaciones), '--bytes-plantilla', str(args.bytes_plantilla),
+                 '--costo-comparacion-us', str(args.costo_comparacion_us), '--semilla', str(args.semilla),
+                 '--directorio', workdir],
+                capture_output=True, text=True)
+            if child.returncode != 0:
+                print(child.stdout[-2000:], child.stderr[-4000:], sep='\n')
+                print(f"ERROR: La medición de {students} alumnos falló.")
+                return 1
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"  inicio {result['inicio']['galeria_bd_s']:.2f} s (instantánea {result['inicio']['galeria_instantanea_s']:.2f} s), "
+                  f"{result['identificacion']['por_segundo']} identificaciones/s, "
+                  f"{result['marcacion']['por_segundo']} marcaciones/s, "
+                  f"promoción {result['promocion']['promocion_s']:.3f} s")
+
+    report = {
+        'formato': BENCH_FORMAT_VERSION,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': {k: v for k, v in vars(args).items() if k not in ('un_tamano', 'salida', 'comparar', 'directorio')},
+        'resultados': results,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            previous = json.load(f)
+        print(f"Comparación con {args.comparar} (commit {previous.get('commit')}):")
+        regressions = compare_results(report, previous, args.tolerancia)
+        if regressions:
+            print(f"{len(regressions)} métricas empeoraron más de {args.tolerancia:.0%}.")
+            return 2
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
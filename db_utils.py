@@ -1,12 +1,272 @@
 # db_utils.py (FINAL: Schema y Funciones)
 import sqlite3
+import base64
+import binascii
+import configparser
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from typing import NamedTuple, Optional
 
 DB_NAME = "fingerprints.db"
 
+# Versión del esquema (PRAGMA user_version). Cada migración lleva la BD a su número.
+SCHEMA_VERSION = 3
+
+# --- NOTIFICACIÓN DE CAMBIOS EN ALUMNOS ---
+# Permite que otros módulos (p.ej. la galería de plantillas en memoria) se mantengan
+# sincronizados sin que db_utils dependa de ellos. Cada callback recibe (accion, rut, datos);
+# acciones: 'guardar', 'actualizar', 'eliminar' y 'marcar' (nueva asistencia registrada).
+_alumnos_listeners = []
+
+def register_alumnos_listener(callback):
+    """Registra un callback que se invoca después de cada cambio confirmado en ALUMNOS."""
+    if callback not in _alumnos_listeners:
+        _alumnos_listeners.append(callback)
+
+def _notify_alumnos_change(accion, rut, **datos):
+    """Avisa a los listeners registrados. Un error en un listener nunca afecta a la BD."""
+    for callback in list(_alumnos_listeners):
+        try:
+            callback(accion, rut, datos)
+        except Exception as e:
+            print(f"DB: Error al notificar cambio de alumno ({accion}, {rut}): {e}")
+
+# --- CAPA DE CONEXIONES ---
+# El esquema se crea/migra una sola vez por proceso (init_db) y las funciones de este
+# módulo piden prestada una conexión de un pool pequeño en lugar de abrir una nueva.
+POOL_SIZE = 4
+
+# Valores por defecto de la sección [Database] de config.ini
+DEFAULT_DB_SETTINGS = {
+    'journal_mode': 'WAL',       # Lectores (reportes) y escritor (marcaciones) no se bloquean
+    'synchronous': 'NORMAL',     # Seguro con WAL y bastante más rápido que FULL
+    'busy_timeout': 5000,        # ms de espera ante un bloqueo antes de fallar
+    'mmap_size': 268435456,      # 256 MB mapeados en memoria para lecturas
+    'cache_size': -16000,        # Negativo = KiB (≈16 MB de caché de páginas)
+}
+_VALID_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+_VALID_SYNCHRONOUS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+def _load_db_settings():
+    """
+    Lee la sección [Database] de config.ini. Cualquier valor ausente o inválido
+    se reemplaza por el valor por defecto.
+    """
+    settings = dict(DEFAULT_DB_SETTINGS)
+    config = configparser.ConfigParser()
+    try:
+        config.read('config.ini')
+        journal_mode = config.get('Database', 'journal_mode', fallback=settings['journal_mode']).strip().upper()
+        if journal_mode in _VALID_JOURNAL_MODES:
+            settings['journal_mode'] = journal_mode
+        else:
+            print(f"ADVERTENCIA: journal_mode '{journal_mode}' no válido. Usando {settings['journal_mode']}.")
+        synchronous = config.get('Database', 'synchronous', fallback=settings['synchronous']).strip().upper()
+        if synchronous in _VALID_SYNCHRONOUS:
+            settings['synchronous'] = synchronous
+        else:
+            print(f"ADVERTENCIA: synchronous '{synchronous}' no válido. Usando {settings['synchronous']}.")
+        for key in ('busy_timeout', 'mmap_size', 'cache_size'):
+            try:
+                settings[key] = config.getint('Database', key, fallback=settings[key])
+            except ValueError:
+                print(f"ADVERTENCIA: El valor de '{key}' en config.ini no es un entero. Usando {settings[key]}.")
+    except configparser.Error as e:
+        print(f"ADVERTENCIA: No se pudo leer la sección [Database] de config.ini: {e}")
+    return settings
+
+def _configure_connection(conn, settings):
+    """Aplica a una conexión los PRAGMA de rendimiento/concurrencia configurados."""
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])}")
+    conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+    return conn
+
+_schema_lock = threading.Lock()
+_schema_ready_for = None  # DB_NAME para el que ya se aplicó el esquema
+_pool = None
+_pool_lock = threading.Lock()
+
+class _ConnectionPool:
+    """
+    Pool de conexiones SQLite de larga vida. Cada conexión la usa un solo hilo a la vez
+    (se presta y se devuelve), por lo que puede compartirse entre los hilos de la GUI.
+    """
+
+    def __init__(self, db_name, size, settings):
+        self.db_name = db_name
+        self.settings = settings
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False)
+            return _configure_connection(conn, self.settings)
+
+    def release(self, conn):
+        try:
+            # Nunca devolver al pool una transacción a medio terminar
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+def init_db():
+    """Crea las tablas y aplica las migraciones pendientes. Solo trabaja la primera vez por archivo de BD."""
+    global _schema_ready_for
+    with _schema_lock:
+        if _schema_ready_for == DB_NAME:
+            return
+        conn = _configure_connection(sqlite3.connect(DB_NAME), _load_db_settings())
+        try:
+            _create_schema(conn)
+        finally:
+            conn.close()
+        _schema_ready_for = DB_NAME
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.db_name != DB_NAME:
+            # Primer uso (o cambio de archivo de BD, p.ej. en pruebas)
+            if _pool is not None:
+                _pool.close_all()
+            init_db()
+            _pool = _ConnectionPool(DB_NAME, POOL_SIZE, _load_db_settings())
+        return _pool
+
+def acquire_connection():
+    """Presta una conexión del pool. Debe devolverse con release_connection()."""
+    return _get_pool().acquire()
+
+def release_connection(conn):
+    """Devuelve al pool una conexión prestada con acquire_connection()."""
+    _get_pool().release(conn)
+
+@contextmanager
+def db_connection():
+    """Context manager que presta una conexión del pool y la devuelve al salir."""
+    conn = acquire_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+def close_db_pool():
+    """Cierra las conexiones en reposo del pool (al salir de la aplicación)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
 def connect_db():
-    """Establece la conexión a la base de datos SQLite y asegura que ambas tablas existan."""
-    conn = sqlite3.connect(DB_NAME)
+    """
+    Retorna una conexión nueva e independiente (quien la pide debe cerrarla).
+    El esquema se asegura una sola vez por proceso; para el uso interno se prefiere el pool.
+    """
+    init_db()
+    return _configure_connection(sqlite3.connect(DB_NAME), _load_db_settings())
+
+# Triggers que registran cambios en los datos que guarda la instantánea de la galería
+_GALLERY_TRIGGERS = {
+    'trg_galeria_plantilla_insert': ('PLANTILLAS', 'INSERT'),
+    'trg_galeria_plantilla_update': ('PLANTILLAS', 'UPDATE'),
+    'trg_galeria_plantilla_delete': ('PLANTILLAS', 'DELETE'),
+    'trg_galeria_alumno_update': ('ALUMNOS', 'UPDATE OF rut, curso, hora_max_tardanza'),
+}
+
+# Estados que cuenta cada columna de los resúmenes ('atraso' es el nombre antiguo de 'tardanza')
+_SUMMARY_STATES = {
+    'presentes': "'presente'",
+    'tardanzas': "'tardanza', 'atraso'",
+    'ausentes': "'ausente'",
+}
+
+def _summary_course_sql(row):
+    """Curso con que se resume una marcación: el guardado al marcar o, si falta, el actual del alumno."""
+    return f"COALESCE({row}.curso, (SELECT curso FROM ALUMNOS WHERE id_alumno = {row}.id_alumno), '')"
+
+def _summary_apply_sql(row, sign):
+    """Sentencias que suman (sign '+') o restan (sign '-') la marcación 'row' (NEW/OLD) a ambos resúmenes."""
+    counts = [f"{sign}COALESCE({row}.estado IN ({states}), 0)" for states in _SUMMARY_STATES.values()]
+    columns = list(_SUMMARY_STATES) + ['total']
+    values = ", ".join(counts + [f"{sign}1"])
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in columns)
+    sql = f"""
+        INSERT INTO RESUMEN_ALUMNO_MES (mes, id_alumno, {', '.join(columns)})
+        VALUES (substr({row}.fecha, 1, 7), {row}.id_alumno, {values})
+        ON CONFLICT(mes, id_alumno) DO UPDATE SET {updates};
+        INSERT INTO RESUMEN_CURSO_DIA (fecha, curso, {', '.join(columns)})
+        VALUES ({row}.fecha, {_summary_course_sql(row)}, {values})
+        ON CONFLICT(fecha, curso) DO UPDATE SET {updates};
+    """
+    if sign == '-':
+        # Un resumen que queda en cero se elimina (p.ej. egresados)
+        sql += f"""
+        DELETE FROM RESUMEN_ALUMNO_MES
+        WHERE mes = substr({row}.fecha, 1, 7) AND id_alumno = {row}.id_alumno AND total <= 0;
+        DELETE FROM RESUMEN_CURSO_DIA
+        WHERE fecha = {row}.fecha AND curso = {_summary_course_sql(row)} AND total <= 0;
+        """
+    return sql
+
+def _ensure_summary_triggers(conn):
+    """Crea los triggers que mantienen RESUMEN_ALUMNO_MES y RESUMEN_CURSO_DIA al día."""
+    skip_bulk = "WHEN (SELECT valor FROM META WHERE clave = 'resumen_en_lote') IS NOT 1"
+    triggers = {
+        # Una marcación sin curso (inserción externa) guarda el curso actual del alumno
+        # (después de sumarla: el trigger de UPDATE la resta y la vuelve a sumar en el mismo curso)
+        'trg_resumen_insert': ("AFTER INSERT", _summary_apply_sql('NEW', '+') + f"""
+            UPDATE ASISTENCIAS SET curso = {_summary_course_sql('NEW')}
+            WHERE NEW.curso IS NULL AND rowid = NEW.rowid;
+        """),
+        'trg_resumen_delete': ("AFTER DELETE", _summary_apply_sql('OLD', '-')),
+        'trg_resumen_update': ("AFTER UPDATE OF id_alumno, fecha, estado, curso",
+                               _summary_apply_sql('OLD', '-') + _summary_apply_sql('NEW', '+')),
+    }
+    for name, (event, body) in triggers.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} ON ASISTENCIAS {skip_bulk} BEGIN {body} END")
+    conn.commit()
+
+def _rebuild_summaries(cursor):
+    """Recalcula ambos resúmenes desde ASISTENCIAS con dos consultas agrupadas."""
+    columns = list(_SUMMARY_STATES) + ['total']
+    sums = ", ".join(f"SUM(COALESCE(S.estado IN ({states}), 0))" for states in _SUMMARY_STATES.values())
+    cursor.execute("DELETE FROM RESUMEN_ALUMNO_MES")
+    cursor.execute("DELETE FROM RESUMEN_CURSO_DIA")
+    cursor.execute(f"""
+        INSERT INTO RESUMEN_ALUMNO_MES (mes, id_alumno, {', '.join(columns)})
+        SELECT substr(S.fecha, 1, 7), S.id_alumno, {sums}, COUNT(*)
+        FROM ASISTENCIAS S
+        GROUP BY substr(S.fecha, 1, 7), S.id_alumno
+    """)
+    student_rows = cursor.rowcount
+    cursor.execute(f"""
+        INSERT INTO RESUMEN_CURSO_DIA (fecha, curso, {', '.join(columns)})
+        SELECT S.fecha, COALESCE(S.curso, A.curso, ''), {sums}, COUNT(*)
+        FROM ASISTENCIAS S
+        LEFT JOIN ALUMNOS A ON A.id_alumno = S.id_alumno
+        GROUP BY S.fecha, COALESCE(S.curso, A.curso, '')
+    """)
+    return student_rows, cursor.rowcount
+
+def _create_schema(conn):
+    """Asegura que todas las tablas existan y aplica las migraciones de esquema."""
     cursor = conn.cursor()
     
     # 1. Tabla ALUMNOS (Estructura final con 4 nombres/apellidos)
@@ -18,7 +278,7 @@ def connect_db():
             apellido_paterno TEXT NOT NULL,
             apellido_materno TEXT NOT NULL,
             rut TEXT UNIQUE NOT NULL,    
-            huella_plantilla TEXT,
+            huella_plantilla TEXT,       -- OBSOLETO: las plantillas viven en PLANTILLAS (BLOB)
             curso TEXT DEFAULT '1ro Medio',
             hora_max_tardanza TEXT DEFAULT '08:15:00',
             max_inasistencias INTEGER DEFAULT 3,
@@ -48,18 +308,219 @@ def connect_db():
             estado TEXT,      -- 'presente' / 'tardanza' / 'ausente'
             notificado BOOLEAN DEFAULT 0,
             observaciones TEXT,
+            curso TEXT,       -- Curso del alumno al marcar (los resúmenes por curso no cambian con la promoción)
             
             FOREIGN KEY (id_alumno) REFERENCES ALUMNOS(id_alumno),
             UNIQUE (id_alumno, fecha)
         )
     """)
     
+    # 3. Tabla PLANTILLAS (Huella serializada en binario, una por alumno)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS PLANTILLAS (
+            id_alumno INTEGER PRIMARY KEY,
+            plantilla BLOB NOT NULL,
+            
+            FOREIGN KEY (id_alumno) REFERENCES ALUMNOS(id_alumno)
+        )
+    """)
+    
+    # 4. Tabla PROGRESION_CURSOS (Promoción anual: curso_siguiente NULL = egresa)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS PROGRESION_CURSOS (
+            curso_actual TEXT PRIMARY KEY,
+            curso_siguiente TEXT
+        )
+    """)
+    
+    # 5. META (valores internos) y CAMBIOS_GALERIA (qué alumnos cambiaron y en qué revisión).
+    #    Los triggers mantienen un contador de revisión para validar la instantánea de la galería
+    #    y reconstruirla solo con las filas modificadas.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS META (
+            clave TEXT PRIMARY KEY,
+            valor
+        )
+    """)
+    # Contador de revisión y un identificador de esta BD (una instantánea creada con otra BD
+    # nunca se considera válida). Se inician antes de crear los triggers que los usan.
+    cursor.execute("INSERT OR IGNORE INTO META (clave, valor) VALUES ('revision_galeria', 0)")
+    cursor.execute("INSERT OR IGNORE INTO META (clave, valor) VALUES ('instancia', lower(hex(randomblob(16))))")
+    # 1 mientras una operación masiva ajusta los resúmenes por conjuntos (ver promote_students)
+    cursor.execute("INSERT OR IGNORE INTO META (clave, valor) VALUES ('resumen_en_lote', 0)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS CAMBIOS_GALERIA (
+            id_alumno INTEGER PRIMARY KEY,
+            revision INTEGER NOT NULL
+        )
+    """)
+    for name, (table, event) in _GALLERY_TRIGGERS.items():
+        row_id = "OLD.id_alumno" if event == "DELETE" else "NEW.id_alumno"
+        condition = ""
+        if table == "ALUMNOS":
+            # Solo interesan los alumnos con huella (la instantánea guarda curso y hora máxima)
+            condition = "WHEN EXISTS (SELECT 1 FROM PLANTILLAS WHERE id_alumno = NEW.id_alumno)"
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} {condition}
+            BEGIN
+                UPDATE META SET valor = valor + 1 WHERE clave = 'revision_galeria';
+                INSERT OR REPLACE INTO CAMBIOS_GALERIA (id_alumno, revision)
+                VALUES ({row_id}, (SELECT valor FROM META WHERE clave = 'revision_galeria'));
+            END
+        """)
+    
+    # 6. Resúmenes de asistencia por alumno y mes, y por curso y día. Los mantienen los
+    #    triggers de ASISTENCIAS dentro de la misma transacción de cada marcación.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS RESUMEN_ALUMNO_MES (
+            mes TEXT NOT NULL,            -- 'YYYY-MM'
+            id_alumno INTEGER NOT NULL,
+            presentes INTEGER NOT NULL DEFAULT 0,
+            tardanzas INTEGER NOT NULL DEFAULT 0,
+            ausentes INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (mes, id_alumno)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS RESUMEN_CURSO_DIA (
+            fecha DATE NOT NULL,
+            curso TEXT NOT NULL,
+            presentes INTEGER NOT NULL DEFAULT 0,
+            tardanzas INTEGER NOT NULL DEFAULT 0,
+            ausentes INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, curso)
+        )
+    """)
+    
     conn.commit()
-    return conn
+    _migrate_schema(conn)
+    # Después de las migraciones: la versión 3 agrega ASISTENCIAS.curso, que usan los triggers
+    _ensure_summary_triggers(conn)
+    _ensure_indexes(conn)
+
+# Índices administrados para los reportes. Se crean al iniciar y se eliminan los
+# índices 'idx_*' que ya no aparezcan en esta lista.
+MANAGED_INDEXES = {
+    # (fecha, hora_entrada) sirve los filtros por fecha y entrega la exportación ya ordenada
+    'idx_asistencias_fecha_hora': 'ASISTENCIAS (fecha, hora_entrada)',
+    'idx_asistencias_fecha_estado': 'ASISTENCIAS (fecha, estado)',
+    # Directorio de alumnos ordenado por curso o por nombre sin ordenar 50k filas en cada página
+    'idx_alumnos_curso_nombre': 'ALUMNOS (curso, apellido_paterno, apellido_materno, primer_nombre)',
+    'idx_alumnos_apellidos': 'ALUMNOS (apellido_paterno, apellido_materno, primer_nombre)',
+}
+
+def _ensure_indexes(conn):
+    """Sincroniza los índices de la BD con MANAGED_INDEXES."""
+    existing = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'"
+    )}
+    for name in existing - set(MANAGED_INDEXES):
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+        print(f"DB: Índice obsoleto '{name}' eliminado.")
+    for name, definition in MANAGED_INDEXES.items():
+        if name not in existing:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+            print(f"DB: Índice '{name}' creado.")
+    conn.commit()
+
+def _b64_to_blob(template_b64):
+    """Función SQL usada por la migración: decodifica base64 o retorna NULL si no es válido."""
+    try:
+        return base64.b64decode(template_b64, validate=True)
+    except (binascii.Error, TypeError, ValueError):
+        return None
+
+def _migrate_templates_to_blob(cursor):
+    """
+    Versión 1: mueve ALUMNOS.huella_plantilla (TEXT base64) a PLANTILLAS.plantilla (BLOB).
+    La conversión se hace en una sola pasada dentro de SQLite, sin cargar la tabla en memoria.
+    Las plantillas que no son base64 válido se dejan intactas en la columna antigua.
+    """
+    cursor.execute("""
+        INSERT OR REPLACE INTO PLANTILLAS (id_alumno, plantilla)
+        SELECT id_alumno, plantilla FROM (
+            SELECT id_alumno, _b64_to_blob(huella_plantilla) AS plantilla
+            FROM ALUMNOS
+            WHERE huella_plantilla IS NOT NULL
+        )
+        WHERE plantilla IS NOT NULL
+    """)
+    migrated = cursor.rowcount
+    cursor.execute("""
+        UPDATE ALUMNOS SET huella_plantilla = NULL
+        WHERE huella_plantilla IS NOT NULL
+        AND id_alumno IN (SELECT id_alumno FROM PLANTILLAS)
+    """)
+    print(f"DB: {migrated} plantillas convertidas de base64 a BLOB.")
+
+# Progresión por defecto de los cursos (None = egresa y se elimina)
+DEFAULT_COURSE_PROGRESSION = {
+    '1ro Medio': '2do Medio',
+    '2do Medio': '3ro Medio',
+    '3ro Medio': '4to Medio',
+    '4to Medio': None,
+}
+
+def _seed_course_progression(cursor):
+    """Versión 2: carga en PROGRESION_CURSOS el mapa de promoción que antes estaba fijo en el código."""
+    cursor.executemany(
+        "INSERT OR IGNORE INTO PROGRESION_CURSOS (curso_actual, curso_siguiente) VALUES (?, ?)",
+        DEFAULT_COURSE_PROGRESSION.items()
+    )
+
+def _add_attendance_summaries(cursor):
+    """
+    Versión 3: guarda el curso en cada marcación (las antiguas toman el curso actual del
+    alumno, el mejor dato disponible) y calcula los resúmenes por primera vez.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(ASISTENCIAS)")}
+    if 'curso' not in columns:
+        cursor.execute("ALTER TABLE ASISTENCIAS ADD COLUMN curso TEXT")
+    cursor.execute("""
+        UPDATE ASISTENCIAS
+        SET curso = (SELECT curso FROM ALUMNOS A WHERE A.id_alumno = ASISTENCIAS.id_alumno)
+        WHERE curso IS NULL
+    """)
+    student_rows, course_rows = _rebuild_summaries(cursor)
+    print(f"DB: Resúmenes de asistencia calculados ({student_rows} alumno-mes, {course_rows} curso-día).")
+
+# Migraciones versionadas: (versión destino, función que recibe el cursor)
+_MIGRATIONS = [
+    (1, _migrate_templates_to_blob),
+    (2, _seed_course_progression),
+    (3, _add_attendance_summaries),
+]
+
+def _migrate_schema(conn):
+    """Aplica en orden las migraciones pendientes según PRAGMA user_version."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    conn.create_function("_b64_to_blob", 1, _b64_to_blob, deterministic=True)
+    cursor = conn.cursor()
+    try:
+        for target_version, migration in _MIGRATIONS:
+            if version < target_version:
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {target_version}")
+                version = target_version
+                print(f"DB: Esquema migrado a la versión {target_version}.")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def _as_template_bytes(huella):
+    """Acepta la plantilla como bytes (formato actual) o como texto base64 (formato antiguo)."""
+    if huella is None or isinstance(huella, (bytes, bytearray, memoryview)):
+        return huella
+    return base64.b64decode(huella)
 
 def get_alumno_full_name(rut: str) -> str:
     """Recupera el nombre completo del alumno dado su RUT."""
-    conn = connect_db()
+    conn = acquire_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("""
@@ -68,7 +529,7 @@ def get_alumno_full_name(rut: str) -> str:
             WHERE rut = ?
         """, (rut,))
         result = cursor.fetchone()
-        conn.close()
+        release_connection(conn)
         
         if result:
             # Junta el primer nombre y el apellido paterno
@@ -76,7 +537,7 @@ def get_alumno_full_name(rut: str) -> str:
         return "Alumno Desconocido"
     except Exception as e:
         print(f"DB Error al buscar nombre: {e}")
-        conn.close()
+        release_connection(conn)
         return "Error de Consulta"
 
 def save_template(pn, sn, ap, am, rut, huella, hora_max, atrasos_max_w, curso="1ro Medio"):
@@ -84,10 +545,12 @@ def save_template(pn, sn, ap, am, rut, huella, hora_max, atrasos_max_w, curso="1
     Guarda o actualiza (ON CONFLICT) la información completa de un alumno y su huella.
     Acepta los 9 parámetros de la nueva estructura.
     """
-    conn = connect_db()
+    conn = acquire_connection()
     cursor = conn.cursor()
     try:
-        data = (pn, sn, ap, am, rut, huella, hora_max, atrasos_max_w, curso)
+        # La huella se guarda tal cual (bytes) en PLANTILLAS, sin codificar.
+        huella = _as_template_bytes(huella)
+        data = (pn, sn, ap, am, rut, hora_max, atrasos_max_w, curso)
         
         cursor.execute("""
             INSERT INTO ALUMNOS (
@@ -96,25 +559,30 @@ def save_template(pn, sn, ap, am, rut, huella, hora_max, atrasos_max_w, curso="1
                 apellido_paterno,
                 apellido_materno,
                 rut,
-                huella_plantilla,
                 hora_max_tardanza,
                 max_atrasos_warning,
                 curso,
                 num_atrasos
             ) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
             ON CONFLICT(rut) DO UPDATE SET 
                 primer_nombre=excluded.primer_nombre, 
                 segundo_nombre=excluded.segundo_nombre, 
                 apellido_paterno=excluded.apellido_paterno,
                 apellido_materno=excluded.apellido_materno,
-                huella_plantilla=excluded.huella_plantilla,
                 hora_max_tardanza=excluded.hora_max_tardanza,
                 max_atrasos_warning=excluded.max_atrasos_warning,
                 curso=excluded.curso,
                 num_atrasos=0
         """, data)
         
+        if huella is not None:
+            cursor.execute("""
+                INSERT INTO PLANTILLAS (id_alumno, plantilla)
+                SELECT id_alumno, ? FROM ALUMNOS WHERE rut = ?
+                ON CONFLICT(id_alumno) DO UPDATE SET plantilla=excluded.plantilla
+            """, (huella, rut))
+        
         # NUEVO: Para que el Excel coincida con el contador en 0, debemos "perdonar" los atrasos históricos.
         # Cambiamos el estado de 'tardanza' a 'presente' en la tabla ASISTENCIAS para este alumno.
         cursor.execute("""
@@ -126,35 +594,147 @@ def save_template(pn, sn, ap, am, rut, huella, hora_max, atrasos_max_w, curso="1
         
         conn.commit()
         print(f"DB: Alumno {rut} guardado/actualizado con éxito. Historial de atrasos limpiado.")
+        _notify_alumnos_change('guardar', rut, plantilla=huella, curso=curso, hora_max_tardanza=hora_max)
     except Exception as e:
         print(f"DB Error al guardar alumno: {e}")
     finally:
-        conn.close()
+        release_connection(conn)
 
 def get_all_templates():
     """Recupera los RUT (como claves de huella) y las plantillas para la identificación."""
-    conn = connect_db()
+    conn = acquire_connection()
     cursor = conn.cursor()
-    # Se selecciona 'rut' y 'huella_plantilla'
-    cursor.execute("SELECT rut, huella_plantilla FROM ALUMNOS")
+    # Se selecciona 'rut' y la plantilla binaria
+    cursor.execute("""
+        SELECT A.rut, P.plantilla
+        FROM PLANTILLAS P
+        JOIN ALUMNOS A ON A.id_alumno = P.id_alumno
+    """)
     results = cursor.fetchall()
-    conn.close()
+    release_connection(conn)
     
     return {rut: template for rut, template in results}
 
+def get_template_by_rut(rut):
+    """Recupera solo la plantilla (bytes) de un alumno por su RUT, o None si no tiene huella."""
+    conn = acquire_connection()
+    try:
+        # ALUMNOS.rut es UNIQUE (índice) y PLANTILLAS se busca por su clave primaria
+        row = conn.execute("""
+            SELECT P.plantilla
+            FROM ALUMNOS A
+            JOIN PLANTILLAS P ON P.id_alumno = A.id_alumno
+            WHERE A.rut = ?
+        """, (rut,)).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        print(f"DB Error al obtener la plantilla de {rut}: {e}")
+        return None
+    finally:
+        release_connection(conn)
+
+def get_templates_for_gallery():
+    """Recupera RUT, plantilla, curso y hora máxima de los alumnos con huella para la galería en memoria."""
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT A.rut, P.plantilla, A.curso, A.hora_max_tardanza
+        FROM PLANTILLAS P
+        JOIN ALUMNOS A ON A.id_alumno = P.id_alumno
+    """)
+    results = cursor.fetchall()
+    release_connection(conn)
+    return results
+
+def count_templates():
+    """Cantidad de plantillas almacenadas (para informar el avance de la carga)."""
+    conn = acquire_connection()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM PLANTILLAS").fetchone()[0]
+    finally:
+        release_connection(conn)
+
+def iter_templates_for_gallery(chunk_size=200):
+    """
+    Igual que get_templates_for_gallery(), pero entrega las filas en lotes de 'chunk_size'
+    a medida que se leen, sin cargar todas las plantillas en memoria a la vez.
+    """
+    conn = acquire_connection()
+    try:
+        cursor = conn.execute("""
+            SELECT A.rut, P.plantilla, A.curso, A.hora_max_tardanza
+            FROM PLANTILLAS P
+            JOIN ALUMNOS A ON A.id_alumno = P.id_alumno
+        """)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        release_connection(conn)
+
+def get_gallery_revision():
+    """Retorna (instancia, revisión) de los datos de la galería según los triggers de META."""
+    conn = acquire_connection()
+    try:
+        meta = dict(conn.execute("SELECT clave, valor FROM META WHERE clave IN ('instancia', 'revision_galeria')"))
+        return meta.get('instancia'), meta.get('revision_galeria', 0)
+    finally:
+        release_connection(conn)
+
+def get_gallery_changes(since_revision):
+    """
+    Alumnos cuya huella, RUT, curso u hora máxima cambió después de 'since_revision'.
+    Retorna (ids cambiados, filas actuales [(id_alumno, rut, plantilla, curso, hora_max_tardanza)]);
+    los ids sin fila actual corresponden a plantillas eliminadas.
+    """
+    conn = acquire_connection()
+    try:
+        changed = {row[0] for row in conn.execute(
+            "SELECT id_alumno FROM CAMBIOS_GALERIA WHERE revision > ?", (since_revision,))}
+        rows = conn.execute("""
+            SELECT A.id_alumno, A.rut, P.plantilla, A.curso, A.hora_max_tardanza
+            FROM CAMBIOS_GALERIA C
+            JOIN PLANTILLAS P ON P.id_alumno = C.id_alumno
+            JOIN ALUMNOS A ON A.id_alumno = C.id_alumno
+            WHERE C.revision > ?
+        """, (since_revision,))
+        # Un cambio entre ambas consultas se aplicará en la próxima actualización
+        return changed, [row for row in rows if row[0] in changed]
+    finally:
+        release_connection(conn)
+
+def iter_gallery_rows(chunk_size=200):
+    """Todas las filas de la galería con su id: lotes de [(id_alumno, rut, plantilla, curso, hora_max_tardanza)]."""
+    conn = acquire_connection()
+    try:
+        cursor = conn.execute("""
+            SELECT A.id_alumno, A.rut, P.plantilla, A.curso, A.hora_max_tardanza
+            FROM PLANTILLAS P
+            JOIN ALUMNOS A ON A.id_alumno = P.id_alumno
+        """)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        release_connection(conn)
+
 def get_registered_users():
     """Retorna una lista de RUT de alumnos registrados."""
-    conn = connect_db()
+    conn = acquire_connection()
     cursor = conn.cursor()
     # Se selecciona 'rut'
     cursor.execute("SELECT rut FROM ALUMNOS")
     results = cursor.fetchall()
-    conn.close()
+    release_connection(conn)
     return [row[0] for row in results]
 
 def get_all_alumnos_details():
     """Recupera todos los detalles de los alumnos para la vista de administración (listado)."""
-    conn = connect_db()
+    conn = acquire_connection()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT 
@@ -164,103 +744,481 @@ def get_all_alumnos_details():
     """)
     columns = [desc[0] for desc in cursor.description]
     results = cursor.fetchall()
-    conn.close()
+    release_connection(conn)
     return columns, results
 
+# Directorio de alumnos paginado: orden permitido (con id_alumno como desempate) y columnas
+# en que se busca cada palabra del texto de búsqueda.
+STUDENTS_PAGE_COLUMNS = ('rut', 'nombre', 'curso', 'hora_max_tardanza')
+STUDENTS_SORT_SQL = {
+    'rut': ('rut',),
+    'nombre': ('apellido_paterno', 'apellido_materno', 'primer_nombre'),
+    'curso': ('curso', 'apellido_paterno', 'apellido_materno', 'primer_nombre'),
+    'hora_max_tardanza': ('hora_max_tardanza',),
+}
+_STUDENTS_SEARCH_COLUMNS = ('primer_nombre', 'segundo_nombre', 'apellido_paterno', 'apellido_materno', 'rut', 'curso')
+
+def _students_page_query(select, texto=None, curso=None, order_by=None, descending=False):
+    """Arma (sql, parámetros) del directorio: cada palabra de 'texto' debe aparecer en alguna columna."""
+    conditions, params = [], []
+    for word in (texto or '').split():
+        pattern = '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conditions.append("(" + " OR ".join(f"{c} LIKE ? ESCAPE '\\'" for c in _STUDENTS_SEARCH_COLUMNS) + ")")
+        params.extend([pattern] * len(_STUDENTS_SEARCH_COLUMNS))
+    if curso:
+        conditions.append("curso = ?")
+        params.append(curso)
+    sql = f"SELECT {select} FROM ALUMNOS"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if order_by is not None:
+        direction = " DESC" if descending else ""
+        terms = STUDENTS_SORT_SQL[order_by] + ('id_alumno',)
+        sql += f" ORDER BY {', '.join(term + direction for term in terms)} LIMIT ? OFFSET ?"
+    return sql, params
+
+def count_alumnos(texto=None, curso=None):
+    """Cantidad de alumnos que coinciden con la búsqueda (ver get_alumnos_page)."""
+    sql, params = _students_page_query("COUNT(*)", texto, curso)
+    conn = acquire_connection()
+    try:
+        return conn.execute(sql, params).fetchone()[0]
+    finally:
+        release_connection(conn)
+
+def get_alumnos_page(offset, limit, order_by='curso', descending=False, texto=None, curso=None):
+    """
+    Una página del directorio de alumnos. 'texto' se separa en palabras y cada una debe
+    aparecer (sin distinguir mayúsculas) en el nombre, apellidos, RUT o curso; 'curso'
+    filtra por curso exacto. 'order_by' es una de STUDENTS_PAGE_COLUMNS.
+    Cada fila: (rut, nombre, curso, hora_max_tardanza).
+    """
+    if order_by not in STUDENTS_SORT_SQL:
+        order_by = 'curso'
+    select = """
+        rut,
+        primer_nombre || COALESCE(' ' || NULLIF(segundo_nombre, ''), '') || ' ' || apellido_paterno
+            || COALESCE(' ' || NULLIF(apellido_materno, ''), '') AS nombre,
+        curso,
+        hora_max_tardanza
+    """
+    sql, params = _students_page_query(select, texto, curso, order_by=order_by, descending=descending)
+    conn = acquire_connection()
+    try:
+        return conn.execute(sql, params + [limit, offset]).fetchall()
+    finally:
+        release_connection(conn)
+
+def get_course_names():
+    """Cursos con al menos un alumno, ordenados (para los filtros de la GUI)."""
+    conn = acquire_connection()
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT DISTINCT curso FROM ALUMNOS WHERE curso IS NOT NULL ORDER BY curso")]
+    finally:
+        release_connection(conn)
+
+
+# --- CONSULTAS DE REPORTES ---
+# Se definen como constantes para que check_reporting_query_plans() revise exactamente
+# el mismo SQL que ejecutan los reportes.
+CLOCKINGS_FOR_MONTH_SQL = """
+    SELECT 
+        A.rut, 
+        A.primer_nombre || ' ' || A.apellido_paterno AS Nombre_Completo,
+        S.fecha,
+        S.hora_entrada,
+        S.estado
+    FROM ASISTENCIAS S
+    JOIN ALUMNOS A ON S.id_alumno = A.id_alumno
+    WHERE S.fecha BETWEEN ? AND date(?, '+1 month', '-1 day') 
+    ORDER BY A.apellido_paterno, S.fecha
+"""
+
+# Llegadas por alumno y franja horaria (minutos desde medianoche // tamaño de franja)
+ARRIVAL_HISTORY_SQL = """
+    SELECT
+        A.rut,
+        (CAST(substr(S.hora_entrada, 1, 2) AS INTEGER) * 60 + CAST(substr(S.hora_entrada, 4, 2) AS INTEGER)) / ? AS franja,
+        COUNT(*)
+    FROM ASISTENCIAS S
+    JOIN ALUMNOS A ON S.id_alumno = A.id_alumno
+    WHERE S.fecha >= ? AND S.hora_entrada IS NOT NULL
+    GROUP BY A.rut, franja
+"""
+
+CLOCKED_ON_DATE_SQL = """
+    SELECT A.rut
+    FROM ASISTENCIAS S
+    JOIN ALUMNOS A ON S.id_alumno = A.id_alumno
+    WHERE S.fecha = ?
+"""
+
+# Exportación a Excel: orden cronológico resuelto por idx_asistencias_fecha_hora (sin ordenar en memoria)
+CLOCKINGS_EXPORT_SQL = """
+    SELECT
+        A.rut,
+        A.primer_nombre || ' ' || A.apellido_paterno AS Nombre_Completo,
+        S.fecha,
+        S.hora_entrada,
+        S.estado
+    FROM ASISTENCIAS S
+    JOIN ALUMNOS A ON S.id_alumno = A.id_alumno
+    WHERE S.fecha BETWEEN ? AND ?
+    ORDER BY S.fecha, S.hora_entrada
+"""
+
+# Tabla de marcaciones paginada: columnas por las que se puede ordenar (siempre con la
+# fila como desempate, para que las páginas no se solapen) y filtros opcionales.
+CLOCKINGS_PAGE_COLUMNS = ('rut', 'Nombre_Completo', 'curso', 'fecha', 'hora_entrada', 'estado')
+CLOCKINGS_SORT_SQL = {
+    'rut': ('A.rut',),
+    'Nombre_Completo': ('A.primer_nombre', 'A.apellido_paterno'),
+    'curso': ('S.curso',),
+    'fecha': ('S.fecha', 'S.hora_entrada'),
+    'hora_entrada': ('S.hora_entrada',),
+    'estado': ('S.estado',),
+}
+# Estados equivalentes al filtrar ('atraso' es el nombre antiguo de 'tardanza')
+CLOCKINGS_STATE_FILTERS = {
+    'presente': ('presente',),
+    'tardanza': ('tardanza', 'atraso'),
+    'ausente': ('ausente',),
+}
+
+def _clockings_page_query(select, start_date, end_date, curso=None, estado=None, rut=None,
+                          order_by=None, descending=False):
+    """Arma (sql, parámetros) de la tabla de marcaciones con los filtros y el orden pedidos."""
+    conditions = ["S.fecha BETWEEN ? AND ?"]
+    params = [start_date, end_date]
+    if curso:
+        conditions.append("S.curso = ?")
+        params.append(curso)
+    if estado:
+        states = CLOCKINGS_STATE_FILTERS.get(estado, (estado,))
+        conditions.append(f"S.estado IN ({', '.join('?' * len(states))})")
+        params.extend(states)
+    if rut:
+        conditions.append("A.rut LIKE ? || '%'")
+        params.append(rut)
+    sql = f"""
+        SELECT {select}
+        FROM ASISTENCIAS S
+        JOIN ALUMNOS A ON S.id_alumno = A.id_alumno
+        WHERE {' AND '.join(conditions)}
+    """
+    if order_by is not None:
+        direction = " DESC" if descending else ""
+        terms = CLOCKINGS_SORT_SQL[order_by] + ('S.id_asistencia',)
+        sql += f" ORDER BY {', '.join(term + direction for term in terms)} LIMIT ? OFFSET ?"
+    return sql, params
+
+_CLOCKINGS_PAGE_SELECT = """
+    A.rut,
+    A.primer_nombre || ' ' || A.apellido_paterno AS Nombre_Completo,
+    S.curso,
+    S.fecha,
+    S.hora_entrada,
+    S.estado
+"""
+
+# nombre -> (sql, parámetros de ejemplo, tablas/alias que nunca deben recorrerse completos)
+REPORTING_QUERIES = {
+    'get_clockings_for_month': (CLOCKINGS_FOR_MONTH_SQL, ('2024-03-01', '2024-03-01'), ('S',)),
+    'get_arrival_history': (ARRIVAL_HISTORY_SQL, (10, '2024-03-01'), ('S',)),
+    'get_ruts_clocked_on': (CLOCKED_ON_DATE_SQL, ('2024-03-01',), ('S',)),
+    'iter_clockings_for_range': (CLOCKINGS_EXPORT_SQL, ('2024-03-01', '2024-12-31'), ('S',)),
+    'get_clockings_page': (
+        _clockings_page_query(_CLOCKINGS_PAGE_SELECT, '2024-03-01', '2024-03-31', curso='1ro Medio',
+                              estado='tardanza', rut='12', order_by='fecha')[0],
+        ('2024-03-01', '2024-03-31', '1ro Medio', 'tardanza', 'atraso', '12', 200, 0), ('S',)),
+}
+
+def check_reporting_query_plans(conn=None):
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre cada consulta de REPORTING_QUERIES.
+    Retorna {nombre: [pasos del plan que hacen SCAN completo de una tabla protegida]};
+    un diccionario vacío significa que todos los reportes usan índices.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = acquire_connection()
+    try:
+        problems = {}
+        for name, (sql, params, protected) in REPORTING_QUERIES.items():
+            plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            bad_steps = []
+            for row in plan:
+                detail = row[-1]
+                words = detail.split()
+                # 'SCAN <tabla>' (con o sin 'USING INDEX') recorre la tabla entera
+                if len(words) >= 2 and words[0] == 'SCAN' and words[1] in protected:
+                    bad_steps.append(detail)
+            if bad_steps:
+                problems[name] = bad_steps
+        return problems
+    finally:
+        if own_conn:
+            release_connection(conn)
 
 def get_clockings_for_month(month: int, year: int):
     """
     Recupera los registros de asistencia para un mes y año dados.
     Junta la tabla ASISTENCIAS con ALUMNOS para el reporte de Excel.
     """
-    conn = connect_db()
+    conn = acquire_connection()
     cursor = conn.cursor()
     
     start_date = f"{year}-{month:02d}-01"
     
-    cursor.execute("""
-        SELECT 
-            A.rut, 
-            A.primer_nombre || ' ' || A.apellido_paterno AS Nombre_Completo,
-            S.fecha,
-            S.hora_entrada,
-            S.estado
-        FROM ASISTENCIAS S
-        JOIN ALUMNOS A ON S.id_alumno = A.id_alumno
-        WHERE S.fecha BETWEEN ? AND date(?, '+1 month', '-1 day') 
-        ORDER BY A.apellido_paterno, S.fecha
-    """, (start_date, start_date))
+    cursor.execute(CLOCKINGS_FOR_MONTH_SQL, (start_date, start_date))
     
     columns = [desc[0] for desc in cursor.description]
     results = cursor.fetchall()
-    conn.close()
+    release_connection(conn)
     
     return columns, results
 
-def save_clocking(rut, full_name=None, hora_max_tardanza=None):
+def iter_clockings_for_range(start_date, end_date, chunk_size=1000):
     """
-    Registra la hora de entrada y actualiza el contador de atrasos.
-    Devuelve (estado, hora, num_atrasos_actualizado, max_atrasos_warning)
+    Marcaciones entre 'start_date' y 'end_date' (inclusive, 'YYYY-MM-DD') en orden cronológico,
+    entregadas en lotes de 'chunk_size' a medida que se leen: un año completo de todo el
+    colegio se recorre sin cargarlo en memoria.
+    Cada fila: (rut, Nombre_Completo, fecha, hora_entrada, estado).
     """
-    conn = connect_db()
-    cursor = conn.cursor()
-    current_date = datetime.now().strftime('%Y-%m-%d')
-    current_time = datetime.now().strftime('%H:%M:%S')
+    conn = acquire_connection()
+    try:
+        cursor = conn.execute(CLOCKINGS_EXPORT_SQL, (start_date, end_date))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        release_connection(conn)
 
+def count_clockings(start_date, end_date, curso=None, estado=None, rut=None):
+    """Cantidad de marcaciones entre 'start_date' y 'end_date' que cumplen los filtros (ver get_clockings_page)."""
+    sql, params = _clockings_page_query("COUNT(*)", start_date, end_date, curso, estado, rut)
+    conn = acquire_connection()
     try:
-        # Obtener ID, hora_max_tardanza (de BD), num_atrasos actual y max_atrasos_warning
-        cursor.execute("SELECT id_alumno, hora_max_tardanza, num_atrasos, max_atrasos_warning FROM ALUMNOS WHERE rut = ?", (rut,))
-        result = cursor.fetchone()
-        
-        if not result:
-            return None, None, None, None
+        return conn.execute(sql, params).fetchone()[0]
+    finally:
+        release_connection(conn)
+
+def get_clockings_page(start_date, end_date, offset, limit, order_by='fecha', descending=False,
+                       curso=None, estado=None, rut=None):
+    """
+    Una página de marcaciones entre 'start_date' y 'end_date' (inclusive, 'YYYY-MM-DD'),
+    ordenada y filtrada en SQLite para que la GUI nunca cargue el mes completo.
+    'order_by' es una de CLOCKINGS_PAGE_COLUMNS; 'curso' filtra por el curso al marcar,
+    'estado' por estado (ver CLOCKINGS_STATE_FILTERS) y 'rut' por prefijo del RUT.
+    Cada fila: (rut, Nombre_Completo, curso, fecha, hora_entrada, estado).
+    """
+    if order_by not in CLOCKINGS_SORT_SQL:
+        order_by = 'fecha'
+    sql, params = _clockings_page_query(_CLOCKINGS_PAGE_SELECT, start_date, end_date, curso, estado, rut,
+                                        order_by=order_by, descending=descending)
+    conn = acquire_connection()
+    try:
+        return conn.execute(sql, params + [limit, offset]).fetchall()
+    finally:
+        release_connection(conn)
 
-        user_id, db_hora_max, num_atrasos, max_atrasos_warning = result
+def rebuild_attendance_summaries():
+    """
+    Recalcula desde cero RESUMEN_ALUMNO_MES y RESUMEN_CURSO_DIA (p.ej. tras editar ASISTENCIAS
+    fuera de la aplicación). Retorna (éxito, filas alumno-mes, filas curso-día).
+    """
+    conn = acquire_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        student_rows, course_rows = _rebuild_summaries(conn.cursor())
+        conn.commit()
+        print(f"DB: Resúmenes de asistencia recalculados ({student_rows} alumno-mes, {course_rows} curso-día).")
+        return True, student_rows, course_rows
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error al recalcular los resúmenes de asistencia: {e}")
+        return False, 0, 0
+    finally:
+        release_connection(conn)
+
+def get_attendance_totals(start_date, end_date):
+    """
+    Totales del colegio entre 'start_date' y 'end_date' (inclusive, 'YYYY-MM-DD') leídos
+    del resumen por curso y día: {'presentes', 'tardanzas', 'ausentes', 'total'}.
+    """
+    conn = acquire_connection()
+    try:
+        row = conn.execute("""
+            SELECT SUM(presentes), SUM(tardanzas), SUM(ausentes), SUM(total)
+            FROM RESUMEN_CURSO_DIA WHERE fecha BETWEEN ? AND ?
+        """, (start_date, end_date)).fetchone()
+        return dict(zip(('presentes', 'tardanzas', 'ausentes', 'total'), (n or 0 for n in row)))
+    finally:
+        release_connection(conn)
+
+def get_course_summary(start_date, end_date):
+    """
+    Resumen por curso entre 'start_date' y 'end_date' (inclusive, 'YYYY-MM-DD').
+    Cada fila: (curso, dias, presentes, tardanzas, ausentes, total), ordenadas por curso.
+    """
+    conn = acquire_connection()
+    try:
+        return conn.execute("""
+            SELECT curso, COUNT(*), SUM(presentes), SUM(tardanzas), SUM(ausentes), SUM(total)
+            FROM RESUMEN_CURSO_DIA
+            WHERE fecha BETWEEN ? AND ?
+            GROUP BY curso
+            ORDER BY curso
+        """, (start_date, end_date)).fetchall()
+    finally:
+        release_connection(conn)
+
+def get_student_summary(start_month, end_month):
+    """
+    Resumen por alumno entre los meses 'start_month' y 'end_month' (inclusive, 'YYYY-MM').
+    Cada fila: (rut, Nombre_Completo, curso, presentes, tardanzas, ausentes, total),
+    ordenadas por curso y apellido.
+    """
+    conn = acquire_connection()
+    try:
+        return conn.execute("""
+            SELECT A.rut, A.primer_nombre || ' ' || A.apellido_paterno AS Nombre_Completo,
+                   A.curso, SUM(R.presentes), SUM(R.tardanzas), SUM(R.ausentes), SUM(R.total)
+            FROM RESUMEN_ALUMNO_MES R
+            JOIN ALUMNOS A ON A.id_alumno = R.id_alumno
+            WHERE R.mes BETWEEN ? AND ?
+            GROUP BY R.id_alumno
+            ORDER BY A.curso, A.apellido_paterno, A.apellido_materno
+        """, (start_month, end_month)).fetchall()
+    finally:
+        release_connection(conn)
+
+class AttendanceResult(NamedTuple):
+    """Resultado de record_attendance(): todo lo que necesitan el log, la GUI y el ticket."""
+    rut: str
+    nombre: str                  # Primer nombre + apellido paterno (para el ticket)
+    estado: str                  # 'presente' / 'tardanza' / 'ya registrado'
+    hora: Optional[str]          # Hora de entrada registrada (None si ya estaba registrado hoy)
+    num_atrasos: int             # Contador de atrasos ya actualizado
+    max_atrasos_warning: int     # Umbral de advertencia del alumno
+    hora_max_tardanza: str       # Hora límite efectivamente usada para decidir el estado
+    registrado: bool             # True si se insertó una marcación nueva
+
+def get_arrival_history(since_date, slot_minutes=10):
+    """
+    Retorna [(rut, franja, cantidad)] con las llegadas de cada alumno desde 'since_date'
+    agrupadas en franjas de 'slot_minutes' minutos (franja = minutos desde medianoche // slot_minutes).
+    """
+    conn = acquire_connection()
+    try:
+        return conn.execute(ARRIVAL_HISTORY_SQL, (slot_minutes, since_date)).fetchall()
+    except Exception as e:
+        print(f"DB Error al leer el historial de llegadas: {e}")
+        return []
+    finally:
+        release_connection(conn)
+
+def get_ruts_clocked_on(fecha):
+    """Retorna el conjunto de RUT con marcación registrada en la fecha 'YYYY-MM-DD'."""
+    conn = acquire_connection()
+    try:
+        return {row[0] for row in conn.execute(CLOCKED_ON_DATE_SQL, (fecha,))}
+    except Exception as e:
+        print(f"DB Error al leer las marcaciones del día: {e}")
+        return set()
+    finally:
+        release_connection(conn)
+
+def _determine_estado(current_time, effective_max_time):
+    """Compara la hora actual con la hora máxima y retorna 'presente' o 'tardanza'."""
+    try:
+        max_tardy_dt = datetime.strptime(effective_max_time, '%H:%M:%S').time()
+        current_time_dt = datetime.strptime(current_time, '%H:%M:%S').time()
+    except Exception:
+        # En caso de formato distinto, asumir presente para evitar falsos positivos
+        return 'presente'
+    return 'presente' if current_time_dt <= max_tardy_dt else 'tardanza'
+
+def record_attendance(rut, hora_max_tardanza=None):
+    """
+    Registra una marcación en UNA sola transacción y con UNA sola conexión:
+    búsqueda del alumno, decisión de atraso, inserción y actualización del contador.
+    Retorna un AttendanceResult, o None si el RUT no existe o hubo un error de BD.
+    """
+    now = datetime.now()
+    current_date = now.strftime('%Y-%m-%d')
+    current_time = now.strftime('%H:%M:%S')
+
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    try:
+        # IMMEDIATE toma el bloqueo de escritura al inicio: la lectura y la escritura ven el mismo estado
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+            SELECT id_alumno, primer_nombre, apellido_paterno, hora_max_tardanza, num_atrasos, max_atrasos_warning, curso
+            FROM ALUMNOS
+            WHERE rut = ?
+        """, (rut,))
+        row = cursor.fetchone()
+        if not row:
+            conn.rollback()
+            return None
+
+        user_id, primer_nombre, apellido_paterno, db_hora_max, num_atrasos, max_atrasos_warning, curso = row
+        nombre = f"{primer_nombre} {apellido_paterno}"
 
         # Si se pasa hora_max_tardanza como override, usarla; si no, usar la de la BD
         effective_max_time = hora_max_tardanza or db_hora_max or "23:59:59"
-
-        # Determinar estado comparando horas
-        try:
-            max_tardy_dt = datetime.strptime(effective_max_time, '%H:%M:%S').time()
-            current_time_dt = datetime.strptime(current_time, '%H:%M:%S').time()
-        except Exception:
-            # En caso de formato distinto, asumir presente para evitar falsos positivos
-            max_tardy_dt = None
-            current_time_dt = None
-
-        if max_tardy_dt and current_time_dt:
-            estado = 'presente' if current_time_dt <= max_tardy_dt else 'tardanza'
-        else:
-            estado = 'presente'
+        estado = _determine_estado(current_time, effective_max_time)
 
         # Intentar insertar la marcación (solo hora_entrada). ON CONFLICT DO NOTHING
+        # Los triggers de ASISTENCIAS actualizan los resúmenes en esta misma transacción
         cursor.execute("""
-            INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado) 
-            VALUES (?, ?, ?, ?)
+            INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado, curso) 
+            VALUES (?, ?, ?, ?, ?)
             ON CONFLICT(id_alumno, fecha) DO NOTHING 
-        """, (user_id, current_date, current_time, estado))
+        """, (user_id, current_date, current_time, estado, curso))
         
-        # Si se insertó una nueva fila y el estado es 'tardanza', actualizar contador.
-        if cursor.rowcount > 0:
-            if estado == 'tardanza':
-                num_atrasos += 1
-                cursor.execute("UPDATE ALUMNOS SET num_atrasos = ? WHERE id_alumno = ?", (num_atrasos, user_id))
-            conn.commit()
-            return f"entrada ({estado})", current_time, num_atrasos, max_atrasos_warning
-        else:
+        if cursor.rowcount == 0:
             # Ya registrado hoy: devolver contador actual y umbral
-            return "ya registrado", None, num_atrasos, max_atrasos_warning
+            conn.rollback()
+            return AttendanceResult(rut, nombre, 'ya registrado', None, num_atrasos,
+                                    max_atrasos_warning, effective_max_time, False)
+
+        # Si se insertó una nueva fila y el estado es 'tardanza', actualizar contador.
+        if estado == 'tardanza':
+            num_atrasos += 1
+            cursor.execute("UPDATE ALUMNOS SET num_atrasos = ? WHERE id_alumno = ?", (num_atrasos, user_id))
+        conn.commit()
+        _notify_alumnos_change('marcar', rut, fecha=current_date, hora=current_time)
+        return AttendanceResult(rut, nombre, estado, current_time, num_atrasos,
+                                max_atrasos_warning, effective_max_time, True)
 
     except Exception as e:
         print(f"Error al registrar marcación: {e}")
-        return None, None, None, None
+        return None
     finally:
-        conn.close()
+        release_connection(conn)
+
+def save_clocking(rut, full_name=None, hora_max_tardanza=None):
+    """
+    Registra la hora de entrada y actualiza el contador de atrasos.
+    Devuelve (estado, hora, num_atrasos_actualizado, max_atrasos_warning)
+    Se mantiene por compatibilidad; el código nuevo debe usar record_attendance().
+    """
+    result = record_attendance(rut, hora_max_tardanza)
+    if result is None:
+        return None, None, None, None
+    if result.registrado:
+        return f"entrada ({result.estado})", result.hora, result.num_atrasos, result.max_atrasos_warning
+    return "ya registrado", None, result.num_atrasos, result.max_atrasos_warning
 
 def reset_all_delays():
     """Resetea el contador de atrasos de todos los alumnos a 0."""
-    conn = connect_db()
+    conn = acquire_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("UPDATE ALUMNOS SET num_atrasos = 0")
@@ -271,14 +1229,14 @@ def reset_all_delays():
         print(f"DB Error al resetear los atrasos: {e}")
         return False
     finally:
-        conn.close()
+        release_connection(conn)
 
 def get_alumno_details_by_rut(rut):
     """
     Obtiene los detalles de un alumno por su RUT.
     Devuelve (id_alumno, full_name, num_atrasos, max_atrasos_warning, hora_max_tardanza)
     """
-    conn = connect_db()
+    conn = acquire_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("""
@@ -298,14 +1256,14 @@ def get_alumno_details_by_rut(rut):
         print(f"Error al obtener detalles del alumno: {e}")
         return None, None, None, None, None, None
     finally:
-        conn.close()
+        release_connection(conn)
 
 def update_alumno_details(rut, pn, sn, ap, am, hora_max, max_warn, curso):
     """
     Actualiza los datos personales y de configuración de un alumno existente.
     Retorna True si se actualizó correctamente, False si hubo error o no se encontró.
     """
-    conn = connect_db()
+    conn = acquire_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("""
@@ -323,6 +1281,7 @@ def update_alumno_details(rut, pn, sn, ap, am, hora_max, max_warn, curso):
         if cursor.rowcount > 0:
             conn.commit()
             print(f"DB: Alumno {rut} actualizado correctamente.")
+            _notify_alumnos_change('actualizar', rut, curso=curso, hora_max_tardanza=hora_max)
             return True
         else:
             print(f"DB: No se encontró alumno con RUT {rut} para actualizar.")
@@ -331,67 +1290,139 @@ def update_alumno_details(rut, pn, sn, ap, am, hora_max, max_warn, curso):
         print(f"DB Error al actualizar alumno: {e}")
         return False
     finally:
-        conn.close()
+        release_connection(conn)
 
-def promote_students():
+def get_course_progression():
+    """Retorna el mapa de promoción {curso_actual: curso_siguiente} (None = egresa)."""
+    conn = acquire_connection()
+    try:
+        return dict(conn.execute("SELECT curso_actual, curso_siguiente FROM PROGRESION_CURSOS"))
+    except Exception as e:
+        print(f"DB Error al leer la progresión de cursos: {e}")
+        return {}
+    finally:
+        release_connection(conn)
+
+def set_course_progression(progression):
     """
-    Promueve a los estudiantes al siguiente curso y elimina a los que egresan (4to Medio).
-    Cursos esperados: '1ro Medio', '2do Medio', '3ro Medio', '4to Medio'.
+    Reemplaza la tabla PROGRESION_CURSOS con el mapa {curso_actual: curso_siguiente}.
+    Usar None como curso_siguiente para los cursos que egresan.
     """
-    conn = connect_db()
+    conn = acquire_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("DELETE FROM PROGRESION_CURSOS")
+        cursor.executemany(
+            "INSERT INTO PROGRESION_CURSOS (curso_actual, curso_siguiente) VALUES (?, ?)",
+            progression.items()
+        )
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"DB Error al guardar la progresión de cursos: {e}")
+        return False
+    finally:
+        release_connection(conn)
+
+# Alumnos cuyo curso (normalizado) egresa o se promueve según PROGRESION_CURSOS
+_GRADUATES_SQL = """
+    SELECT A.id_alumno FROM ALUMNOS A
+    JOIN PROGRESION_CURSOS P ON P.curso_actual = TRIM(A.curso)
+    WHERE P.curso_siguiente IS NULL
+"""
+
+def _subtract_graduates_from_summaries(cursor):
+    """Quita de los resúmenes las asistencias de los egresados con sentencias por conjunto."""
+    cursor.execute(f"DELETE FROM RESUMEN_ALUMNO_MES WHERE id_alumno IN ({_GRADUATES_SQL})")
+    sums = ", ".join(f"SUM(COALESCE(S.estado IN ({states}), 0)) AS {column}"
+                     for column, states in _SUMMARY_STATES.items())
+    updates = ", ".join(f"{c} = RESUMEN_CURSO_DIA.{c} - D.{c}" for c in list(_SUMMARY_STATES) + ['total'])
+    cursor.execute(f"""
+        UPDATE RESUMEN_CURSO_DIA SET {updates}
+        FROM (
+            SELECT S.fecha, COALESCE(S.curso, A.curso, '') AS curso, {sums}, COUNT(*) AS total
+            FROM ASISTENCIAS S
+            JOIN ALUMNOS A ON A.id_alumno = S.id_alumno
+            WHERE S.id_alumno IN ({_GRADUATES_SQL})
+            GROUP BY S.fecha, COALESCE(S.curso, A.curso, '')
+        ) AS D
+        WHERE RESUMEN_CURSO_DIA.fecha = D.fecha AND RESUMEN_CURSO_DIA.curso = D.curso
+    """)
+    cursor.execute("DELETE FROM RESUMEN_CURSO_DIA WHERE total <= 0")
+
+def promote_students(dry_run=False):
+    """
+    Promueve a los estudiantes al siguiente curso y elimina a los que egresan,
+    según la tabla PROGRESION_CURSOS. Todo se hace con unas pocas sentencias SQL
+    por conjunto dentro de una sola transacción.
+    Con dry_run=True no se modifica nada y solo se retornan los conteos.
+    Retorna (éxito, promovidos, egresados).
+    """
+    conn = acquire_connection()
     cursor = conn.cursor()
-    
-    # Mapa de promoción
-    promotion_map = {
-        '1ro Medio': '2do Medio',
-        '2do Medio': '3ro Medio',
-        '3ro Medio': '4to Medio',
-        '4to Medio': 'EGRESADO' # Marcador para eliminar
-    }
-    
     try:
-        cursor.execute("SELECT id_alumno, rut, primer_nombre, apellido_paterno, curso FROM ALUMNOS")
-        students = cursor.fetchall()
+        cursor.execute("BEGIN IMMEDIATE")
         
-        promoted_count = 0
-        graduated_count = 0
+        # Conteos previos (y cursos no reconocidos, que quedan sin cambios)
+        cursor.execute("""
+            SELECT
+                SUM(P.curso_actual IS NOT NULL AND P.curso_siguiente IS NOT NULL),
+                SUM(P.curso_actual IS NOT NULL AND P.curso_siguiente IS NULL),
+                SUM(P.curso_actual IS NULL AND A.curso IS NOT NULL)
+            FROM ALUMNOS A
+            LEFT JOIN PROGRESION_CURSOS P ON P.curso_actual = TRIM(A.curso)
+        """)
+        promoted_count, graduated_count, unknown_count = (n or 0 for n in cursor.fetchone())
         
+        if dry_run:
+            conn.rollback()
+            print(f"PROMOCIÓN (SIMULACIÓN). Promovidos: {promoted_count}, Egresados: {graduated_count}, Cursos no reconocidos: {unknown_count}")
+            return True, promoted_count, graduated_count
+
         print("INICIANDO PROMOCIÓN ANUAL DE ESTUDIANTES...")
         
-        for student in students:
-            id_alumno, rut, nombre, apellido, curso_actual = student
-            
-            if not curso_actual:
-                continue # Si no tiene curso, se salta
-                
-            # Normalizar string (por si acaso)
-            curso_actual = curso_actual.strip()
-            
-            if curso_actual in promotion_map:
-                nuevo_curso = promotion_map[curso_actual]
-                
-                if nuevo_curso == 'EGRESADO':
-                    # Eliminar estudiante
-                    print(f"  - {nombre} {apellido} ({rut}): Egresado de 4to Medio. Eliminando registro...")
-                    # Eliminar asistencias primero (FK)
-                    cursor.execute("DELETE FROM ASISTENCIAS WHERE id_alumno = ?", (id_alumno,))
-                    # Eliminar alumno
-                    cursor.execute("DELETE FROM ALUMNOS WHERE id_alumno = ?", (id_alumno,))
-                    graduated_count += 1
-                else:
-                    # Promover
-                    print(f"  - {nombre} {apellido} ({rut}): Promovido de {curso_actual} a {nuevo_curso}.")
-                    cursor.execute("UPDATE ALUMNOS SET curso = ? WHERE id_alumno = ?", (nuevo_curso, id_alumno))
-                    promoted_count += 1
-            else:
-                print(f"  - {nombre} {apellido} ({rut}): Curso '{curso_actual}' no reconocido para promoción.")
-                
+        # RUTs afectados, para mantener sincronizada la galería en memoria tras el commit
+        cursor.execute(f"SELECT rut FROM ALUMNOS WHERE id_alumno IN ({_GRADUATES_SQL})")
+        graduated_ruts = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT A.rut, P.curso_siguiente FROM ALUMNOS A
+            JOIN PROGRESION_CURSOS P ON P.curso_actual = TRIM(A.curso)
+            WHERE P.curso_siguiente IS NOT NULL
+        """)
+        promoted = cursor.fetchall()
+        
+        # 1. Egresados: eliminar asistencias y plantillas primero (FK), luego el alumno.
+        #    Va antes de la promoción para no eliminar a los recién promovidos a 4to Medio.
+        #    Los resúmenes se descuentan por conjuntos; los triggers fila a fila se omiten.
+        _subtract_graduates_from_summaries(cursor)
+        cursor.execute("UPDATE META SET valor = 1 WHERE clave = 'resumen_en_lote'")
+        cursor.execute(f"DELETE FROM ASISTENCIAS WHERE id_alumno IN ({_GRADUATES_SQL})")
+        cursor.execute("UPDATE META SET valor = 0 WHERE clave = 'resumen_en_lote'")
+        cursor.execute(f"DELETE FROM PLANTILLAS WHERE id_alumno IN ({_GRADUATES_SQL})")
+        cursor.execute(f"DELETE FROM ALUMNOS WHERE id_alumno IN ({_GRADUATES_SQL})")
+        
+        # 2. Promoción: cada fila toma su curso siguiente en una sola sentencia
+        cursor.execute("""
+            UPDATE ALUMNOS
+            SET curso = (SELECT curso_siguiente FROM PROGRESION_CURSOS WHERE curso_actual = TRIM(ALUMNOS.curso))
+            WHERE TRIM(curso) IN (SELECT curso_actual FROM PROGRESION_CURSOS WHERE curso_siguiente IS NOT NULL)
+        """)
+        
         conn.commit()
+        for rut in graduated_ruts:
+            _notify_alumnos_change('eliminar', rut)
+        for rut, nuevo_curso in promoted:
+            _notify_alumnos_change('actualizar', rut, curso=nuevo_curso)
+        if unknown_count:
+            print(f"  - {unknown_count} alumnos con curso no reconocido para promoción (sin cambios).")
         print(f"PROMOCIÓN FINALIZADA. Promovidos: {promoted_count}, Egresados/Eliminados: {graduated_count}")
         return True, promoted_count, graduated_count
         
     except Exception as e:
+        conn.rollback()
         print(f"Error durante la promoción de estudiantes: {e}")
         return False, 0, 0
     finally:
-        conn.close()
\ No newline at end of file
+        release_connection(conn)
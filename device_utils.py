@@ -0,0 +1,167 @@
+# device_utils.py (Sesión persistente con el lector de huellas)
+import threading
+import time
+from contextlib import contextmanager
+
+# Errores de "reintentar" (dedo mal puesto, muy rápido, etc.): el dispositivo sigue sano
+_RETRY_ERROR_DOMAIN = 'fp-device-retry-quark'
+# Operación cancelada con un Gio.Cancellable (G_IO_ERROR_CANCELLED): tampoco es una falla del lector
+_IO_ERROR_DOMAIN = 'g-io-error-quark'
+_IO_ERROR_CANCELLED = 19
+
+def is_cancelled_error(error):
+    """True si la excepción corresponde a una operación cancelada con Gio.Cancellable."""
+    return getattr(error, 'domain', None) == _IO_ERROR_DOMAIN and getattr(error, 'code', None) == _IO_ERROR_CANCELLED
+
+def _is_device_failure(error):
+    return getattr(error, 'domain', None) != _RETRY_ERROR_DOMAIN and not is_cancelled_error(error)
+
+
+class FingerprintDeviceSession:
+    """
+    Mantiene el lector de huellas abierto entre operaciones (abrirlo cuesta tiempo
+    en cada alumno). Identificar, verificar y enrolar lo comparten bajo el mismo lock
+    (fprint_lock de la aplicación). Si una operación falla o el lector se desconecta,
+    el dispositivo se cierra y se vuelve a enumerar y abrir en la siguiente operación.
+    También lleva contadores de latencia por tipo de operación.
+    """
+
+    def __init__(self, fprint_context, lock=None):
+        self._context = fprint_context
+        self.lock = lock or threading.Lock()
+        self._device = None
+        self._removed = False
+        self.reconnects = 0
+        self._was_open = False
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        try:
+            # Desenchufar el lector invalida el dispositivo abierto
+            self._context.connect('device-removed', self._on_device_removed)
+        except Exception:
+            pass
+
+    def _on_device_removed(self, context, device):
+        if device is self._device:
+            self._removed = True
+            print("LECTOR: Dispositivo desconectado.")
+
+    def _is_usable(self, device):
+        if self._removed:
+            return False
+        try:
+            # Propiedad 'removed' disponible en versiones recientes de libfprint
+            if device.props.removed:
+                return False
+        except Exception:
+            pass
+        return device.is_open()
+
+    def _open_device(self):
+        """Retorna el dispositivo abierto, enumerando y abriendo de nuevo si hace falta."""
+        device = self._device
+        if device is not None and self._is_usable(device):
+            return device
+        self._close_device()
+
+        # Re-enumerar detecta lectores reconectados; un segundo intento cubre
+        # el caso de un dispositivo que aún no terminaba de reaparecer.
+        last_error = None
+        for attempt in range(2):
+            try:
+                self._context.enumerate()
+                devices = self._context.get_devices()
+                if not devices:
+                    raise RuntimeError("No se encontró ningún dispositivo de huella dactilar.")
+                device = devices[0]
+                if not device.is_open():
+                    device.open_sync()
+                break
+            except Exception as e:
+                last_error = e
+                if attempt == 0:
+                    time.sleep(0.2)
+        else:
+            raise last_error
+
+        if self._was_open:
+            self.reconnects += 1
+            print("LECTOR: Conexión restablecida.")
+        self._device = device
+        self._removed = False
+        self._was_open = True
+        return device
+
+    def _close_device(self):
+        device, self._device = self._device, None
+        if device is not None:
+            try:
+                if device.is_open():
+                    device.close_sync()
+            except Exception:
+                pass
+
+    def _record(self, name, elapsed, failed):
+        with self._stats_lock:
+            stats = self._stats.setdefault(name, {'operaciones': 0, 'errores': 0, 'total_s': 0.0,
+                                                  'ultima_s': 0.0, 'max_s': 0.0})
+            stats['operaciones'] += 1
+            stats['errores'] += int(failed)
+            stats['total_s'] += elapsed
+            stats['ultima_s'] = elapsed
+            stats['max_s'] = max(stats['max_s'], elapsed)
+
+    @contextmanager
+    def operation(self, name):
+        """
+        Toma el lock del lector y entrega el dispositivo ya abierto:
+
+            with session.operation('identificar') as device:
+                device.identify_sync(prints)
+
+        Un error del dispositivo cierra la sesión para que la próxima operación la reabra.
+        """
+        with self.lock:
+            start = time.perf_counter()
+            failed = False
+            try:
+                yield self._open_device()
+            except Exception as e:
+                # Los errores de "reintentar" y las cancelaciones no indican un problema del lector
+                failed = _is_device_failure(e)
+                if failed:
+                    self._close_device()
+                raise
+            finally:
+                self._record(name, time.perf_counter() - start, failed)
+
+    def is_available(self):
+        """True si hay un lector abierto o se detecta uno conectado (sin esperar si está en uso)."""
+        if not self.lock.acquire(blocking=False):
+            return True  # Ocupado en una operación: está conectado
+        try:
+            if self._device is not None and self._is_usable(self._device):
+                return True
+            self._context.enumerate()
+            return bool(self._context.get_devices())
+        except Exception:
+            return False
+        finally:
+            self.lock.release()
+
+    def get_stats(self):
+        """Contadores por operación (con latencia promedio) para diagnóstico."""
+        with self._stats_lock:
+            stats = {name: dict(values, promedio_s=values['total_s'] / values['operaciones'])
+                     for name, values in self._stats.items()}
+        stats['reconexiones'] = self.reconnects
+        return stats
+
+    def close(self, timeout=2.0):
+        """Cierra el lector (al salir). No espera indefinidamente si hay una captura en curso."""
+        if not self.lock.acquire(timeout=timeout):
+            return
+        try:
+            self._close_device()
+        finally:
+            self.lock.release()
@@ -0,0 +1,675 @@
+# gallery_utils.py (Galería en memoria de plantillas deserializadas)
+import configparser
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+
+try:
+    import gi
+    gi.require_version('FPrint', '2.0')
+    from gi.repository import FPrint
+except (ValueError, ImportError):
+    FPrint = None
+    print("WARNING: 'FPrint' no está disponible. La galería de plantillas no podrá deserializar huellas.")
+
+from snapshot_utils import refresh_snapshot
+from metrics_utils import get_latency_recorder
+from db_utils import count_templates, iter_templates_for_gallery, get_template_by_rut, register_alumnos_listener, get_arrival_history, get_ruts_clocked_on
+
+# Carga inicial por lotes. FPrint.Print no se puede enviar entre procesos (no es serializable
+# con pickle), así que se usa un pool de hilos: PyGObject libera el GIL durante la llamada a C.
+WARMUP_WORKERS = min(8, os.cpu_count() or 1)
+WARMUP_CHUNK_SIZE = 200
+
+
+class GalleryEntry:
+    """Plantilla ya deserializada de un alumno junto a los datos que se usan al identificar."""
+    __slots__ = ('rut', 'fprint', 'curso', 'hora_max_tardanza')
+
+    def __init__(self, rut, fprint, curso=None, hora_max_tardanza=None):
+        self.rut = rut
+        self.fprint = fprint
+        self.curso = curso
+        self.hora_max_tardanza = hora_max_tardanza
+
+
+class TemplateGallery:
+    """
+    Mantiene en memoria los objetos FPrint.Print de todos los alumnos enrolados.
+    Se construye una sola vez al iniciar y se actualiza en el lugar cuando db_utils
+    notifica cambios (save_template, update_alumno_details, promote_students), de modo
+    que la identificación solo paga por la captura y la comparación.
+    """
+
+    def __init__(self, deserializer=None):
+        # 'deserializer' permite inyectar un backend alternativo (p.ej. un mock en pruebas)
+        self._deserializer = deserializer
+        self._entries = {}
+        self._prints_cache = None
+        self._lock = threading.RLock()
+        self.is_loaded = False
+        self.version = 0  # Aumenta con cada cambio (invalida las particiones en caché)
+        # Estado de la carga por lotes: cambios recibidos mientras se carga no se pisan
+        self._build_lock = threading.RLock()
+        self._loading = False
+        self._touched = set()
+        self._pending_details = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _deserialize(self, rut, template):
+        """Convierte la plantilla almacenada (bytes del BLOB) en un objeto FPrint.Print con el RUT como username."""
+        if self._deserializer is not None:
+            template_fprint = self._deserializer(template)
+        else:
+            if FPrint is None:
+                raise RuntimeError("FPrint no está disponible.")
+            template_fprint = FPrint.Print.deserialize(template)
+        template_fprint.set_username(rut)
+        return template_fprint
+
+    def _decode_chunk(self, rows, log):
+        """Deserializa un lote de filas (se ejecuta en un hilo del pool de carga)."""
+        entries = []
+        with get_latency_recorder().span('galeria/deserializar_lote', plantillas=len(rows)):
+            for rut, template, curso, hora_max in rows:
+                try:
+                    entries.append(GalleryEntry(rut, self._deserialize(rut, template), curso, hora_max))
+                except Exception as e:
+                    log(f"Advertencia: No se pudo cargar la plantilla para {rut}. Error: {e}")
+        return entries
+
+    def _merge_chunk(self, entries, seen):
+        """Incorpora un lote ya deserializado sin pisar los cambios hechos durante la carga."""
+        with self._lock:
+            for entry in entries:
+                seen.add(entry.rut)
+                if entry.rut in self._touched:
+                    continue
+                details = self._pending_details.pop(entry.rut, None)
+                if details:
+                    entry.curso, entry.hora_max_tardanza = details
+                self._entries[entry.rut] = entry
+            self._prints_cache = None
+            self.version += 1
+
+    @property
+    def is_complete(self):
+        """True si la galería está cargada y no hay una carga por lotes en curso."""
+        return self.is_loaded and not self._loading
+
+    def ensure_loaded(self):
+        """Construye la galería si todavía nadie la ha cargado (no repite una carga ya iniciada)."""
+        if self.is_loaded:
+            return
+        with self._build_lock:
+            if not self.is_loaded:
+                self.build_from_db()
+
+    def build_from_db(self, logger=None, progress=None, workers=None, chunk_size=WARMUP_CHUNK_SIZE):
+        """
+        Carga (o recarga) la galería desde PLANTILLAS deserializando por lotes en un pool de hilos.
+        Cada lote se incorpora apenas está listo, así que se puede identificar contra la parte
+        ya cargada. 'progress(cargadas, total)' se llama después de cada lote.
+        Retorna la cantidad de plantillas cargadas.
+        """
+        with self._build_lock:
+            return self._build(count_templates(), iter_templates_for_gallery(chunk_size),
+                               logger, progress, workers)
+
+    def build_from_snapshot(self, path, logger=None, progress=None, workers=None, chunk_size=WARMUP_CHUNK_SIZE):
+        """
+        Igual que build_from_db(), pero lee las plantillas desde la instantánea en disco
+        (snapshot_utils), que antes se pone al día solo con los alumnos modificados.
+        Si la instantánea no se puede usar, carga desde la BD.
+        """
+        with self._build_lock:
+            snapshot = refresh_snapshot(path, logger or print)
+            if snapshot is None:
+                return self._build(count_templates(), iter_templates_for_gallery(chunk_size),
+                                   logger, progress, workers)
+            try:
+                return self._build(snapshot.count, snapshot.iter_chunks(chunk_size),
+                                   logger, progress, workers)
+            finally:
+                snapshot.close()
+
+    def _build(self, total, chunks, logger, progress, workers):
+        """
+        Carga por lotes desde 'chunks' (iterador de lotes de filas (rut, plantilla, curso,
+        hora_max_tardanza)). Se llama con _build_lock tomado.
+        """
+        def _log(message):
+            if logger:
+                logger(message)
+            else:
+                print(message)
+
+        with self._lock:
+            previous = set(self._entries)
+            self._touched = set()
+            self._pending_details = {}
+            self._loading = True
+            # Desde ya los cambios en la BD se aplican sobre la galería parcial
+            self.is_loaded = True
+
+        seen = set()
+        loaded = 0
+        workers = workers or WARMUP_WORKERS
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="GalleryWarmup") as pool:
+                pending = set()
+
+                def _collect(done):
+                    nonlocal loaded
+                    for future in done:
+                        entries = future.result()
+                        self._merge_chunk(entries, seen)
+                        loaded += len(entries)
+                    if progress:
+                        progress(loaded, total)
+
+                # Los lotes se leen a medida que hay hilos libres (a lo más 2 por hilo en espera)
+                for rows in chunks:
+                    pending.add(pool.submit(self._decode_chunk, rows, _log))
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        _collect(done)
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _collect(done)
+        finally:
+            with self._lock:
+                # En una recarga, quitar a quienes ya no tienen plantilla en la BD
+                for rut in previous - seen - self._touched:
+                    self._entries.pop(rut, None)
+                self._prints_cache = None
+                self.version += 1
+                self._loading = False
+                self._touched = set()
+                self._pending_details = {}
+        return loaded
+
+    def upsert(self, rut, template, curso=None, hora_max_tardanza=None):
+        """Agrega o reemplaza la plantilla de un alumno (p.ej. tras un enrolamiento)."""
+        try:
+            template_fprint = self._deserialize(rut, template)
+        except Exception as e:
+            print(f"Galería: No se pudo deserializar la plantilla para {rut}. Error: {e}")
+            self.remove(rut)
+            return False
+        with self._lock:
+            self._entries[rut] = GalleryEntry(rut, template_fprint, curso, hora_max_tardanza)
+            self._prints_cache = None
+            self.version += 1
+        return True
+
+    def update_details(self, rut, curso=None, hora_max_tardanza=None):
+        """Actualiza los datos asociados a una plantilla existente sin volver a deserializarla."""
+        with self._lock:
+            entry = self._entries.get(rut)
+            if entry is None:
+                return False
+            if curso is not None:
+                entry.curso = curso
+            if hora_max_tardanza is not None:
+                entry.hora_max_tardanza = hora_max_tardanza
+            self.version += 1
+            return True
+
+    def remove(self, rut):
+        """Quita a un alumno de la galería (p.ej. egresados)."""
+        with self._lock:
+            if self._entries.pop(rut, None) is not None:
+                self._prints_cache = None
+                self.version += 1
+
+    def contains(self, rut):
+        with self._lock:
+            return rut in self._entries
+
+    def get_print(self, rut):
+        """Retorna el FPrint.Print de un RUT o None si no está en la galería."""
+        with self._lock:
+            entry = self._entries.get(rut)
+            return entry.fprint if entry else None
+
+    def get_prints(self):
+        """Retorna la lista de FPrint.Print para identify_sync (se reutiliza mientras no haya cambios)."""
+        with self._lock:
+            if self._prints_cache is None:
+                self._prints_cache = [entry.fprint for entry in self._entries.values()]
+            return self._prints_cache
+
+    def load_print(self, rut):
+        """
+        Retorna el FPrint.Print de un RUT para la verificación 1:1: desde la galería si ya está
+        cargado o, si no, leyendo y deserializando solo esa plantilla (sin cargar la galería).
+        """
+        template_fprint = self.get_print(rut)
+        if template_fprint is not None:
+            return template_fprint
+        template = get_template_by_rut(rut)
+        if template is None:
+            return None
+        return self._deserialize(rut, template)
+
+    def get_pairs_for(self, ruts):
+        """Retorna [(rut, FPrint.Print)] de los RUT indicados que estén en la galería (en ese orden)."""
+        with self._lock:
+            return [(rut, self._entries[rut].fprint) for rut in ruts if rut in self._entries]
+
+    def select(self, predicate):
+        """Retorna [(rut, FPrint.Print)] de las entradas que cumplen 'predicate(entry)'."""
+        with self._lock:
+            return [(entry.rut, entry.fprint) for entry in self._entries.values() if predicate(entry)]
+
+    def ruts(self):
+        with self._lock:
+            return list(self._entries)
+
+    def _on_alumnos_change(self, accion, rut, datos):
+        """Listener registrado en db_utils para mantener la galería sincronizada."""
+        if not self.is_loaded:
+            # Si aún no se construyó, la carga inicial ya leerá el estado actualizado.
+            return
+        with self._lock:
+            if self._loading:
+                if accion in ('guardar', 'eliminar'):
+                    self._touched.add(rut)
+                elif accion == 'actualizar' and rut not in self._entries:
+                    # Aún no llega su lote: aplicar los datos nuevos al incorporarlo
+                    self._pending_details[rut] = (datos.get('curso'), datos.get('hora_max_tardanza'))
+        if accion == 'guardar':
+            self.upsert(rut, datos.get('plantilla'), datos.get('curso'), datos.get('hora_max_tardanza'))
+        elif accion == 'actualizar':
+            self.update_details(rut, datos.get('curso'), datos.get('hora_max_tardanza'))
+        elif accion == 'eliminar':
+            self.remove(rut)
+
+
+_gallery = None
+_gallery_lock = threading.Lock()
+
+def get_gallery():
+    """Retorna la galería compartida por todo el proceso (se crea y registra la primera vez)."""
+    global _gallery
+    with _gallery_lock:
+        if _gallery is None:
+            _gallery = TemplateGallery()
+            register_alumnos_listener(_gallery._on_alumnos_change)
+        return _gallery
+
+
+# --- ORDEN POR PROBABILIDAD DE LLEGADA ---
+# Los alumnos llegan a horas muy predecibles. La galería se ordena poniendo primero a
+# quienes suelen llegar en la franja actual y al final a quienes ya marcaron hoy, de
+# modo que los drivers que se detienen en la primera coincidencia terminan antes. Los que
+# ya marcaron no se excluyen de la galería completa: si vuelven a apoyar el dedo deben
+# reconocerse (enfriamiento o "ya registrado") y no compararse contra plantillas ajenas.
+ARRIVAL_SLOT_MINUTES = 10   # Tamaño de cada franja horaria
+ARRIVAL_HISTORY_DAYS = 60   # Días de ASISTENCIAS que se usan al iniciar
+
+class ArrivalModel:
+    """
+    Frecuencia de llegada de cada alumno por franja horaria. Se carga una vez desde
+    ASISTENCIAS y luego se mantiene en forma incremental con cada marcación (evento
+    'marcar' de db_utils): cada franja conserva su lista de RUT ordenada por llegadas
+    y una marcación solo desplaza a ese alumno, sin recalcular nada por escaneo.
+    """
+
+    def __init__(self, gallery, slot_minutes=ARRIVAL_SLOT_MINUTES, history_days=ARRIVAL_HISTORY_DAYS):
+        self._gallery = gallery
+        self.slot_minutes = slot_minutes
+        self.history_days = history_days
+        self._counts = defaultdict(dict)  # franja -> {rut: llegadas}
+        self._order = defaultdict(list)   # franja -> [rut] de más a menos llegadas
+        self._pos = defaultdict(dict)     # franja -> {rut: índice en _order}
+        self._recorded = set()            # RUT que ya marcaron en _day
+        self._day = None
+        self._cache_key = None
+        self._cache_ruts = []
+        self._cache_prints = []
+        self._lock = threading.RLock()
+        self.is_loaded = False
+
+    def slot_of(self, when):
+        """Franja de una hora 'HH:MM:SS' o de un datetime."""
+        if isinstance(when, str):
+            minutes = int(when[0:2]) * 60 + int(when[3:5])
+        else:
+            minutes = when.hour * 60 + when.minute
+        return minutes // self.slot_minutes
+
+    def load_from_db(self, today=None):
+        """Carga el historial de llegadas y las marcaciones de hoy. Retorna la cantidad de franjas."""
+        today = today or datetime.now().date()
+        since = (today - timedelta(days=self.history_days)).isoformat()
+        counts = defaultdict(dict)
+        for rut, slot, total in get_arrival_history(since, self.slot_minutes):
+            counts[slot][rut] = total
+        order = defaultdict(list)
+        pos = defaultdict(dict)
+        for slot, slot_counts in counts.items():
+            order[slot] = sorted(slot_counts, key=slot_counts.get, reverse=True)
+            pos[slot] = {rut: i for i, rut in enumerate(order[slot])}
+        recorded = get_ruts_clocked_on(today.isoformat())
+
+        with self._lock:
+            self._counts, self._order, self._pos = counts, order, pos
+            self._recorded = recorded
+            self._day = today.isoformat()
+            self._cache_key = None
+            self.is_loaded = True
+        return len(counts)
+
+    def _check_day(self, fecha):
+        if fecha != self._day:
+            # Día nuevo: nadie ha marcado todavía
+            self._day = fecha
+            self._recorded = set()
+            self._cache_key = None
+
+    def _bump(self, slot, rut):
+        """Suma una llegada y sube al alumno en la franja mientras supere al anterior."""
+        counts, order, pos = self._counts[slot], self._order[slot], self._pos[slot]
+        total = counts.get(rut, 0) + 1
+        counts[rut] = total
+        i = pos.get(rut)
+        if i is None:
+            i = len(order)
+            order.append(rut)
+        while i > 0 and counts[order[i - 1]] < total:
+            order[i] = order[i - 1]
+            pos[order[i]] = i
+            i -= 1
+        order[i] = rut
+        pos[rut] = i
+
+    def note_clocking(self, rut, fecha, hora):
+        """Registra una marcación: actualiza la frecuencia y pasa al alumno al final de la galería de hoy."""
+        with self._lock:
+            self._check_day(fecha)
+            self._recorded.add(rut)
+            self._bump(self.slot_of(hora), rut)
+            # Se mueve al final de la galería ordenada en caché en lugar de reconstruirla
+            try:
+                i = self._cache_ruts.index(rut)
+            except ValueError:
+                return
+            self._cache_ruts.append(self._cache_ruts.pop(i))
+            self._cache_prints.append(self._cache_prints.pop(i))
+
+    def is_recorded(self, rut):
+        with self._lock:
+            return rut in self._recorded
+
+    def _likely_ruts(self, slot):
+        """RUT pendientes de hoy: primero la franja actual, luego las vecinas (siguiente y anterior)."""
+        seen = set()
+        likely = []
+        for s in (slot, slot + 1, slot - 1):
+            for rut in self._order.get(s, ()):
+                if rut not in seen and rut not in self._recorded:
+                    seen.add(rut)
+                    likely.append(rut)
+        return likely
+
+    def ordered_prints(self, now=None):
+        """
+        Galería completa ordenada por probabilidad de llegada de los alumnos que aún no marcan
+        hoy, seguidos por los que ya marcaron (para reconocerlos si vuelven a apoyar el dedo).
+        """
+        now = now or datetime.now()
+        with self._lock:
+            self._check_day(now.date().isoformat())
+            key = (self.slot_of(now), self._gallery.version)
+            if key != self._cache_key:
+                likely = self._likely_ruts(key[0])
+                likely_set = set(likely)
+                rest, recorded = [], []
+                for rut in self._gallery.ruts():
+                    if rut in self._recorded:
+                        recorded.append(rut)
+                    elif rut not in likely_set:
+                        rest.append(rut)
+                pairs = self._gallery.get_pairs_for(likely + rest + recorded)
+                self._cache_ruts = [rut for rut, _ in pairs]
+                self._cache_prints = [fprint for _, fprint in pairs]
+                self._cache_key = key
+            return list(self._cache_prints)
+
+    def sort_pairs(self, pairs, now=None):
+        """Ordena [(rut, FPrint.Print)] por probabilidad de llegada en la franja de 'now'."""
+        now = now or datetime.now()
+        with self._lock:
+            likely = self._likely_ruts(self.slot_of(now))
+        rank = {rut: i for i, rut in enumerate(likely)}
+        return sorted(pairs, key=lambda pair: rank.get(pair[0], len(rank)))
+
+    def pending_prints(self, pairs):
+        """
+        FPrint.Print de los pares cuyo alumno aún no marca hoy (mantiene el orden). Solo para
+        las etapas parciales: quien ya marcó sigue en la galería completa (ver ordered_prints).
+        """
+        with self._lock:
+            self._check_day(datetime.now().date().isoformat())
+            return [fprint for rut, fprint in pairs if rut not in self._recorded]
+
+    def _on_alumnos_change(self, accion, rut, datos):
+        """Listener registrado en db_utils: cada nueva marcación actualiza el modelo."""
+        if accion == 'marcar' and self.is_loaded:
+            self.note_clocking(rut, datos['fecha'], datos['hora'])
+
+
+_arrival_model = None
+
+def get_arrival_model():
+    """Retorna el modelo de llegadas compartido (se crea y registra la primera vez)."""
+    global _arrival_model
+    gallery = get_gallery()
+    with _gallery_lock:
+        if _arrival_model is None:
+            _arrival_model = ArrivalModel(gallery)
+            register_alumnos_listener(_arrival_model._on_alumnos_change)
+        return _arrival_model
+
+
+# --- GALERÍAS POR ETAPAS ---
+# identify_sync compara contra toda la lista recibida, por lo que el tiempo crece con la
+# cantidad de alumnos. Se intenta primero con una galería candidata pequeña y solo tras
+# un fallo se pasa a la siguiente etapa. libfprint no permite volver a comparar una
+# captura ya tomada, así que la etapa siguiente se usa en el próximo toque del lector
+# (si pasa mucho tiempo, se asume que es otro alumno y se vuelve a la primera etapa).
+# Por eso las etapas parciales son opcionales: un alumno fuera de ellas debe apoyar el
+# dedo más de una vez, y solo conviene cuando la galería completa es lenta.
+STAGE_NAMES = ('recientes', 'curso', 'horario', 'completa')
+
+DEFAULT_GALLERY_SETTINGS = {
+    'etapas': ('completa',),     # Sin etapas parciales: activarlas en config.ini (p.ej. recientes, horario, completa)
+    'cursos': (),                # Cursos que atiende este lector (etapa 'curso')
+    'recientes_max': 300,        # Alumnos identificados recientemente que se recuerdan
+    'ventana_antes_min': 45,     # La etapa 'horario' incluye a quienes su hora máxima
+    'ventana_despues_min': 15,   # de tardanza cae dentro de esta ventana
+    'reinicio_segundos': 15.0,   # Tras este tiempo sin toques se vuelve a la primera etapa
+    'instantanea': 'gallery.snapshot',  # Archivo de la instantánea en disco (vacío = desactivada)
+}
+
+def _parse_list(value):
+    return tuple(item.strip() for item in value.split(',') if item.strip())
+
+def load_gallery_settings():
+    """Lee la sección [Galeria] de config.ini. Los valores ausentes o inválidos usan el valor por defecto."""
+    settings = dict(DEFAULT_GALLERY_SETTINGS)
+    config = configparser.ConfigParser()
+    try:
+        config.read('config.ini')
+        if config.has_option('Galeria', 'etapas'):
+            etapas = tuple(e.lower() for e in _parse_list(config.get('Galeria', 'etapas')))
+            invalid = [e for e in etapas if e not in STAGE_NAMES]
+            if etapas and not invalid:
+                settings['etapas'] = etapas
+            else:
+                print(f"ADVERTENCIA: etapas de galería no válidas {invalid or etapas}. Usando {', '.join(settings['etapas'])}.")
+        if config.has_option('Galeria', 'instantanea'):
+            settings['instantanea'] = config.get('Galeria', 'instantanea').strip()
+        if config.has_option('Galeria', 'cursos'):
+            settings['cursos'] = _parse_list(config.get('Galeria', 'cursos'))
+        for key, getter in (('recientes_max', config.getint), ('ventana_antes_min', config.getint),
+                            ('ventana_despues_min', config.getint), ('reinicio_segundos', config.getfloat)):
+            try:
+                settings[key] = max(0, getter('Galeria', key, fallback=settings[key]))
+            except ValueError:
+                print(f"ADVERTENCIA: El valor de '{key}' en config.ini no es un número. Usando {settings[key]}.")
+    except configparser.Error as e:
+        print(f"ADVERTENCIA: No se pudo leer la sección [Galeria] de config.ini: {e}")
+    # La galería completa siempre es la última etapa para no dejar a nadie sin identificar
+    if settings['etapas'][-1] != 'completa':
+        settings['etapas'] = tuple(e for e in settings['etapas'] if e != 'completa') + ('completa',)
+    return settings
+
+
+class StagedGalleryPlanner:
+    """
+    Decide contra qué galería compara cada captura y lleva estadísticas por etapa
+    (intentos, aciertos y latencia) para evaluar si la partición conviene.
+    Uso: stage, prints = planner.next_gallery(); ...; planner.record(stage, hit, latencia).
+    """
+
+    def __init__(self, gallery, settings=None, arrival_model=None):
+        self._gallery = gallery
+        # Sin modelo de llegadas se usa la galería en su orden original
+        self._arrivals = arrival_model
+        self.settings = settings or load_gallery_settings()
+        self._recent = OrderedDict()  # rut -> None (orden LRU)
+        self._stage_index = 0
+        self._last_attempt = None
+        self._cache = {}
+        self._stats = {name: {'intentos': 0, 'aciertos': 0, 'total_s': 0.0, 'candidatos': 0}
+                       for name in self.settings['etapas']}
+        self._lock = threading.Lock()
+
+    def note_identified(self, rut):
+        """Agrega un RUT al conjunto de alumnos vistos recientemente."""
+        with self._lock:
+            self._recent.pop(rut, None)
+            self._recent[rut] = None
+            while len(self._recent) > self.settings['recientes_max']:
+                self._recent.popitem(last=False)
+
+    def _in_schedule_window(self, entry, now):
+        try:
+            hora_max = datetime.strptime(entry.hora_max_tardanza, '%H:%M:%S').replace(
+                year=now.year, month=now.month, day=now.day)
+        except (TypeError, ValueError):
+            return False
+        return (hora_max - timedelta(minutes=self.settings['ventana_antes_min'])
+                <= now <= hora_max + timedelta(minutes=self.settings['ventana_despues_min']))
+
+    def _pending(self, pairs):
+        if self._arrivals is None:
+            return [fprint for _, fprint in pairs]
+        return self._arrivals.pending_prints(pairs)
+
+    def _stage_prints(self, stage, now):
+        """
+        Galería de una etapa, sin los alumnos que ya marcaron hoy y ordenada por probabilidad
+        de llegada. Las particiones se guardan en caché por minuto y versión de la galería.
+        """
+        if stage == 'completa':
+            if self._arrivals is not None:
+                return self._arrivals.ordered_prints(now)
+            return self._gallery.get_prints()
+        if stage == 'recientes':
+            return self._pending(self._gallery.get_pairs_for(list(reversed(self._recent))))
+        key = (self._gallery.version, now.strftime('%H:%M'))
+        cached_key, pairs = self._cache.get(stage, (None, None))
+        if cached_key != key:
+            if stage == 'curso':
+                cursos = set(self.settings['cursos'])
+                pairs = self._gallery.select(lambda entry: (entry.curso or '').strip() in cursos)
+            else:
+                pairs = self._gallery.select(lambda entry: self._in_schedule_window(entry, now))
+            if self._arrivals is not None:
+                pairs = self._arrivals.sort_pairs(pairs, now)
+            self._cache[stage] = (key, pairs)
+        return self._pending(pairs)
+
+    def next_gallery(self, now=None):
+        """
+        Retorna (etapa, lista de FPrint.Print) para la próxima captura. Se omiten etapas vacías.
+        La lista puede quedar vacía si todos los alumnos ya marcaron hoy.
+        """
+        now = now or datetime.now()
+        if self._arrivals is not None and not self._arrivals.is_loaded:
+            self._arrivals.load_from_db()
+        stages = self.settings['etapas']
+        with self._lock:
+            if (self._last_attempt is None
+                    or time.monotonic() - self._last_attempt > self.settings['reinicio_segundos']):
+                self._stage_index = 0
+            full_prints = self._stage_prints('completa', now)
+            for index in range(self._stage_index, len(stages) - 1):
+                stage = stages[index]
+                prints = self._stage_prints(stage, now)
+                # Una etapa vacía no sirve, y una tan grande como la completa no ahorra nada
+                if prints and len(prints) < len(full_prints):
+                    self._stage_index = index
+                    return stage, prints
+            self._stage_index = len(stages) - 1
+            return 'completa', full_prints
+
+    def record(self, stage, hit, elapsed, rut=None, candidates=0):
+        """Registra el resultado de una captura y avanza (fallo) o reinicia (acierto) las etapas."""
+        with self._lock:
+            stats = self._stats.setdefault(stage, {'intentos': 0, 'aciertos': 0, 'total_s': 0.0, 'candidatos': 0})
+            stats['intentos'] += 1
+            stats['aciertos'] += int(bool(hit))
+            stats['total_s'] += elapsed
+            stats['candidatos'] += candidates
+            self._last_attempt = time.monotonic()
+            stages = self.settings['etapas']
+            if hit or stage == stages[-1]:
+                self._stage_index = 0
+            else:
+                self._stage_index = min(stages.index(stage) + 1, len(stages) - 1)
+        if hit and rut:
+            self.note_identified(rut)
+
+    def reset(self):
+        """Vuelve a la primera etapa (p.ej. tras cancelar una captura)."""
+        with self._lock:
+            self._stage_index = 0
+
+    def get_stats(self):
+        """Estadísticas por etapa: intentos, tasa de acierto, latencia y tamaño promedio de la galería."""
+        with self._lock:
+            result = {}
+            for stage, s in self._stats.items():
+                n = s['intentos']
+                result[stage] = {
+                    'intentos': n,
+                    'aciertos': s['aciertos'],
+                    'tasa_acierto': s['aciertos'] / n if n else 0.0,
+                    'latencia_promedio_s': s['total_s'] / n if n else 0.0,
+                    'candidatos_promedio': s['candidatos'] / n if n else 0.0,
+                }
+            return result
+
+
+_planner = None
+
+def get_gallery_planner():
+    """Retorna el planificador de etapas compartido (se crea la primera vez)."""
+    global _planner
+    gallery = get_gallery()
+    arrival_model = get_arrival_model()
+    with _gallery_lock:
+        if _planner is None:
+            _planner = StagedGalleryPlanner(gallery, arrival_model=arrival_model)
+        return _planner
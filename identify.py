@@ -1,144 +1,270 @@
 # identify.py (FINAL: Lógica de Identificación y Obtención de Nombre)
 import gi
-import base64
 import sys
-import threading # Necesario para usar el objeto Lock
+import time
+from typing import NamedTuple, Optional
 
 gi.require_version('FPrint', '2.0')
 from gi.repository import FPrint, GLib
 
 # Importar funciones de utilidad de la base de datos y la impresora
-from db_utils import get_all_templates, save_clocking, get_alumno_full_name 
-from printer_utils import print_clocking_receipt 
+from db_utils import record_attendance, AttendanceResult
+from printer_utils import get_print_spooler
+from gallery_utils import get_gallery, get_gallery_planner
+from device_utils import FingerprintDeviceSession, is_cancelled_error
+from metrics_utils import get_latency_recorder
 
-def identify_user_automatically(fprint_context, rut_to_verify=None, lock=None):
+def _timed_from_finger(device, operation):
     """
-    Captura una huella, la compara contra todas las plantillas almacenadas 
-    en SQLite (o contra una sola si se proporciona rut_to_verify), 
+    Ejecuta 'operation()' (una llamada *_sync del lector) midiendo la latencia desde que se
+    apoya el dedo (si el driver informa 'finger-status'); si no, desde que se arma el lector.
+    Retorna (resultado de la operación, segundos).
+    """
+    finger_at = []
+    def _on_finger_status(dev, pspec):
+        try:
+            if not finger_at and dev.props.finger_status & FPrint.FingerStatusFlags.PRESENT:
+                finger_at.append(time.perf_counter())
+        except Exception:
+            pass
+    try:
+        handler = device.connect('notify::finger-status', _on_finger_status)
+    except Exception:
+        handler = None
+    start = time.perf_counter()
+    try:
+        result = operation()
+    finally:
+        if handler is not None:
+            device.disconnect(handler)
+    return result, time.perf_counter() - (finger_at[0] if finger_at else start)
+
+def _timed_identify(device, prints, cancellable=None):
+    """identify_sync con latencia medida. Retorna (match, captura, segundos)."""
+    (matched_fprint, captured), elapsed = _timed_from_finger(
+        device, lambda: device.identify_sync(prints, cancellable))
+    return matched_fprint, captured, elapsed
+
+class VerificationResult(NamedTuple):
+    """Resultado de una verificación 1:1."""
+    rut: str
+    coincide: bool
+    latencia_s: float                            # Desde que se apoya el dedo hasta la decisión
+    resultado: Optional[AttendanceResult] = None # Marcación registrada (solo si coincide)
+
+def verify_user(rut, session=None, fprint_context=None, lock=None, cancellable=None):
+    """
+    Verificación 1:1 rápida: usa solo la plantilla del RUT (desde la galería en memoria o,
+    si no está cargada, una única lectura por índice), la compara con verify_sync y,
+    si coincide, registra la marcación y encola el ticket.
+    libfprint no entrega un puntaje numérico en la verificación: se informa la
+    coincidencia y la latencia.
+    Retorna un VerificationResult, o None si no hay plantilla o falló el lector.
+    """
+    metrics = get_latency_recorder()
+    with metrics.span('verificar/load_print'):
+        template_fprint = get_gallery().load_print(rut)
+    if template_fprint is None:
+        print(f"No se encontró plantilla para el RUT: {rut}")
+        return None
+
+    own_session = session is None
+    if own_session:
+        if not fprint_context:
+            print("ERROR: No se proporcionó un contexto de FPrint.")
+            return None
+        session = FingerprintDeviceSession(fprint_context, lock)
+
+    try:
+        with session.operation('verificar') as device:
+            print(f"\n=== INICIO DE VERIFICACIÓN 1:1 PARA RUT: {rut} ===")
+            print("Coloque el dedo para verificar su identidad...")
+            (match, captured), elapsed = _timed_from_finger(
+                device, lambda: device.verify_sync(template_fprint, cancellable))
+            metrics.record('verificar/verify_sync', elapsed, coincide=bool(match))
+    except Exception as e:
+        print(f"Error durante la verificación: {e}")
+        return None
+    finally:
+        if own_session:
+            session.close()
+
+    if not match:
+        print(f"VERIFICACIÓN FALLIDA. La huella no coincide con el RUT: {rut} (latencia: {elapsed:.2f} s)")
+        return VerificationResult(rut, False, elapsed)
+
+    print(f"\n¡VERIFICACIÓN EXITOSA! RUT: {rut} (latencia: {elapsed:.2f} s).")
+    with metrics.span('verificar/record_attendance'):
+        result = record_attendance(rut)
+    if result is None:
+        print(f"ERROR: No se pudo registrar la marcación para el RUT: {rut}")
+        return VerificationResult(rut, True, elapsed)
+    print(f"Marcación de asistencia registrada en la base de datos. Estado: {result.estado}, Atrasos: {result.num_atrasos}")
+    with metrics.span('verificar/encolar_ticket'):
+        get_print_spooler().submit(result.rut, result.nombre, result.num_atrasos, result.max_atrasos_warning)
+    return VerificationResult(rut, True, elapsed, result)
+
+def identify_user_automatically(fprint_context, rut_to_verify=None, lock=None, session=None):
+    """
+    Captura una huella, la compara contra las plantillas de la galería 
+    en memoria (o verifica 1:1 con verify_user si se proporciona rut_to_verify), 
     y si es exitosa, registra la marcación e imprime un ticket.
     
     Args:
-        fprint_context: Contexto de FPrint
+        fprint_context: Contexto de FPrint (solo se usa si no se pasa 'session')
         rut_to_verify: (Opcional) RUT específico para verificación 1:1. 
                        Si es None, hace identificación 1:N contra todos.
         lock: (Opcional) Objeto threading.Lock para sincronización del hardware.
+        session: (Opcional) FingerprintDeviceSession con el lector ya abierto.
+                 Si es None, se abre y cierra el lector solo para esta identificación.
     """
     
-    templates_data = get_all_templates()
-    
-    if not templates_data:
+    if rut_to_verify:
+        # Verificación 1:1: camino rápido con una sola plantilla (ver verify_user)
+        verification = verify_user(rut_to_verify, session=session, fprint_context=fprint_context, lock=lock)
+        if verification and verification.coincide and verification.resultado:
+            return rut_to_verify
+        return None
+
+    # Las plantillas ya deserializadas viven en la galería en memoria (se construye una sola vez)
+    metrics = get_latency_recorder()
+    gallery = get_gallery()
+    with metrics.span('galeria/ensure_loaded'):
+        gallery.ensure_loaded()
+
+    if not len(gallery):
         print("No hay usuarios registrados para realizar la identificación.")
         return False
 
-    if not fprint_context:
-        print("ERROR: No se proporcionó un contexto de FPrint.")
-        return None
-
-    # Si no se proporciona un lock, creamos uno localmente (menos seguro, pero evita fallos)
-    if lock is None:
-        lock = threading.Lock()
+    planner = get_gallery_planner()
+    own_session = session is None
+    if own_session:
+        if not fprint_context:
+            print("ERROR: No se proporcionó un contexto de FPrint.")
+            return None
+        # Sin sesión compartida: sesión temporal (el lector se cierra al terminar)
+        session = FingerprintDeviceSession(fprint_context, lock)
         
-    device = None
+    ticket = None
     
-    # Bloqueo para asegurar el acceso exclusivo al dispositivo USB
-    with lock:
-        try:
-            if rut_to_verify:
-                print(f"\n=== INICIO DE VERIFICACIÓN 1:1 PARA RUT: {rut_to_verify} ===")
-            else:
-                print("\n=== INICIO DE IDENTIFICACIÓN AUTOMÁTICA ===")
-            
-            devices = fprint_context.get_devices()
-            if not devices:
-                print("ERROR: No se encontró ningún dispositivo de huella dactilar.")
-                return None
-
-            device = devices[0]
-            device.open_sync()
+    try:
+        # La sesión toma el lock del lector y entrega el dispositivo ya abierto
+        with session.operation('identificar') as device:
+            print("\n=== INICIO DE IDENTIFICACIÓN AUTOMÁTICA ===")
 
-            # 1. Crear una lista de objetos FPrint.Print
-            fprints_to_check = []
-            
-            if rut_to_verify:
-                # Verificación 1:1 - Solo cargar la plantilla del RUT específico
-                if rut_to_verify not in templates_data:
-                    print(f"No se encontró plantilla para el RUT: {rut_to_verify}")
-                    device.close_sync()
-                    return None
-                
-                template_b64 = templates_data[rut_to_verify]
-                try:
-                    stored_data = base64.b64decode(template_b64)
-                    template_fprint = FPrint.Print.deserialize(stored_data)
-                    template_fprint.set_username(rut_to_verify)
-                    fprints_to_check.append(template_fprint)
-                except Exception as e:
-                    print(f"Error: No se pudo cargar la plantilla para {rut_to_verify}. Error: {e}")
-                    device.close_sync()
+            # 1. Identificación 1:N - Galería candidata de la etapa actual. Un fallo en una galería
+            # parcial no es un rechazo: se pide otro toque, comparado contra la etapa siguiente
+            while True:
+                with metrics.span('identificar/galeria_candidata'):
+                    stage, fprints_to_check = planner.next_gallery()
+                if not fprints_to_check:
+                    print("Todos los alumnos enrolados ya registraron asistencia hoy.")
                     return None
-            else:
-                # Identificación 1:N - Cargar todas las plantillas
-                for rut, template_b64 in templates_data.items():
-                    try:
-                        stored_data = base64.b64decode(template_b64)
-                        template_fprint = FPrint.Print.deserialize(stored_data)
-                        template_fprint.set_username(rut)
-                        fprints_to_check.append(template_fprint)
-                    except Exception as e:
-                        print(f"Advertencia: No se pudo cargar la plantilla para {rut}. Error: {e}")
-            
-            if rut_to_verify:
-                print(f"Coloque el dedo para verificar su identidad...")
-            else:
+
                 print(f"Coloque el dedo para la identificación (comparando contra {len(fprints_to_check)} usuarios)...")
 
-            # 2. El método identify_sync captura y compara la huella
-            matched_fprint, score = device.identify_sync(fprints_to_check)
-            
-            device.close_sync()
+                # 2. El método identify_sync captura y compara la huella
+                matched_fprint, score, elapsed = _timed_identify(device, fprints_to_check)
+                identified_at = time.perf_counter()
+                metrics.record('identificar/identify_sync', elapsed, etapa_galeria=stage,
+                               candidatos=len(fprints_to_check), coincide=matched_fprint is not None)
+                planner.record(stage, matched_fprint is not None, elapsed,
+                               matched_fprint.get_username() if matched_fprint else None, len(fprints_to_check))
+                if matched_fprint or stage == 'completa':
+                    break
+                print(f"Procesando... (sin coincidencia en la etapa '{stage}'). Apoye el dedo de nuevo.")
             
             if matched_fprint:
                 identified_rut = matched_fprint.get_username()
                 print(f"\n¡IDENTIFICACIÓN EXITOSA! RUT: {identified_rut} (Puntuación: {score}).")
                 
-                # 3. Obtener el nombre completo para el recibo
-                full_name = get_alumno_full_name(identified_rut) 
-                
-                # 4. Lógica de MARCACIÓN (Almacenar en la BD)
-                estado, hora, num_atrasos, max_atrasos_warning = save_clocking(
-                    identified_rut
-                )
-                print(f"Marcación de asistencia registrada en la base de datos. Estado: {estado}, Atrasos: {num_atrasos}")
-                
-                # ELIMINADO: Ya no es necesario el time.sleep(1)
-
-                # 5. Lógica de IMPRESIÓN (Pasando el nombre completo y los atrasos)
-                if print_clocking_receipt(full_name, num_atrasos, max_atrasos_warning):
-                    print(f"Ticket de marcación impreso para {full_name}.")
-                else:
-                    print("No se pudo imprimir el ticket. Revisar la configuración de la impresora.")
+                # 3-4. Lógica de MARCACIÓN: nombre, estado, inserción y contador en una sola transacción
+                with metrics.span('identificar/record_attendance'):
+                    result = record_attendance(identified_rut)
+                if result is None:
+                    print(f"ERROR: No se pudo registrar la marcación para el RUT: {identified_rut}")
+                    return None
+                print(f"Marcación de asistencia registrada en la base de datos. Estado: {result.estado}, Atrasos: {result.num_atrasos}")
                 
-                return identified_rut
+                # El ticket se imprime fuera del lock (ver paso 5)
+                ticket = (result.rut, result.nombre, result.num_atrasos, result.max_atrasos_warning)
             else:
-                if rut_to_verify:
-                    print(f"VERIFICACIÓN FALLIDA. La huella no coincide con el RUT: {rut_to_verify}")
-                else:
-                    print(f"IDENTIFICACIÓN FALLIDA. La huella no pertenece a ningún usuario registrado.")
+                print(f"IDENTIFICACIÓN FALLIDA. La huella no pertenece a ningún usuario registrado.")
                 return None
+        # El lock se libera al salir del bloque 'with', apenas queda guardada la marcación
             
-        except Exception as e:
-            print(f"Error durante la identificación: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
-        finally:
-            try:
-                # Cierre de emergencia si la excepción ocurrió antes del close_sync
-                if device and device.is_opened():
-                    device.close_sync()
-            except:
-                pass
-    # El lock se libera automáticamente al salir del bloque 'with lock:'
+    except Exception as e:
+        print(f"Error durante la identificación: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+    finally:
+        if own_session:
+            session.close()
+
+    # 5. Lógica de IMPRESIÓN: se delega a la cola de impresión para no retener al siguiente alumno
+    with metrics.span('identificar/encolar_ticket'):
+        get_print_spooler().submit(*ticket)
+    # Desde que se apoyó el dedo hasta que el ticket quedó en cola
+    metrics.record('identificar/total', elapsed + time.perf_counter() - identified_at)
+    print(f"Ticket de marcación enviado a la cola de impresión para {ticket[1]}.")
+    return identified_rut
+
+class ScanOutcome(NamedTuple):
+    """Resultado de un escaneo del modo kiosco."""
+    evento: str                                 # 'marcado', 'enfriamiento', 'reintentar', 'no_reconocido', 'sin_usuarios', 'cancelado' o 'error'
+    rut: Optional[str] = None
+    resultado: Optional[AttendanceResult] = None
+    mensaje: str = ''
+
+def identify_and_clock(session, cancellable=None, in_cooldown=None):
+    """
+    Un ciclo del modo kiosco: identificación 1:N con el lector compartido, marcación e impresión.
+    'cancellable' (Gio.Cancellable) permite interrumpir la espera del dedo para pausar el kiosco.
+    'in_cooldown(rut)' evita volver a marcar a un alumno que acaba de ser identificado.
+    Retorna un ScanOutcome.
+    """
+    metrics = get_latency_recorder()
+    gallery = get_gallery()
+    with metrics.span('galeria/ensure_loaded'):
+        gallery.ensure_loaded()
+    if not len(gallery):
+        return ScanOutcome('sin_usuarios', mensaje="No hay usuarios registrados para realizar la identificación.")
+
+    planner = get_gallery_planner()
+    with metrics.span('identificar/galeria_candidata'):
+        stage, fprints_to_check = planner.next_gallery()
+    if not fprints_to_check:
+        return ScanOutcome('sin_usuarios', mensaje="Todos los alumnos enrolados ya registraron asistencia hoy.")
+    try:
+        with session.operation('identificar') as device:
+            matched_fprint, score, elapsed = _timed_identify(device, fprints_to_check, cancellable)
+            identified_at = time.perf_counter()
+            metrics.record('identificar/identify_sync', elapsed, etapa_galeria=stage,
+                           candidatos=len(fprints_to_check), coincide=matched_fprint is not None)
+            identified_rut = matched_fprint.get_username() if matched_fprint else None
+            planner.record(stage, matched_fprint is not None, elapsed, identified_rut, len(fprints_to_check))
+            if not matched_fprint:
+                if stage != 'completa':
+                    # Solo se descartó una galería parcial: el próximo toque usa la etapa siguiente
+                    return ScanOutcome('reintentar', mensaje=f"Sin coincidencia en la etapa '{stage}'. Procesando, apoye el dedo de nuevo.")
+                return ScanOutcome('no_reconocido', mensaje="La huella no pertenece a ningún usuario registrado.")
+            if in_cooldown and in_cooldown(identified_rut):
+                return ScanOutcome('enfriamiento', identified_rut)
+            with metrics.span('identificar/record_attendance'):
+                result = record_attendance(identified_rut)
+    except Exception as e:
+        if is_cancelled_error(e):
+            planner.reset()
+            return ScanOutcome('cancelado')
+        return ScanOutcome('error', mensaje=f"Error durante la identificación: {e}")
+
+    if result is None:
+        return ScanOutcome('error', identified_rut, mensaje=f"No se pudo registrar la marcación para el RUT: {identified_rut}")
+    with metrics.span('identificar/encolar_ticket'):
+        get_print_spooler().submit(result.rut, result.nombre, result.num_atrasos, result.max_atrasos_warning)
+    metrics.record('identificar/total', elapsed + time.perf_counter() - identified_at)
+    return ScanOutcome('marcado', identified_rut, result)
 
 if __name__ == "__main__":
     # Nota: Si se ejecuta directamente, el lock no se pasará, pero FPrint lo maneja bien en CLI.
@@ -0,0 +1,193 @@
+# kiosk_utils.py (Modo kiosco: identificación continua sin presionar botones)
+import configparser
+import queue
+import threading
+import time
+
+try:
+    import gi
+    gi.require_version('Gio', '2.0')
+    from gi.repository import Gio
+except (ValueError, ImportError):
+    Gio = None
+    print("WARNING: 'Gio' no está disponible. El modo kiosco no podrá pausarse a mitad de una captura.")
+
+from identify import identify_and_clock
+from task_utils import current_token
+
+# Valores por defecto de la sección [Kiosco] de config.ini
+DEFAULT_KIOSK_SETTINGS = {
+    'auto_scan': False,           # Mantener el lector armado mientras se muestra el menú principal (opcional)
+    'cooldown_seconds': 60.0,     # Tiempo en que se ignora a un alumno recién marcado (evita dobles marcaciones)
+    'error_backoff_seconds': 2.0, # Espera tras un error del lector antes de volver a armarlo
+    'poll_interval_ms': 100,      # Frecuencia con que la GUI revisa los resultados
+}
+
+def load_kiosk_settings():
+    """Lee la sección [Kiosco] de config.ini. Los valores ausentes o inválidos usan el valor por defecto."""
+    settings = dict(DEFAULT_KIOSK_SETTINGS)
+    config = configparser.ConfigParser()
+    try:
+        config.read('config.ini')
+        try:
+            settings['auto_scan'] = config.getboolean('Kiosco', 'auto_scan', fallback=settings['auto_scan'])
+        except ValueError:
+            print(f"ADVERTENCIA: El valor de 'auto_scan' en config.ini no es válido. Usando {settings['auto_scan']}.")
+        for key in ('cooldown_seconds', 'error_backoff_seconds'):
+            try:
+                settings[key] = max(0.0, config.getfloat('Kiosco', key, fallback=settings[key]))
+            except ValueError:
+                print(f"ADVERTENCIA: El valor de '{key}' en config.ini no es un número. Usando {settings[key]}.")
+        try:
+            settings['poll_interval_ms'] = max(10, config.getint('Kiosco', 'poll_interval_ms', fallback=settings['poll_interval_ms']))
+        except ValueError:
+            print(f"ADVERTENCIA: El valor de 'poll_interval_ms' en config.ini no es un entero. Usando {settings['poll_interval_ms']}.")
+    except configparser.Error as e:
+        print(f"ADVERTENCIA: No se pudo leer la sección [Kiosco] de config.ini: {e}")
+    return settings
+
+
+class AutoScanWorker:
+    """
+    Mantiene identify_sync armado: apenas termina un escaneo, encola el siguiente en la
+    cola 'hardware' del TaskExecutor de la GUI. Cada escaneo es una tarea aparte, así que
+    mientras el kiosco está en pausa no ocupa ningún hilo y el lector queda libre para las
+    tareas de enrolamiento o verificación. Los resultados (ScanOutcome) se dejan en la cola
+    'results', que la GUI vacía desde el hilo de Tkinter con after().
+    - Un alumno recién marcado se ignora durante 'cooldown_seconds'.
+    - pause() cancela la captura en curso (Gio.Cancellable) y libera el lector para las
+      pantallas de administración, enrolamiento o verificación; resume() lo vuelve a armar.
+    El worker se crea en pausa.
+    """
+
+    def __init__(self, session, executor, cooldown_seconds=DEFAULT_KIOSK_SETTINGS['cooldown_seconds'],
+                 error_backoff=DEFAULT_KIOSK_SETTINGS['error_backoff_seconds'],
+                 scan_func=None, cancellable_factory=None, clock=None):
+        self._session = session
+        self._executor = executor
+        self._cooldown = cooldown_seconds
+        self._error_backoff = error_backoff
+        # 'scan_func', 'cancellable_factory' y 'clock' permiten inyectar mocks en pruebas
+        self._scan_func = scan_func or identify_and_clock
+        self._cancellable_factory = cancellable_factory or (Gio.Cancellable if Gio else (lambda: None))
+        self._clock = clock or time.monotonic
+        self.results = queue.Queue()
+        self._recent = {}  # rut -> instante (clock) de su última marcación
+        self._cond = threading.Condition()
+        self._handle = None            # Tarea de escaneo encolada o en curso
+        self._idle = threading.Event()  # Sin escaneo en curso
+        self._idle.set()
+        self._cancellable = None
+        self._last_failure = None
+        self._paused = True
+        self._running = False
+
+    @property
+    def is_paused(self):
+        return self._paused
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._schedule()
+
+    def stop(self, timeout=2.0):
+        """Cancela la captura en curso y espera (a lo más 'timeout' segundos) a que termine."""
+        with self._cond:
+            self._running = False
+            self._cancel_current()
+            self._cond.notify_all()
+        self._idle.wait(timeout)
+
+    def pause(self):
+        """Detiene el escaneo automático y cancela la captura en curso."""
+        with self._cond:
+            if self._paused:
+                return
+            self._paused = True
+            self._cancel_current()
+            self._cond.notify_all()
+
+    def resume(self):
+        """Vuelve a armar el lector."""
+        with self._cond:
+            if not self._paused:
+                return
+            self._paused = False
+            self._schedule()
+
+    def _schedule(self):
+        # Llamar con self._cond tomado. Nunca hay más de un escaneo encolado o en curso.
+        if self._handle is not None or not self._running or self._paused:
+            return
+        try:
+            self._handle = self._executor.submit('hardware', self._scan_once, name='escaneo_kiosco')
+        except RuntimeError:
+            # El ejecutor ya se detuvo (cierre de la aplicación)
+            self._running = False
+
+    def _cancel_current(self):
+        if self._cancellable is not None:
+            try:
+                self._cancellable.cancel()
+            except Exception:
+                pass
+
+    def _in_cooldown(self, rut):
+        last = self._recent.get(rut)
+        return last is not None and self._clock() - last < self._cooldown
+
+    def _mark_clocked(self, rut):
+        now = self._clock()
+        self._recent[rut] = now
+        # Purgar los RUT cuyo enfriamiento ya venció para que el diccionario no crezca
+        for old_rut in [r for r, t in self._recent.items() if now - t >= self._cooldown]:
+            del self._recent[old_rut]
+
+    def _scan_once(self):
+        """Un escaneo (tarea de la cola 'hardware'); al terminar encola el siguiente."""
+        try:
+            with self._cond:
+                # Se pausó o detuvo mientras la tarea esperaba en la cola
+                if not self._running or self._paused:
+                    return
+                cancellable = self._cancellable_factory()
+                self._cancellable = cancellable
+                self._idle.clear()
+            token = current_token()
+            if token is not None:
+                # Al cerrar el ejecutor (shutdown) también se interrumpe la espera del dedo
+                token.on_cancel(self._cancel_current)
+            self._handle_outcome(self._scan(cancellable))
+        finally:
+            with self._cond:
+                self._cancellable = None
+                self._handle = None
+                self._idle.set()
+                self._schedule()
+
+    def _scan(self, cancellable):
+        try:
+            return self._scan_func(self._session, cancellable, self._in_cooldown)
+        except Exception as e:
+            print(f"KIOSCO: Error inesperado en el escaneo automático: {e}")
+            return None
+
+    def _handle_outcome(self, outcome):
+        if outcome is None or outcome.evento in ('error', 'sin_usuarios'):
+            # Un mismo problema repetido se informa una sola vez
+            if outcome is not None and outcome != self._last_failure:
+                self.results.put(outcome)
+            self._last_failure = outcome
+            # Esperar antes de reintentar (se interrumpe si se pausa o detiene el worker)
+            with self._cond:
+                if self._running and not self._paused:
+                    self._cond.wait(self._error_backoff)
+            return
+        self._last_failure = None
+        if outcome.evento == 'marcado':
+            self._mark_clocked(outcome.rut)
+        if outcome.evento != 'cancelado':
+            self.results.put(outcome)
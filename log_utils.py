@@ -0,0 +1,141 @@
+# log_utils.py (Registro de mensajes de la aplicación: panel en pantalla y archivo rotativo)
+import configparser
+import logging
+import logging.handlers
+import queue
+import tkinter as tk
+from datetime import datetime
+
+DEFAULT_LOG_SETTINGS = {
+    'archivo': 'marcador.log',  # Vacío = sin archivo
+    'tamano_max_kb': 1024,
+    'respaldos': 5,
+    'lineas_pantalla': 500,
+}
+
+PUMP_INTERVAL_MS = 100  # Cada cuánto se pasan los mensajes pendientes al panel
+PUMP_BATCH = 200        # Máximo de mensajes por pasada (el resto queda para la siguiente)
+LOGGER_NAME = 'marcador'
+
+
+def load_log_settings():
+    """Lee la sección [Registro] de config.ini. Los valores ausentes o inválidos usan el valor por defecto."""
+    settings = dict(DEFAULT_LOG_SETTINGS)
+    config = configparser.ConfigParser()
+    try:
+        config.read('config.ini')
+        if config.has_option('Registro', 'archivo'):
+            settings['archivo'] = config.get('Registro', 'archivo').strip()
+        for key in ('tamano_max_kb', 'respaldos', 'lineas_pantalla'):
+            try:
+                settings[key] = max(1, config.getint('Registro', key, fallback=settings[key]))
+            except ValueError:
+                print(f"ADVERTENCIA: El valor de '{key}' en config.ini no es un número. Usando {settings[key]}.")
+    except configparser.Error as e:
+        print(f"ADVERTENCIA: No se pudo leer la sección [Registro] de config.ini: {e}")
+    return settings
+
+
+class LogPanel:
+    """
+    Registro de mensajes seguro para cualquier hilo.
+    log() solo encola el mensaje: un bombeo periódico con after() en el hilo de Tk los
+    inserta en el widget por lotes, y el widget conserva como máximo 'max_lines' líneas
+    (las más antiguas se descartan). Si hay archivo, cada mensaje también se escribe en
+    un RotatingFileHandler desde el hilo de un QueueListener, sin bloquear al que llama.
+    """
+
+    def __init__(self, widget, max_lines=DEFAULT_LOG_SETTINGS['lineas_pantalla'], file_path=None,
+                 max_bytes=DEFAULT_LOG_SETTINGS['tamano_max_kb'] * 1024,
+                 backups=DEFAULT_LOG_SETTINGS['respaldos']):
+        self._widget = widget
+        self._max_lines = max_lines
+        self._queue = queue.SimpleQueue()
+        self._lines = int(widget.index('end-1c').split('.')[0]) - 1
+        self._after_id = None
+        self._listener = None
+        self._logger = None
+        self._queue_handler = None
+        if file_path:
+            self._start_file(file_path, max_bytes, backups)
+
+    @classmethod
+    def from_settings(cls, widget, settings=None):
+        settings = settings or load_log_settings()
+        return cls(widget, settings['lineas_pantalla'], settings['archivo'],
+                   settings['tamano_max_kb'] * 1024, settings['respaldos'])
+
+    def _start_file(self, file_path, max_bytes, backups):
+        try:
+            handler = logging.handlers.RotatingFileHandler(file_path, maxBytes=max_bytes,
+                                                           backupCount=backups, encoding='utf-8')
+        except OSError as e:
+            print(f"ADVERTENCIA: No se pudo abrir el archivo de registro {file_path}: {e}. Solo se mostrará en pantalla.")
+            return
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', '%Y-%m-%d %H:%M:%S'))
+        records = queue.SimpleQueue()
+        self._queue_handler = logging.handlers.QueueHandler(records)
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._logger.addHandler(self._queue_handler)
+        self._listener = logging.handlers.QueueListener(records, handler)
+        self._listener.start()
+
+    def log(self, message):
+        """Encola un mensaje (se puede llamar desde cualquier hilo)."""
+        self._queue.put(f"{datetime.now().strftime('[%H:%M:%S]')} {message}")
+        if self._logger is not None:
+            self._logger.info(message)
+
+    def start(self):
+        """Inicia el bombeo periódico hacia el widget (llamar desde el hilo de Tk)."""
+        if self._after_id is None:
+            self._after_id = self._widget.after(PUMP_INTERVAL_MS, self._pump)
+
+    def _pump(self):
+        self._after_id = None
+        try:
+            if not self._widget.winfo_exists():
+                return
+        except tk.TclError:
+            return
+        batch = []
+        while len(batch) < PUMP_BATCH:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._append(batch)
+        self.start()
+
+    def _append(self, batch):
+        # Un solo insert, un solo recorte y un solo see() por lote
+        widget = self._widget
+        widget.config(state='normal')
+        widget.insert(tk.END, "\n".join(batch) + "\n")
+        self._lines += sum(message.count("\n") + 1 for message in batch)
+        excess = self._lines - self._max_lines
+        if excess > 0:
+            widget.delete('1.0', f'{excess + 1}.0')
+            self._lines -= excess
+        widget.see(tk.END)
+        widget.config(state='disabled')
+
+    def close(self):
+        """Detiene el bombeo y escribe en el archivo los mensajes pendientes."""
+        if self._after_id is not None:
+            try:
+                self._widget.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+            self._after_id = None
+        if self._logger is not None:
+            self._logger.removeHandler(self._queue_handler)
+            self._logger = None
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
@@ -0,0 +1,155 @@
+# metrics_utils.py (Latencias por etapa de identificación, enrolamiento e impresión)
+import configparser
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+# Histograma con cubetas geométricas: memoria constante sin importar cuántas marcaciones
+# haya en el día y percentiles con un error relativo de a lo más un 5%.
+HISTOGRAM_MIN_S = 0.0001   # 0,1 ms
+HISTOGRAM_MAX_S = 300.0    # Un enrolamiento completo puede tardar minutos
+HISTOGRAM_GROWTH = 1.05
+_LOG_GROWTH = math.log(HISTOGRAM_GROWTH)
+_BUCKETS = int(math.ceil(math.log(HISTOGRAM_MAX_S / HISTOGRAM_MIN_S) / _LOG_GROWTH)) + 1
+
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """Cuenta duraciones (en segundos) por cubeta y estima percentiles."""
+    __slots__ = ('counts', 'count', 'total_s', 'max_s')
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def add(self, seconds):
+        if seconds <= HISTOGRAM_MIN_S:
+            index = 0
+        else:
+            index = min(_BUCKETS - 1, int(math.log(seconds / HISTOGRAM_MIN_S) / _LOG_GROWTH) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+
+    def percentile(self, p):
+        """Límite superior de la cubeta que contiene el percentil 'p' (nunca mayor al máximo observado)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100.0))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.max_s, HISTOGRAM_MIN_S * HISTOGRAM_GROWTH ** index)
+        return self.max_s
+
+    def summary(self):
+        data = {'n': self.count, 'promedio_s': self.total_s / self.count if self.count else 0.0,
+                'max_s': self.max_s}
+        for p in PERCENTILES:
+            data[f'p{p}_s'] = self.percentile(p)
+        return data
+
+
+class LatencyRecorder:
+    """
+    Registra la duración de cada etapa ('identificar/identify_sync', 'enrolar/save_template', ...)
+    en un histograma del día. Opcionalmente agrega cada medición como una línea JSON a un
+    archivo de traza para analizarla después.
+    Uso:
+        with recorder.span('identificar/record_attendance'):
+            record_attendance(rut)
+        recorder.record('identificar/identify_sync', segundos)  # latencia ya medida
+    """
+
+    def __init__(self, trace_path=None, today=date.today):
+        self._today = today
+        self._day = today()
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._trace_path = trace_path or None
+        self._trace_file = None
+        self._trace_lock = threading.Lock()
+
+    def record(self, stage, seconds, **attrs):
+        """Agrega una duración a la etapa 'stage'. 'attrs' solo se escriben en la traza."""
+        day = self._today()
+        with self._lock:
+            if day != self._day:
+                # Los percentiles son del día en curso
+                self._day = day
+                self._histograms = {}
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.add(seconds)
+        if self._trace_path:
+            self._write_trace(stage, seconds, attrs)
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        """Mide el bloque y lo registra en 'stage' (también si lanza una excepción)."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            attrs['error'] = True
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, **attrs)
+
+    def _write_trace(self, stage, seconds, attrs):
+        line = json.dumps(dict(attrs, ts=datetime.now().isoformat(timespec='milliseconds'),
+                               etapa=stage, ms=round(seconds * 1000, 3)), ensure_ascii=False, default=str)
+        with self._trace_lock:
+            try:
+                if self._trace_file is None:
+                    # Con buffer de línea cada medición queda en disco aunque la app se cierre mal
+                    self._trace_file = open(self._trace_path, 'a', encoding='utf-8', buffering=1)
+                self._trace_file.write(line + '\n')
+            except OSError as e:
+                print(f"MÉTRICAS: No se pudo escribir la traza {self._trace_path}: {e}. Traza desactivada.")
+                self._trace_path = None
+
+    def get_summary(self):
+        """Percentiles del día por etapa: {etapa: {'n', 'p50_s', 'p95_s', 'p99_s', 'promedio_s', 'max_s'}}."""
+        with self._lock:
+            if self._today() != self._day:
+                return {}
+            return {stage: histogram.summary() for stage, histogram in sorted(self._histograms.items())}
+
+    def close(self):
+        with self._trace_lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+
+
+def load_metrics_settings():
+    """Lee la sección [Metricas] de config.ini ('traza' vacía = sin archivo de traza)."""
+    config = configparser.ConfigParser()
+    try:
+        config.read('config.ini')
+        return {'traza': config.get('Metricas', 'traza', fallback='').strip()}
+    except configparser.Error as e:
+        print(f"ADVERTENCIA: No se pudo leer la sección [Metricas] de config.ini: {e}")
+        return {'traza': ''}
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+def get_latency_recorder():
+    """Retorna el registro de latencias compartido del proceso."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = LatencyRecorder(load_metrics_settings()['traza'])
+        return _recorder
@@ -1,7 +1,12 @@
 # printer_utils.py
 from escpos.printer.usb import Usb # Usamos Usb para el modelo TM-T20II típico
 from datetime import datetime
+from collections import OrderedDict
 import configparser
+import threading
+import time
+
+from metrics_utils import get_latency_recorder
 
 # --- LEER CONFIGURACIÓN DE LA IMPRESORA DESDE config.ini ---
 config = configparser.ConfigParser()
@@ -15,47 +20,331 @@ except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
     VENDOR_ID = 0x04b8  # Valor por defecto para Epson
     PRODUCT_ID = 0x0e15 # Valor por defecto para TM-T20II
 
+# --- PLANTILLA DE TICKET PRE-COMPILADA ---
+# Cada p.set()/p.text() es una escritura USB distinta. Las partes fijas del ticket se
+# compilan una sola vez a bytes ESC/POS con la impresora virtual Dummy de python-escpos;
+# al imprimir solo se generan los campos variables y se envía todo en una única escritura.
+SEPARATOR = "--------------------------------"
+
+def _compile_escpos(build):
+    """Ejecuta 'build(d)' sobre una impresora Dummy y retorna los bytes ESC/POS generados."""
+    # Importación diferida: solo se necesita al compilar el ticket, no al importar el módulo
+    from escpos.printer.dummy import Dummy
+    d = Dummy()
+    build(d)
+    return d.output
+
+class TicketTemplate:
+    """Bloques de bytes del ticket de marcación: encabezado, advertencia y pie (incluye el corte)."""
+
+    def __init__(self):
+        def _header(d):
+            d.set(align='center', double_width=True, double_height=True)
+            d.text("REGISTRO DE ASISTENCIA\n")
+            d.set(align='center', double_width=False, double_height=False)
+            d.text(SEPARATOR + "\n")
+            d.set(align='left')
+
+        def _warning(d):
+            d.set(align='center', bold=True)
+            d.text("\n*** ADVERTENCIA: LIMITE ALCANZADO ***\n")
+            d.set(align='left', bold=False)
+
+        def _footer(d):
+            d.text("\n")
+            d.text("¡Marcación Exitosa!\n")
+            d.cut()
+
+        self.header = _compile_escpos(_header)
+        self.warning = _compile_escpos(_warning)
+        self.footer = _compile_escpos(_footer)
+
+    def render(self, username, num_atrasos, max_atrasos_warning, now=None):
+        """Arma el ticket completo (bytes) agregando solo los campos dinámicos."""
+        now = now or datetime.now()
+        # Los campos dinámicos también pasan por Dummy para respetar la codificación (tildes, ñ)
+        body = _compile_escpos(lambda d: d.text(
+            f"USUARIO: {username.upper()}\n"
+            f"FECHA:   {now.strftime('%d/%m/%Y')}\n"
+            f"HORA:    {now.strftime('%H:%M:%S')}\n"
+            f"ATRASOS ACUMULADOS: {num_atrasos}\n"
+        ))
+        parts = [self.header, body]
+        if num_atrasos >= max_atrasos_warning:
+            parts.append(self.warning)
+        parts.append(self.footer)
+        return b"".join(parts)
+
+_ticket_template = None
+
+def get_ticket_template():
+    """Retorna la plantilla de ticket compilada (se construye la primera vez)."""
+    global _ticket_template
+    if _ticket_template is None:
+        _ticket_template = TicketTemplate()
+    return _ticket_template
+
+
+# --- SESIÓN PERSISTENTE CON LA IMPRESORA ---
+PRINTER_HEALTH_INTERVAL = 30  # Segundos entre chequeos de salud cuando no hay tickets
+PRINTER_USB_TIMEOUT_MS = 3000 # Límite por operación USB (0 = sin límite, podría colgar el chequeo de salud)
+
+class PrinterSession:
+    """
+    Mantiene abierta la conexión USB con la impresora entre tickets (reclamar y liberar
+    el dispositivo cuesta cientos de ms). Si la impresora se desconecta, la sesión se
+    cierra y se reabre de forma transparente en el siguiente ticket o chequeo de salud.
+    """
+
+    def __init__(self, vendor_id=VENDOR_ID, product_id=PRODUCT_ID, printer_factory=None):
+        # 'printer_factory' permite usar otra impresora de python-escpos (o un mock)
+        self._factory = printer_factory or (lambda: Usb(vendor_id, product_id, timeout=PRINTER_USB_TIMEOUT_MS))
+        self._printer = None
+        self._was_connected = False
+        self._lock = threading.Lock()
+        self.tickets_printed = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.last_health_check = None
+
+    def _connect(self):
+        if self._printer is not None:
+            return self._printer
+        printer = self._factory()
+        # python-escpos abre el USB de forma perezosa; se fuerza aquí para detectar la desconexión
+        if hasattr(printer, 'open'):
+            printer.open()
+        if self._was_connected:
+            self.reconnects += 1
+            print("IMPRESORA: Conexión restablecida.")
+        self._printer = printer
+        self._was_connected = True
+        return printer
+
+    def _close(self):
+        printer, self._printer = self._printer, None
+        if printer is not None:
+            try:
+                printer.close()
+            except Exception:
+                pass
+
+    @property
+    def is_connected(self):
+        return self._printer is not None
+
+    def print_ticket(self, username, num_atrasos, max_atrasos_warning):
+        """Imprime un ticket. Si la conexión quedó inválida, reconecta una vez y reintenta."""
+        ticket = get_ticket_template().render(username, num_atrasos, max_atrasos_warning)
+        with self._lock:
+            for attempt in range(2):
+                had_connection = self._printer is not None
+                try:
+                    # Una sola escritura USB con el ticket completo (el corte va al final del buffer)
+                    self._connect()._raw(ticket)
+                    self.tickets_printed += 1
+                    return True
+                except Exception as e:
+                    self.failures += 1
+                    self._close()
+                    # Solo vale la pena reintentar si falló una conexión que estaba abierta (p.ej. se desenchufó)
+                    if attempt == 0 and had_connection:
+                        continue
+                    print(f"ERROR DE IMPRESIÓN: No se pudo conectar a la impresora. {e}")
+                    return False
+            return False
+
+    def health_check(self):
+        """Comprueba que la impresora siga respondiendo. Retorna True si está disponible."""
+        with self._lock:
+            self.last_health_check = datetime.now()
+            try:
+                printer = self._connect()
+                if hasattr(printer, 'is_online') and not printer.is_online():
+                    raise IOError("La impresora no responde.")
+                return True
+            except Exception:
+                self._close()
+                return False
+
+    def get_stats(self):
+        """Contadores de la sesión para diagnóstico."""
+        return {
+            'conectada': self.is_connected,
+            'tickets_impresos': self.tickets_printed,
+            'fallos': self.failures,
+            'reconexiones': self.reconnects,
+            'ultimo_chequeo': self.last_health_check,
+        }
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_printer_session():
+    """Retorna la sesión de impresora compartida del proceso."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = PrinterSession()
+        return _session
+
 def print_clocking_receipt(username, num_atrasos, max_atrasos_warning):
     """Imprime un ticket de marcación de tiempo, incluyendo el número de atrasos y advertencia."""
-    now = datetime.now()
-    p = None  # Inicializamos la variable de la impresora
-    try:
-        # Intenta inicializar la impresora USB
-        p = Usb(VENDOR_ID, PRODUCT_ID)
-
-        # Formato del Ticket
-        p.set(align='center', double_width=True, double_height=True)
-        p.text("REGISTRO DE ASISTENCIA\n")
-
-        p.set(align='center', double_width=False, double_height=False)
-        p.text("--------------------------------\n")
-
-        p.set(align='left')
-        p.text(f"USUARIO: {username.upper()}\n")
-        p.text(f"FECHA:   {now.strftime('%d/%m/%Y')}\n")
-        p.text(f"HORA:    {now.strftime('%H:%M:%S')}\n")
-
-        # Nueva sección para el contador de atrasos
-        p.text(f"ATRASOS ACUMULADOS: {num_atrasos}\n")
-        
-        # LÓGICA DE ADVERTENCIA: Usar el nuevo parámetro
-        if num_atrasos >= max_atrasos_warning:
-            p.set(align='center', bold=True)
-            p.text("\n*** ADVERTENCIA: LIMITE ALCANZADO ***\n")
-            p.set(align='left', bold=False)
-            
-        p.text("\n")
+    return get_printer_session().print_ticket(username, num_atrasos, max_atrasos_warning)
+
+
+# --- COLA DE IMPRESIÓN EN SEGUNDO PLANO ---
+PRINT_QUEUE_SIZE = 20       # Máximo de tickets pendientes
+PRINT_MAX_RETRIES = 3       # Intentos por ticket cuando la impresora estaba respondiendo
+PRINT_BACKOFF_SECONDS = 0.5 # Espera base entre reintentos (se duplica en cada intento)
+
+class PrintSpooler:
+    """
+    Hilo dedicado que imprime los tickets de marcación para que el lector de huellas
+    nunca espere a la impresora.
+    - La cola es acotada: si se llena se descarta el ticket más antiguo.
+    - Los tickets pendientes de un mismo alumno se fusionan (solo se imprime el último).
+    - Si la impresora no responde, cada ticket se intenta una sola vez y se descarta,
+      en lugar de acumular reintentos mientras esté desconectada.
+    - Mientras no hay tickets, se revisa periódicamente la salud de la impresora.
+    - El estado se informa mediante status_callback (p.ej. el log de la GUI).
+    """
+
+    def __init__(self, print_func=None, maxsize=PRINT_QUEUE_SIZE, max_retries=PRINT_MAX_RETRIES,
+                 backoff=PRINT_BACKOFF_SECONDS, status_callback=None,
+                 health_check_func=None, health_interval=PRINTER_HEALTH_INTERVAL):
+        self._print_func = print_func or print_clocking_receipt
+        # Chequeo de salud periódico mientras la cola está vacía (None = desactivado)
+        self._health_check_func = health_check_func
+        self._health_interval = health_interval
+        self._maxsize = maxsize
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._status_callback = status_callback
+        self._pending = OrderedDict()  # rut -> (username, num_atrasos, max_atrasos_warning)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.printer_available = True
 
-        p.text("¡Marcación Exitosa!\n")
+    def set_status_callback(self, callback):
+        self._status_callback = callback
 
-        p.cut()
+    def _report(self, message):
+        if self._status_callback:
+            try:
+                self._status_callback(message)
+                return
+            except Exception:
+                pass
+        print(message)
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="PrintSpooler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def submit(self, rut, username, num_atrasos, max_atrasos_warning):
+        """
+        Encola un ticket. Retorna inmediatamente (True si quedó encolado).
+        Los tickets se identifican por RUT: dos alumnos con el mismo nombre no se fusionan.
+        """
+        with self._cond:
+            if rut in self._pending:
+                # Coalescer: reemplazar el ticket pendiente del mismo alumno por el más reciente
+                self._pending.pop(rut)
+            elif len(self._pending) >= self._maxsize:
+                _, (dropped, _, _) = self._pending.popitem(last=False)
+                self._report(f"Cola de impresión llena. Ticket de {dropped} descartado.")
+            self._pending[rut] = (username, num_atrasos, max_atrasos_warning)
+            self._cond.notify()
         return True
 
-    except Exception as e:
-        # Manejo de errores si la impresora no está conectada o configurada
-        print(f"ERROR DE IMPRESIÓN: No se pudo conectar a la impresora. {e}")
-        return False
-    finally:
-        # Asegurarse de cerrar la conexión para liberar el dispositivo USB
-        if p:
-            p.close()
\ No newline at end of file
+    def _next_job(self):
+        """Espera el siguiente ticket. Retorna None al detenerse o si venció el intervalo de salud."""
+        with self._cond:
+            if self._running and not self._pending:
+                timeout = self._health_interval if self._health_check_func else None
+                self._cond.wait(timeout)
+            if not self._running or not self._pending:
+                return None
+            _, job = self._pending.popitem(last=False)
+            return job
+
+    def _run_health_check(self):
+        try:
+            available = bool(self._health_check_func())
+        except Exception:
+            available = False
+        if available and not self.printer_available:
+            self._report("Impresora disponible nuevamente.")
+        elif not available and self.printer_available:
+            self._report("Impresora no disponible (chequeo de salud).")
+        self.printer_available = available
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                if not self._running:
+                    return
+                self._run_health_check()
+                continue
+            username = job[0]
+            # Con la impresora ausente solo se hace un intento para no bloquear la cola
+            attempts = self._max_retries if self.printer_available else 1
+            printed = False
+            for attempt in range(attempts):
+                if attempt:
+                    time.sleep(self._backoff * (2 ** (attempt - 1)))
+                start = time.perf_counter()
+                try:
+                    printed = self._print_func(*job)
+                except Exception as e:
+                    print(f"ERROR DE IMPRESIÓN: {e}")
+                    printed = False
+                get_latency_recorder().record('impresion/print_clocking_receipt', time.perf_counter() - start,
+                                              intento=attempt + 1, impreso=bool(printed))
+                if printed:
+                    break
+
+            if printed:
+                if not self.printer_available:
+                    self._report("Impresora disponible nuevamente.")
+                self.printer_available = True
+                self._report(f"Ticket impreso para {username}.")
+            else:
+                self.printer_available = False
+                self._report(f"Impresora no disponible. Ticket de {username} descartado.")
+
+
+_spooler = None
+_spooler_lock = threading.Lock()
+
+def get_print_spooler():
+    """Retorna la cola de impresión compartida del proceso (se inicia la primera vez)."""
+    global _spooler
+    with _spooler_lock:
+        if _spooler is None:
+            _spooler = PrintSpooler(health_check_func=get_printer_session().health_check)
+            _spooler.start()
+        return _spooler
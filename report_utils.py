@@ -1,12 +1,25 @@
 # report_utils.py
 import smtplib
 import os
+import calendar
 import configparser
+from datetime import date, time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+    print("WARNING: 'openpyxl' no está instalado. No se podrán generar reportes Excel.")
+
+from db_utils import iter_clockings_for_range, get_course_summary
+
 # --- CONFIGURACIÓN DE CORREO (PARA MICROSOFT/OUTLOOK) ---
 # Las credenciales se leen desde el archivo config.ini en la sección [Email]
 
@@ -76,3 +89,107 @@ def send_report_by_email(recipient_email, subject, body, attachment_path):
         return False, "Error de autenticación. Verifica las credenciales (EMAIL_USER/EMAIL_PASS) y que la contraseña de aplicación sea correcta."
     except Exception as e:
         return False, f"Error al enviar el correo: {e}"
+
+
+# --- EXPORTACIÓN A EXCEL EN STREAMING ---
+# Las filas pasan directo del cursor de SQLite a un libro openpyxl en modo solo escritura
+# (write_only): cada fila se escribe al archivo apenas se lee, así que exportar un año
+# completo de todo el colegio no hace crecer la memoria. El orden lo resuelve SQLite.
+EXPORT_COLUMNS = (
+    ('RUT', 14),
+    ('Nombre Completo', 32),
+    ('Fecha', 12),
+    ('Hora de Entrada', 16),
+    ('Estado de Asistencia', 22),
+)
+EXCEL_MAX_DATA_ROWS = 1048575  # Límite de filas de una hoja de Excel, menos el encabezado
+
+def export_range(year, month=None):
+    """Retorna (fecha_inicio, fecha_fin, nombre_de_archivo) de un mes o, sin 'month', del año completo."""
+    if month is None:
+        return f"{year}-01-01", f"{year}-12-31", f"Marcaciones_Detalle_{year}.xlsx"
+    last_day = calendar.monthrange(year, month)[1]
+    return (f"{year}-{month:02d}-01", f"{year}-{month:02d}-{last_day:02d}",
+            f"Marcaciones_Detalle_{year}_{month:02d}.xlsx")
+
+def _new_export_sheet(workbook, number):
+    title = "Marcaciones" if number == 1 else f"Marcaciones ({number})"
+    sheet = workbook.create_sheet(title)
+    sheet.freeze_panes = 'A2'
+    header = []
+    for index, (name, width) in enumerate(EXPORT_COLUMNS):
+        sheet.column_dimensions[chr(ord('A') + index)].width = width
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+    return sheet
+
+SUMMARY_COLUMNS = [('Curso', 16), ('Días', 8), ('Presentes', 12), ('Tardanzas', 12),
+                   ('Ausentes', 12), ('Total', 10)]
+
+def _append_course_summary_sheet(workbook, start_date, end_date):
+    """Hoja 'Resumen por Curso' leída de RESUMEN_CURSO_DIA (unas pocas filas por curso)."""
+    sheet = workbook.create_sheet("Resumen por Curso")
+    sheet.freeze_panes = 'A2'
+    header = []
+    for index, (name, width) in enumerate(SUMMARY_COLUMNS):
+        sheet.column_dimensions[chr(ord('A') + index)].width = width
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+    for row in get_course_summary(start_date, end_date):
+        sheet.append(row)
+
+def export_clockings_to_excel(filepath, start_date, end_date):
+    """
+    Exporta las marcaciones entre 'start_date' y 'end_date' (inclusive) a 'filepath',
+    ordenadas por fecha y hora de entrada. Fecha y hora se guardan como celdas de fecha
+    y hora de Excel (no texto). Si se supera el límite de filas de una hoja, se continúa
+    en una hoja nueva. Al final se agrega la hoja 'Resumen por Curso'.
+    El archivo se escribe en un temporal y se reemplaza al terminar.
+    Retorna la cantidad de marcaciones exportadas (0 = no hay datos y no se crea el archivo)
+    o None si hubo un error.
+    """
+    if not OPENPYXL_AVAILABLE:
+        print("Error: openpyxl no está instalado. No se puede generar el Excel.")
+        return None
+
+    tmp_path = f"{filepath}.tmp"
+    workbook = Workbook(write_only=True)
+    sheet, sheets, sheet_rows = None, 0, 0
+    dates = {}  # Muchas filas comparten fecha: se convierte una sola vez
+    total = 0
+    try:
+        for rows in iter_clockings_for_range(start_date, end_date):
+            for rut, nombre, fecha, hora_entrada, estado in rows:
+                if sheet is None or sheet_rows >= EXCEL_MAX_DATA_ROWS:
+                    sheets += 1
+                    sheet, sheet_rows = _new_export_sheet(workbook, sheets), 0
+                fecha_value = dates.get(fecha)
+                if fecha_value is None:
+                    try:
+                        fecha_value = date.fromisoformat(fecha)
+                    except (TypeError, ValueError):
+                        fecha_value = fecha
+                    dates[fecha] = fecha_value
+                try:
+                    hora_value = time.fromisoformat(hora_entrada)
+                except (TypeError, ValueError):
+                    hora_value = hora_entrada
+                sheet.append((rut, nombre, fecha_value, hora_value, estado))
+                sheet_rows += 1
+                total += 1
+        if not total:
+            return 0
+        _append_course_summary_sheet(workbook, start_date, end_date)
+        workbook.save(tmp_path)
+        os.replace(tmp_path, filepath)
+        return total
+    except Exception as e:
+        print(f"Error al exportar las marcaciones a Excel: {e}")
+        return None
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,219 @@
+# snapshot_utils.py (Instantánea en disco de la galería para un inicio inmediato)
+import mmap
+import os
+import struct
+import zlib
+
+from db_utils import get_gallery_revision, get_gallery_changes, iter_gallery_rows
+
+# Formato del archivo (enteros little-endian):
+#   encabezado: magia, versión del formato, revisión de la BD, instancia de la BD,
+#               cantidad de registros, CRC32 de los registros y posición del índice
+#   registros:  [largo total][id_alumno][largos de rut, curso, hora y plantilla] + datos
+#   índice:     [largo del rut][rut][posición del registro] por cada alumno
+SNAPSHOT_MAGIC = b'HUELLSNP'
+SNAPSHOT_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<8sHQ32sIIQ')
+_RECORD = struct.Struct('<IqHHHI')
+_INDEX_ENTRY = struct.Struct('<HQ')
+
+def _encode_text(value):
+    return b'' if value is None else str(value).encode('utf-8')
+
+def _decode_text(data):
+    return data.decode('utf-8') if data else None
+
+def encode_record(id_alumno, rut, template, curso=None, hora_max_tardanza=None):
+    """Serializa una fila de la galería como un registro con prefijo de largo."""
+    rut_b, curso_b, hora_b = _encode_text(rut), _encode_text(curso), _encode_text(hora_max_tardanza)
+    template = bytes(template)
+    size = _RECORD.size + len(rut_b) + len(curso_b) + len(hora_b) + len(template)
+    return b''.join((_RECORD.pack(size, id_alumno, len(rut_b), len(curso_b), len(hora_b), len(template)),
+                     rut_b, curso_b, hora_b, template))
+
+
+class GallerySnapshot:
+    """
+    Instantánea de solo lectura mapeada en memoria (mmap): las plantillas se leen
+    directamente del archivo, sin consultar SQLite. Un archivo incompleto o corrupto
+    se rechaza al abrirlo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("archivo vacío")
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self):
+        mm = self._mm
+        if len(mm) < _HEADER.size:
+            raise ValueError("archivo truncado")
+        magic, version, self.revision, instance, self.count, crc, self._index_offset = _HEADER.unpack_from(mm, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError("formato desconocido")
+        if not _HEADER.size <= self._index_offset <= len(mm):
+            raise ValueError("índice fuera del archivo")
+        if zlib.crc32(mm[_HEADER.size:self._index_offset]) != crc:
+            raise ValueError("CRC de los registros no coincide")
+        self.instance = instance.rstrip(b'\0').decode('ascii')
+        self._index = None
+
+    @classmethod
+    def open(cls, path):
+        """Abre una instantánea válida o retorna None (inexistente o dañada)."""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"GALERÍA: Instantánea {path} descartada ({e}).")
+            return None
+
+    def _read_record(self, offset):
+        size, id_alumno, rut_len, curso_len, hora_len, template_len = _RECORD.unpack_from(self._mm, offset)
+        pos = offset + _RECORD.size
+        rut = self._mm[pos:pos + rut_len].decode('utf-8')
+        pos += rut_len
+        curso = _decode_text(self._mm[pos:pos + curso_len])
+        pos += curso_len
+        hora = _decode_text(self._mm[pos:pos + hora_len])
+        pos += hora_len
+        return size, id_alumno, rut, self._mm[pos:pos + template_len], curso, hora
+
+    def iter_records(self):
+        """Recorre los registros: (posición, largo, id_alumno, rut, plantilla, curso, hora_max_tardanza)."""
+        offset = _HEADER.size
+        while offset < self._index_offset:
+            size, id_alumno, rut, template, curso, hora = self._read_record(offset)
+            yield offset, size, id_alumno, rut, template, curso, hora
+            offset += size
+
+    def iter_chunks(self, chunk_size=200):
+        """Filas (rut, plantilla, curso, hora_max_tardanza) en lotes, como iter_templates_for_gallery()."""
+        rows = []
+        for _offset, _size, _id, rut, template, curso, hora in self.iter_records():
+            rows.append((rut, template, curso, hora))
+            if len(rows) >= chunk_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+    def raw_record(self, offset, size):
+        """Bytes del registro tal como están en el archivo (se copian sin volver a serializar)."""
+        return self._mm[offset:offset + size]
+
+    def get(self, rut):
+        """Busca un alumno por RUT usando el índice: (plantilla, curso, hora_max_tardanza) o None."""
+        if self._index is None:
+            index = {}
+            pos = self._index_offset
+            for _ in range(self.count):
+                rut_len, offset = _INDEX_ENTRY.unpack_from(self._mm, pos)
+                pos += _INDEX_ENTRY.size
+                index[self._mm[pos:pos + rut_len].decode('utf-8')] = offset
+                pos += rut_len
+            self._index = index
+        offset = self._index.get(rut)
+        if offset is None:
+            return None
+        _size, _id, _rut, template, curso, hora = self._read_record(offset)
+        return template, curso, hora
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def write_snapshot(path, revision, instance, records):
+    """
+    Escribe una instantánea a partir de registros ya codificados [(rut, bytes del registro)].
+    Se escribe en un archivo temporal y se reemplaza de forma atómica: un corte de luz
+    a mitad de la escritura deja la instantánea anterior intacta.
+    Retorna la cantidad de registros escritos.
+    """
+    tmp_path = f"{path}.tmp"
+    index = []
+    crc = 0
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * _HEADER.size)  # Se completa al final
+        offset = _HEADER.size
+        for rut, record in records:
+            f.write(record)
+            crc = zlib.crc32(record, crc)
+            index.append((rut, offset))
+            offset += len(record)
+        index_offset = offset
+        for rut, record_offset in index:
+            rut_b = rut.encode('utf-8')
+            f.write(_INDEX_ENTRY.pack(len(rut_b), record_offset))
+            f.write(rut_b)
+        f.seek(0)
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, revision,
+                             _encode_text(instance), len(index), crc, index_offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(index)
+
+def refresh_snapshot(path, logger=print):
+    """
+    Deja la instantánea al día con la BD y la retorna abierta (o None si no se pudo escribir).
+    - Si es de esta BD (misma instancia) y su revisión no es mayor a la actual, solo se
+      vuelven a leer de SQLite los alumnos modificados después de esa revisión; el resto
+      de los registros se copia tal cual desde el archivo anterior.
+    - Si no existe, está dañada o es de otra BD, se reconstruye completa.
+    La revisión se lee antes que las filas: un cambio concurrente queda con una revisión
+    mayor y se vuelve a aplicar en la próxima actualización.
+    """
+    instance, revision = get_gallery_revision()
+    snapshot = GallerySnapshot.open(path)
+    if snapshot is not None and (snapshot.instance != instance or snapshot.revision > revision):
+        logger("GALERÍA: La instantánea no corresponde a esta base de datos. Se reconstruye.")
+        snapshot.close()
+        snapshot = None
+
+    if snapshot is not None and snapshot.revision == revision:
+        return snapshot
+
+    try:
+        if snapshot is not None:
+            changed_ids, rows = get_gallery_changes(snapshot.revision)
+
+            def _records():
+                for offset, size, id_alumno, rut, _t, _c, _h in snapshot.iter_records():
+                    if id_alumno not in changed_ids:
+                        yield rut, snapshot.raw_record(offset, size)
+                for id_alumno, rut, template, curso, hora in rows:
+                    yield rut, encode_record(id_alumno, rut, template, curso, hora)
+
+            written = write_snapshot(path, revision, instance, _records())
+            logger(f"GALERÍA: Instantánea actualizada ({len(changed_ids)} alumnos modificados, {written} en total).")
+        else:
+            def _records():
+                for chunk in iter_gallery_rows():
+                    for id_alumno, rut, template, curso, hora in chunk:
+                        yield rut, encode_record(id_alumno, rut, template, curso, hora)
+
+            written = write_snapshot(path, revision, instance, _records())
+            logger(f"GALERÍA: Instantánea creada con {written} plantillas.")
+    except OSError as e:
+        logger(f"GALERÍA: No se pudo escribir la instantánea {path}: {e}")
+        return None
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+    return GallerySnapshot.open(path)
@@ -0,0 +1,248 @@
+# table_utils.py (Tabla virtualizada para listados grandes en la GUI)
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+
+DEFAULT_PAGE_SIZE = 200
+DEFAULT_CACHED_PAGES = 8
+DEFAULT_ROW_HEIGHT = 20
+
+
+class PagedTable(tk.Frame):
+    """
+    ttk.Treeview virtualizado: solo existen como ítems las filas visibles (unas decenas),
+    y sus valores se reemplazan al desplazarse. Las filas se piden por páginas a la BD a
+    medida que se necesitan y se guardan unas pocas páginas en memoria.
+
+    El orden y los filtros se resuelven en SQL:
+        count_rows(**filtros) -> int
+        fetch_rows(offset, limit, order_by, descending, **filtros) -> [fila, ...]
+    Un clic en un encabezado ordena por esa columna (un segundo clic invierte el orden);
+    set_filters() cambia los filtros y vuelve al inicio.
+
+    'columns' es una lista de (clave, encabezado, ancho, alineación, ordenable).
+    'row_tags(fila)' puede retornar tags del Treeview para resaltar filas y
+    'format_row(fila)' los valores a mostrar.
+    """
+
+    def __init__(self, master, columns, count_rows, fetch_rows, order_by=None, descending=False,
+                 row_tags=None, format_row=None, page_size=DEFAULT_PAGE_SIZE,
+                 cached_pages=DEFAULT_CACHED_PAGES, **kwargs):
+        super().__init__(master, **kwargs)
+        self._columns = columns
+        self._count_rows = count_rows
+        self._fetch_rows = fetch_rows
+        self._row_tags = row_tags
+        self._format_row = format_row
+        self._page_size = page_size
+        self._cached_pages = cached_pages
+        self._order_by = order_by
+        self._descending = descending
+        self._filters = {}
+
+        self._pages = OrderedDict()  # número de página -> filas (LRU)
+        self._total = 0
+        self._first = 0              # Índice de la primera fila visible
+        self._visible = 1            # Filas que caben en la ventana
+        self._slots = []             # Ítems del Treeview reutilizados para las filas visibles
+        self._selected = None        # Índice absoluto de la fila seleccionada
+        self._render_pending = False
+        self._rendering = False
+
+        keys = [c[0] for c in columns]
+        self.tree = ttk.Treeview(self, columns=keys, show='headings', selectmode='browse', height=1)
+        self._vsb = ttk.Scrollbar(self, orient='vertical', command=self._on_scrollbar)
+        hsb = ttk.Scrollbar(self, orient='horizontal', command=self.tree.xview)
+        self.tree.configure(xscrollcommand=hsb.set)
+        for key, heading, width, anchor, sortable in columns:
+            command = (lambda k=key: self.sort_by(k)) if sortable else ''
+            self.tree.heading(key, text=heading, command=command)
+            self.tree.column(key, width=width, anchor=anchor)
+        self._update_headings()
+
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        self._vsb.grid(row=0, column=1, sticky='ns')
+        hsb.grid(row=1, column=0, sticky='ew')
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self._row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or DEFAULT_ROW_HEIGHT)
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(sequence, self._on_wheel)
+        for sequence, delta in (('<Up>', -1), ('<Down>', 1), ('<Prior>', 'page-'), ('<Next>', 'page+'),
+                                ('<Home>', 'start'), ('<End>', 'end')):
+            self.tree.bind(sequence, lambda event, d=delta: self._on_key(d))
+
+    # --- API ---
+
+    @property
+    def total(self):
+        return self._total
+
+    def set_filters(self, **filters):
+        """Reemplaza los filtros (los valores vacíos se ignoran) y recarga desde la primera fila."""
+        self._filters = {k: v for k, v in filters.items() if v not in (None, '')}
+        self.reload()
+
+    def sort_by(self, key, descending=None):
+        """Ordena por 'key'; sin 'descending' alterna el sentido si ya se ordenaba por esa columna."""
+        if descending is None:
+            descending = not self._descending if key == self._order_by else False
+        self._order_by, self._descending = key, descending
+        self._update_headings()
+        self.reload()
+
+    def reload(self):
+        """Vuelve a contar las filas, descarta las páginas en memoria y muestra desde el inicio."""
+        self._pages.clear()
+        self._total = self._count_rows(**self._filters)
+        self._first = 0
+        self._selected = None
+        self._schedule_render()
+
+    def selected_row(self):
+        """Fila seleccionada (como la retorna fetch_rows) o None."""
+        if self._selected is None or self._selected >= self._total:
+            return None
+        return self._row(self._selected)
+
+    def iter_rows(self, chunk_size=1000):
+        """Todas las filas con el orden y filtros actuales, por lotes (para exportar sin cargar todo)."""
+        offset = 0
+        while True:
+            rows = self._fetch_rows(offset, chunk_size, self._order_by, self._descending, **self._filters)
+            if not rows:
+                break
+            yield rows
+            offset += len(rows)
+
+    # --- Páginas ---
+
+    def _row(self, index):
+        number = index // self._page_size
+        page = self._pages.get(number)
+        if page is None:
+            page = self._fetch_rows(number * self._page_size, self._page_size,
+                                    self._order_by, self._descending, **self._filters)
+            self._pages[number] = page
+            while len(self._pages) > self._cached_pages:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(number)
+        offset = index - number * self._page_size
+        return page[offset] if offset < len(page) else None
+
+    # --- Dibujo ---
+
+    def _update_headings(self):
+        for key, heading, _width, _anchor, _sortable in self._columns:
+            arrow = (' ▼' if self._descending else ' ▲') if key == self._order_by else ''
+            self.tree.heading(key, text=heading + arrow)
+
+    def _schedule_render(self):
+        # Varios eventos de desplazamiento seguidos se dibujan una sola vez
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    def _render(self):
+        self._render_pending = False
+        if not self.winfo_exists():
+            return
+        self._first = max(0, min(self._first, self._total - self._visible))
+        count = max(0, min(self._visible, self._total - self._first))
+        while len(self._slots) < count:
+            self._slots.append(self.tree.insert('', tk.END, values=()))
+        while len(self._slots) > count:
+            self.tree.delete(self._slots.pop())
+
+        self._rendering = True
+        try:
+            selected_slot = None
+            for offset, item_id in enumerate(self._slots):
+                index = self._first + offset
+                row = self._row(index)
+                if row is None:
+                    # La tabla cambió desde el conteo: se muestra vacía hasta la próxima recarga
+                    self.tree.item(item_id, values=(), tags=())
+                    continue
+                values = self._format_row(row) if self._format_row else row
+                tags = self._row_tags(row) if self._row_tags else ()
+                self.tree.item(item_id, values=[v if v is not None else '' for v in values], tags=tags)
+                if index == self._selected:
+                    selected_slot = item_id
+            wanted = (selected_slot,) if selected_slot else ()
+            if tuple(self.tree.selection()) != wanted:
+                self.tree.selection_set(wanted)
+        finally:
+            self._rendering = False
+
+        if self._total:
+            self._vsb.set(self._first / self._total, (self._first + count) / self._total)
+        else:
+            self._vsb.set(0, 1)
+
+    def _scroll_to(self, first):
+        first = max(0, min(int(first), self._total - self._visible))
+        if first != self._first:
+            self._first = first
+            self._schedule_render()
+
+    # --- Eventos ---
+
+    def _on_resize(self, event):
+        header = DEFAULT_ROW_HEIGHT + 4
+        if self._slots:
+            bbox = self.tree.bbox(self._slots[0])
+            if bbox:
+                header = bbox[1]
+        visible = max(1, (event.height - header) // self._row_height)
+        if visible != self._visible:
+            self._visible = visible
+            self._schedule_render()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self._scroll_to(float(args[1]) * self._total)
+        elif args[0] == 'scroll':
+            step = self._visible if args[2] == 'pages' else 1
+            self._scroll_to(self._first + int(args[1]) * step)
+
+    def _on_wheel(self, event):
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self._scroll_to(self._first - 3)
+        else:
+            self._scroll_to(self._first + 3)
+        return 'break'
+
+    def _on_key(self, delta):
+        if delta == 'start':
+            target = 0
+        elif delta == 'end':
+            target = self._total - 1
+        else:
+            current = self._selected if self._selected is not None else self._first
+            step = {'page-': -self._visible, 'page+': self._visible}.get(delta, delta)
+            target = current + step
+        if not self._total:
+            return 'break'
+        self._selected = max(0, min(target, self._total - 1))
+        if self._selected < self._first:
+            self._scroll_to(self._selected)
+        elif self._selected >= self._first + self._visible:
+            self._scroll_to(self._selected - self._visible + 1)
+        self._schedule_render()
+        self.event_generate('<<PagedTableSelect>>')
+        return 'break'
+
+    def _on_select(self, _event):
+        if self._rendering:
+            return
+        selection = self.tree.selection()
+        if selection and selection[0] in self._slots:
+            index = self._first + self._slots.index(selection[0])
+            if index != self._selected:
+                self._selected = index
+                self.event_generate('<<PagedTableSelect>>')
@@ -0,0 +1,250 @@
+# task_utils.py (Ejecutor de tareas en segundo plano para la GUI)
+import configparser
+import queue
+import threading
+import time
+
+# Colas de trabajo y cuántas tareas de cada una corren a la vez (sección [Tareas] de config.ini)
+DEFAULT_QUEUE_LIMITS = {
+    'hardware': 1,   # Lector de huellas: una operación a la vez
+    'database': 2,   # Carga de la galería, consultas largas
+    'reporting': 1,  # Exportaciones a Excel (uso intensivo de CPU y disco)
+    'network': 2,    # Envío de correos
+}
+
+DEFAULT_POLL_INTERVAL_MS = 50
+
+
+def load_task_settings():
+    """Lee la sección [Tareas] de config.ini. Los valores ausentes o inválidos usan el valor por defecto."""
+    limits = dict(DEFAULT_QUEUE_LIMITS)
+    config = configparser.ConfigParser()
+    try:
+        config.read('config.ini')
+        for name in limits:
+            try:
+                limits[name] = max(1, config.getint('Tareas', name, fallback=limits[name]))
+            except ValueError:
+                print(f"ADVERTENCIA: El valor de '{name}' en config.ini no es un entero. Usando {limits[name]}.")
+    except configparser.Error as e:
+        print(f"ADVERTENCIA: No se pudo leer la sección [Tareas] de config.ini: {e}")
+    return limits
+
+
+class TaskCancelled(Exception):
+    """La tarea se canceló antes de terminar."""
+
+
+class CancelToken:
+    """
+    Señal de cancelación compartida entre la GUI y una tarea. La tarea la revisa con
+    'cancelled' o raise_if_cancelled(); on_cancel() registra acciones inmediatas
+    (p.ej. Gio.Cancellable.cancel para interrumpir la espera del dedo).
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"TAREAS: Error al cancelar: {e}")
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TaskCancelled()
+
+
+class TaskHandle:
+    """Tarea enviada al ejecutor: permite cancelarla y saber si terminó."""
+
+    def __init__(self, name, queue_name, func, args, kwargs, on_success, on_error, on_done):
+        self.name = name
+        self.queue_name = queue_name
+        self.token = CancelToken()
+        self.done = False
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._on_success = on_success
+        self._on_error = on_error
+        self._on_done = on_done
+
+    def cancel(self):
+        self.token.cancel()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+
+_current = threading.local()
+
+def current_token():
+    """Token de cancelación de la tarea que corre en este hilo (None fuera del ejecutor)."""
+    return getattr(_current, 'token', None)
+
+
+class TaskExecutor:
+    """
+    Ejecuta el trabajo lento de la GUI en colas con nombre ('hardware', 'database',
+    'reporting', 'network'), cada una con un número fijo de hilos: nunca hay más hilos
+    que la suma de los límites, y una exportación larga no retrasa al lector de huellas.
+
+    Los callbacks (on_success, on_error, on_done y los de call_in_ui) nunca corren en el
+    hilo de la tarea: se dejan en una única cola que poll() vacía desde el hilo de Tk
+    (start_polling() lo programa con after()), así que pueden usar widgets y messagebox.
+    """
+
+    def __init__(self, limits=None):
+        self._limits = dict(limits or DEFAULT_QUEUE_LIMITS)
+        self._queues = {name: queue.Queue() for name in self._limits}
+        self._threads = {name: [] for name in self._limits}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._ui_calls = queue.SimpleQueue()
+        self._widget = None
+        self._poll_interval = DEFAULT_POLL_INTERVAL_MS
+        self._after_id = None
+        self._closed = False
+
+    def submit(self, queue_name, func, *args, on_success=None, on_error=None, on_done=None, name=None, **kwargs):
+        """
+        Encola func(*args, **kwargs) en 'queue_name' y retorna su TaskHandle.
+        on_success(resultado) / on_error(excepción) / on_done() se llaman en el hilo de Tk.
+        Una tarea cancelada antes de empezar no se ejecuta (solo se llama on_done);
+        si se cancela mientras corre, depende de que revise current_token().
+        """
+        if queue_name not in self._queues:
+            raise ValueError(f"Cola de tareas desconocida: {queue_name}")
+        handle = TaskHandle(name or getattr(func, '__name__', 'tarea'), queue_name, func, args, kwargs,
+                            on_success, on_error, on_done)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("El ejecutor de tareas ya se detuvo.")
+            self._pending.add(handle)
+            self._queues[queue_name].put(handle)
+            # Los hilos se crean a medida que hacen falta, hasta el límite de la cola
+            threads = self._threads[queue_name]
+            if len(threads) < self._limits[queue_name]:
+                thread = threading.Thread(target=self._worker, args=(queue_name,),
+                                          name=f"Tareas-{queue_name}-{len(threads) + 1}", daemon=True)
+                threads.append(thread)
+                thread.start()
+        return handle
+
+    def call_in_ui(self, callback, *args, **kwargs):
+        """Ejecuta callback(*args, **kwargs) en el hilo de Tk (se puede llamar desde cualquier hilo)."""
+        self._ui_calls.put((callback, args, kwargs))
+
+    def pending_count(self, queue_name=None):
+        """Tareas encoladas o en curso (de una cola o de todas)."""
+        with self._lock:
+            return sum(1 for h in self._pending if queue_name in (None, h.queue_name))
+
+    def _worker(self, queue_name):
+        tasks = self._queues[queue_name]
+        while True:
+            handle = tasks.get()
+            if handle is None:
+                return
+            if handle.cancelled:
+                self._finish(handle)
+                continue
+            _current.token = handle.token
+            try:
+                result = handle._func(*handle._args, **handle._kwargs)
+            except TaskCancelled:
+                pass
+            except Exception as e:
+                if handle._on_error:
+                    self.call_in_ui(handle._on_error, e)
+                else:
+                    print(f"TAREAS: Error no controlado en '{handle.name}' ({queue_name}): {e}")
+            else:
+                # También si se canceló durante la ejecución: el trabajo ya se hizo (p.ej. una
+                # marcación registrada) y el callback decide si mostrarlo revisando handle.cancelled
+                if handle._on_success:
+                    self.call_in_ui(handle._on_success, result)
+            finally:
+                _current.token = None
+            self._finish(handle)
+
+    def _finish(self, handle):
+        def _done():
+            handle.done = True
+            with self._lock:
+                self._pending.discard(handle)
+            if handle._on_done:
+                handle._on_done()
+        self.call_in_ui(_done)
+
+    # --- Hilo de Tk ---
+
+    def start_polling(self, widget, interval_ms=DEFAULT_POLL_INTERVAL_MS):
+        """Programa poll() cada 'interval_ms' con widget.after()."""
+        self._widget = widget
+        self._poll_interval = interval_ms
+        if self._after_id is None:
+            self._after_id = widget.after(interval_ms, self._poll_loop)
+
+    def _poll_loop(self):
+        self._after_id = None
+        self.poll()
+        if not self._closed:
+            self._after_id = self._widget.after(self._poll_interval, self._poll_loop)
+
+    def poll(self):
+        """Ejecuta los callbacks pendientes (llamar solo desde el hilo de Tk)."""
+        while True:
+            try:
+                callback, args, kwargs = self._ui_calls.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                callback(*args, **kwargs)
+            except Exception as e:
+                print(f"TAREAS: Error en un callback de la interfaz: {e}")
+
+    def shutdown(self, timeout=2.0):
+        """Cancela las tareas pendientes y detiene los hilos (espera a lo más 'timeout' segundos en total)."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            pending = list(self._pending)
+        for handle in pending:
+            handle.cancel()
+        if self._after_id is not None and self._widget is not None:
+            try:
+                self._widget.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+        for name, threads in self._threads.items():
+            for _ in threads:
+                self._queues[name].put(None)
+        deadline = time.monotonic() + timeout
+        for threads in self._threads.values():
+            for thread in threads:
+                thread.join(max(0.0, deadline - time.monotonic()))
@@ -0,0 +1,154 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime, time, timedelta
+from unittest.mock import MagicMock
+
+# Sin libfprint: las plantillas de la galería se simulan
+sys.modules.setdefault('gi', MagicMock())
+sys.modules.setdefault('gi.repository', MagicMock())
+
+import db_utils
+from gallery_utils import ArrivalModel, TemplateGallery
+
+
+class FakePrint:
+    """Reemplazo de FPrint.Print: solo guarda el RUT."""
+
+    def __init__(self, data):
+        self.username = None
+
+    def set_username(self, rut):
+        self.username = rut
+
+    def get_username(self):
+        return self.username
+
+
+class TestArrivalModel(unittest.TestCase):
+    """Orden de la galería por probabilidad de llegada, mantenido en forma incremental."""
+
+    # Historial: A llega 3 días a las 08:05, B 1 día a las 08:02, C 2 días a las 08:15, D nunca
+    HISTORY = {'A': [(1, '08:05:00'), (2, '08:05:30'), (3, '08:06:00')],
+               'B': [(4, '08:02:00')],
+               'C': [(1, '08:15:00'), (2, '08:17:00')],
+               'D': []}
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "arrivals.db")
+        db_utils.init_db()
+
+        self.today = date.today()
+        self.gallery = TemplateGallery(deserializer=FakePrint)
+        with db_utils.db_connection() as conn:
+            for rut, arrivals in self.HISTORY.items():
+                cursor = conn.execute("""
+                    INSERT INTO ALUMNOS (primer_nombre, apellido_paterno, apellido_materno, rut, curso)
+                    VALUES ('Alumno', ?, 'Prueba', ?, '1ro Medio')
+                """, (rut, rut))
+                for days_ago, hora in arrivals:
+                    conn.execute("""
+                        INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado, curso)
+                        VALUES (?, ?, ?, 'presente', '1ro Medio')
+                    """, (cursor.lastrowid, (self.today - timedelta(days=days_ago)).isoformat(), hora))
+                self.gallery.upsert(rut, b'\x00')
+            conn.commit()
+        self.gallery.is_loaded = True
+        self.model = ArrivalModel(self.gallery)
+        self.model.load_from_db(today=self.today)
+
+    def tearDown(self):
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def _at(self, hhmm, day=None):
+        return datetime.combine(day or self.today, time(*hhmm))
+
+    def _ordered(self, hhmm, day=None):
+        return [p.get_username() for p in self.model.ordered_prints(self._at(hhmm, day))]
+
+    def _clock(self, rut, hora, day=None):
+        self.model.note_clocking(rut, (day or self.today).isoformat(), hora)
+
+    def test_order_follows_current_slot(self):
+        print("\n--- Testing Arrival Order ---")
+        # Franja 08:00-08:09 primero (por frecuencia), luego la siguiente, luego el resto
+        self.assertEqual(self._ordered((8, 3)), ['A', 'B', 'C', 'D'])
+        # Otra franja reconstruye el orden en caché
+        self.assertEqual(self._ordered((8, 15)), ['C', 'A', 'B', 'D'])
+        # Un alumno nuevo en la galería (cambio de versión) también lo reconstruye
+        self.gallery.upsert('E', b'\x00')
+        self.assertEqual(self._ordered((8, 15)), ['C', 'A', 'B', 'D', 'E'])
+        print("[PASS] Gallery ordered by arrivals in the current and neighbouring slots.")
+
+    def test_clocked_students_move_to_tail(self):
+        print("\n--- Testing Clocked Students ---")
+        self.assertEqual(self._ordered((8, 3)), ['A', 'B', 'C', 'D'])
+        cache_key = self.model._cache_key
+        self._clock('B', '08:04:00')
+        self._clock('A', '08:05:00')
+        # Se mueven al final en la caché sin reconstruirla
+        self.assertEqual(self.model._cache_key, cache_key)
+        self.assertEqual(self._ordered((8, 3)), ['C', 'D', 'B', 'A'])
+        self.assertTrue(self.model.is_recorded('A'))
+        # Una reconstrucción (otra franja) también los deja al final
+        self.assertEqual(self._ordered((8, 15)), ['C', 'D', 'A', 'B'])
+
+        # Las etapas parciales sí los excluyen
+        pairs = self.gallery.get_pairs_for(['A', 'B', 'C'])
+        self.assertEqual([p.get_username() for p in self.model.pending_prints(pairs)], ['C'])
+        print("[PASS] Clocked students stay in the full gallery, after the pending ones.")
+
+    def test_frequency_bump_within_slot(self):
+        print("\n--- Testing Frequency Bump ---")
+        slot = self.model.slot_of('08:00:00')
+        self.assertEqual(self.model._order[slot], ['A', 'B'])
+        # Primera llegada de D en la franja: entra al final (empatado con B no lo supera)
+        self._clock('D', '08:01:00')
+        self.assertEqual(self.model._order[slot], ['A', 'B', 'D'])
+        self.model._bump(slot, 'D')
+        self.model._bump(slot, 'D')
+        self.assertEqual(self.model._order[slot], ['A', 'D', 'B'])  # 3 llegadas, empatado con A
+        self.model._bump(slot, 'D')
+        self.assertEqual(self.model._order[slot], ['D', 'A', 'B'])
+        self.assertEqual(self.model._pos[slot], {'D': 0, 'A': 1, 'B': 2})
+        self.assertEqual(self.model._counts[slot], {'A': 3, 'B': 1, 'D': 4})
+        print("[PASS] An arrival moves the student up only past lower counts.")
+
+    def test_day_rollover_clears_clocked(self):
+        print("\n--- Testing Day Rollover ---")
+        self._clock('A', '08:05:00')
+        self._clock('B', '08:02:00')
+        self.assertEqual(self._ordered((8, 3)), ['C', 'D', 'A', 'B'])
+
+        # Al día siguiente nadie ha marcado: vuelven al orden por llegadas (ahora con la de hoy)
+        tomorrow = self.today + timedelta(days=1)
+        self.assertEqual(self._ordered((8, 3), tomorrow), ['A', 'B', 'C', 'D'])
+        self.assertFalse(self.model.is_recorded('A'))
+        self._clock('C', '08:03:00', tomorrow)
+        self.assertEqual(self._ordered((8, 3), tomorrow), ['A', 'B', 'D', 'C'])
+        print("[PASS] A new day clears the set of students who already clocked.")
+
+    def test_load_from_db_marks_today(self):
+        print("\n--- Testing Load With Today's Clockings ---")
+        with db_utils.db_connection() as conn:
+            conn.execute("""
+                INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado, curso)
+                SELECT id_alumno, ?, '07:55:00', 'presente', curso FROM ALUMNOS WHERE rut = 'A'
+            """, (self.today.isoformat(),))
+            conn.commit()
+        model = ArrivalModel(self.gallery)
+        model.load_from_db(today=self.today)
+        self.assertTrue(model.is_recorded('A'))
+        self.assertEqual([p.get_username() for p in model.ordered_prints(self._at((8, 3)))],
+                         ['B', 'C', 'D', 'A'])
+        print("[PASS] Students who clocked before startup start at the tail.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import db_utils
+
+
+class FixedDateTime(datetime):
+    """datetime cuyo now() retorna la hora fijada por la prueba."""
+    current = datetime(2024, 3, 4, 7, 50, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+class TestRecordAttendance(unittest.TestCase):
+    """Marcación en una sola transacción: primera marcación, duplicado y contador de atrasos."""
+
+    RUT = '12345678-9'
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "attendance.db")
+        db_utils.init_db()
+        # Hora límite 08:00 y advertencia al llegar a 2 atrasos
+        db_utils.save_template('Ana', 'María', 'Pérez', 'Soto', self.RUT, b'\x01\x02', '08:00:00', 2, '2do Medio')
+
+        self.clock = patch.object(db_utils, 'datetime', FixedDateTime)
+        self.clock.start()
+
+    def tearDown(self):
+        self.clock.stop()
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def _at(self, moment):
+        FixedDateTime.current = moment
+
+    def _clockings(self):
+        with db_utils.db_connection() as conn:
+            return conn.execute("""
+                SELECT fecha, hora_entrada, estado, curso FROM ASISTENCIAS ORDER BY fecha
+            """).fetchall()
+
+    def _num_atrasos(self):
+        with db_utils.db_connection() as conn:
+            return conn.execute("SELECT num_atrasos FROM ALUMNOS WHERE rut = ?", (self.RUT,)).fetchone()[0]
+
+    def test_first_clocking(self):
+        print("\n--- Testing First Clocking ---")
+        self._at(datetime(2024, 3, 4, 7, 50, 0))
+        result = db_utils.record_attendance(self.RUT)
+        self.assertEqual(result, db_utils.AttendanceResult(
+            self.RUT, 'Ana Pérez', 'presente', '07:50:00', 0, 2, '08:00:00', True))
+        self.assertEqual(self._clockings(), [('2024-03-04', '07:50:00', 'presente', '2do Medio')])
+        self.assertIsNone(db_utils.record_attendance('00000000-0'))
+        print("[PASS] First clocking of the day is stored with the student's course.")
+
+    def test_duplicate_clocking_same_day(self):
+        print("\n--- Testing Duplicate Clocking ---")
+        self._at(datetime(2024, 3, 4, 8, 10, 0))
+        first = db_utils.record_attendance(self.RUT)
+        self.assertEqual((first.estado, first.num_atrasos), ('tardanza', 1))
+
+        self._at(datetime(2024, 3, 4, 8, 30, 0))
+        second = db_utils.record_attendance(self.RUT)
+        self.assertFalse(second.registrado)
+        self.assertEqual(second.estado, 'ya registrado')
+        self.assertIsNone(second.hora)
+        # Ni una segunda fila ni un segundo atraso
+        self.assertEqual(second.num_atrasos, 1)
+        self.assertEqual(self._num_atrasos(), 1)
+        self.assertEqual(self._clockings(), [('2024-03-04', '08:10:00', 'tardanza', '2do Medio')])
+        print("[PASS] A second clocking on the same day changes nothing.")
+
+    def test_late_counter_and_warning_threshold(self):
+        print("\n--- Testing Late Counter ---")
+        results = []
+        for day, hora in ((4, (8, 5)), (5, (7, 55)), (6, (8, 20))):
+            self._at(datetime(2024, 3, day, *hora))
+            results.append(db_utils.record_attendance(self.RUT))
+        self.assertEqual([r.estado for r in results], ['tardanza', 'presente', 'tardanza'])
+        self.assertEqual([r.num_atrasos for r in results], [1, 1, 2])
+        self.assertEqual(self._num_atrasos(), 2)
+        # El ticket muestra la advertencia cuando num_atrasos >= max_atrasos_warning
+        self.assertEqual([r.num_atrasos >= r.max_atrasos_warning for r in results], [False, False, True])
+
+        # La hora límite puede pasarse como override
+        self._at(datetime(2024, 3, 7, 8, 20, 0))
+        result = db_utils.record_attendance(self.RUT, hora_max_tardanza='08:30:00')
+        self.assertEqual((result.estado, result.num_atrasos, result.hora_max_tardanza), ('presente', 2, '08:30:00'))
+        print("[PASS] Late arrivals increment the counter and reach the warning threshold.")
+
+    def test_save_clocking_keeps_old_shape(self):
+        print("\n--- Testing save_clocking Compatibility ---")
+        self._at(datetime(2024, 3, 4, 8, 10, 0))
+        self.assertEqual(db_utils.save_clocking(self.RUT), ("entrada (tardanza)", '08:10:00', 1, 2))
+        self.assertEqual(db_utils.save_clocking(self.RUT), ("ya registrado", None, 1, 2))
+        self.assertEqual(db_utils.save_clocking('00000000-0'), (None, None, None, None))
+        print("[PASS] save_clocking still returns (estado, hora, num_atrasos, max_atrasos_warning).")
+
+
+if __name__ == '__main__':
+    unittest.main()
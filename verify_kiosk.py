@@ -0,0 +1,307 @@
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Sin lector ni impresora reales: el escaneo se reemplaza por un lector simulado
+sys.modules.setdefault('gi', MagicMock())
+sys.modules.setdefault('gi.repository', MagicMock())
+sys.modules.setdefault('escpos.printer.usb', MagicMock())
+
+import db_utils
+import identify
+from identify import ScanOutcome
+from gallery_utils import DEFAULT_GALLERY_SETTINGS, ArrivalModel, StagedGalleryPlanner, TemplateGallery
+from kiosk_utils import AutoScanWorker
+from task_utils import TaskExecutor
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("La condición no se cumplió a tiempo.")
+        time.sleep(0.005)
+
+
+class FakeCancellable:
+    """Reemplazo de Gio.Cancellable."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+
+class FakeReader:
+    """identify_and_clock simulado: cada escaneo espera un dedo (un RUT) o la cancelación."""
+
+    def __init__(self):
+        self.fingers = queue.Queue()
+        self.scans = 0
+        self.scanning = False
+        self.threads = set()
+
+    def __call__(self, session, cancellable, in_cooldown):
+        self.scans += 1
+        self.scanning = True
+        self.threads.add(threading.current_thread().name)
+        try:
+            while not cancellable.event.is_set():
+                try:
+                    rut = self.fingers.get(timeout=0.005)
+                except queue.Empty:
+                    continue
+                if rut is None:
+                    return ScanOutcome('error', mensaje="Lector desconectado.")
+                if in_cooldown(rut):
+                    return ScanOutcome('enfriamiento', rut)
+                return ScanOutcome('marcado', rut)
+            return ScanOutcome('cancelado')
+        finally:
+            self.scanning = False
+
+
+class TestAutoScanWorker(unittest.TestCase):
+    """Modo kiosco: enfriamiento, pausa fuera del menú principal y cancelación al salir."""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.reader = FakeReader()
+        self.executor = TaskExecutor()
+        self.worker = AutoScanWorker('sesion', self.executor, cooldown_seconds=60, error_backoff=0.05,
+                                     scan_func=self.reader, cancellable_factory=FakeCancellable,
+                                     clock=lambda: self.now)
+
+    def tearDown(self):
+        self.worker.stop()
+        self.executor.shutdown()
+
+    def _next_result(self):
+        return self.worker.results.get(timeout=5)
+
+    def test_cooldown_ignores_recent_students(self):
+        print("\n--- Testing Kiosk Cooldown ---")
+        self.worker.start()
+        self.worker.resume()
+        self.reader.fingers.put('11111111-1')
+        self.assertEqual(self._next_result(), ScanOutcome('marcado', '11111111-1'))
+        self.reader.fingers.put('11111111-1')
+        self.assertEqual(self._next_result(), ScanOutcome('enfriamiento', '11111111-1'))
+        self.reader.fingers.put('22222222-2')
+        self.assertEqual(self._next_result().evento, 'marcado')
+
+        self.now += 61
+        self.reader.fingers.put('11111111-1')
+        self.assertEqual(self._next_result(), ScanOutcome('marcado', '11111111-1'))
+        # Cada escaneo corre en la cola 'hardware' del ejecutor
+        self.assertEqual(self.reader.threads, {'Tareas-hardware-1'})
+        print("[PASS] A student is ignored for cooldown_seconds after clocking.")
+
+    def test_repeated_errors_reported_once(self):
+        print("\n--- Testing Kiosk Error Backoff ---")
+        self.worker.start()
+        self.worker.resume()
+        for _ in range(3):
+            self.reader.fingers.put(None)
+        wait_until(lambda: self.reader.fingers.empty() and self.reader.scans >= 4)
+        self.assertEqual(self._next_result().evento, 'error')
+        self.assertTrue(self.worker.results.empty())
+        print("[PASS] A repeated reader error is reported once.")
+
+    def test_pause_outside_main_menu(self):
+        print("\n--- Testing Kiosk Pause ---")
+        import app_gui
+
+        frames = {cls: SimpleNamespace(tkraise=lambda: None)
+                  for cls in (app_gui.MainMenuFrame, app_gui.AdminFrame, app_gui.EnrollmentFrame)}
+        app = SimpleNamespace(frames=frames, auto_scan=self.worker)
+
+        self.worker.start()
+        time.sleep(0.05)
+        self.assertEqual(self.reader.scans, 0)  # Se crea en pausa
+
+        app_gui.FingerprintApp.show_frame(app, app_gui.MainMenuFrame)
+        wait_until(lambda: self.reader.scanning)
+
+        # Una pantalla de administración cancela la captura y libera la cola 'hardware'
+        app_gui.FingerprintApp.show_frame(app, app_gui.AdminFrame)
+        self.assertTrue(self.worker.is_paused)
+        wait_until(lambda: not self.reader.scanning)
+        freed = threading.Event()
+        self.executor.submit('hardware', freed.set)
+        self.assertTrue(freed.wait(5))
+        app_gui.FingerprintApp.show_frame(app, app_gui.EnrollmentFrame)
+        time.sleep(0.05)
+        self.assertEqual(self.reader.scans, 1)
+        self.assertTrue(self.worker.results.empty())  # Los escaneos cancelados no se informan
+
+        app_gui.FingerprintApp.show_frame(app, app_gui.MainMenuFrame)
+        wait_until(lambda: self.reader.scans == 2 and self.reader.scanning)
+        self.reader.fingers.put('11111111-1')
+        self.assertEqual(self._next_result().evento, 'marcado')
+        print("[PASS] Scanning pauses on other screens and resumes on the main menu.")
+
+    def test_stop_cancels_capture(self):
+        print("\n--- Testing Kiosk Stop ---")
+        self.worker.start()
+        self.worker.resume()
+        wait_until(lambda: self.reader.scanning)
+        started = time.monotonic()
+        self.worker.stop()
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertFalse(self.reader.scanning)
+        time.sleep(0.05)
+        self.assertEqual(self.reader.scans, 1)
+        print("[PASS] stop() cancels the capture in progress.")
+
+    def test_executor_shutdown_cancels_capture(self):
+        print("\n--- Testing Executor Shutdown ---")
+        self.worker.start()
+        self.worker.resume()
+        wait_until(lambda: self.reader.scanning)
+        self.executor.shutdown(timeout=1.0)
+        self.assertFalse(self.reader.scanning)
+        self.assertEqual(self.reader.scans, 1)
+        print("[PASS] Shutting down the executor interrupts the kiosk capture.")
+
+
+class FakePrint:
+    """Reemplazo de FPrint.Print: solo guarda el RUT."""
+
+    def __init__(self, data):
+        self.username = None
+
+    def set_username(self, rut):
+        self.username = rut
+
+    def get_username(self):
+        return self.username
+
+
+class CancelledError(Exception):
+    """Error de libfprint al cancelar la captura (G_IO_ERROR_CANCELLED)."""
+    domain = 'g-io-error-quark'
+    code = 19
+
+
+class FakeDevice:
+    """identify_sync simulado: espera un dedo (RUT) y coincide si su plantilla está entre los candidatos."""
+
+    def __init__(self):
+        self.fingers = queue.Queue()
+        self.galleries = []  # RUT candidatos de cada captura, en orden
+
+    def identify_sync(self, prints, cancellable=None):
+        while cancellable is None or not cancellable.event.is_set():
+            try:
+                finger = self.fingers.get(timeout=0.005)
+            except queue.Empty:
+                continue
+            self.galleries.append([p.get_username() for p in prints])
+            return next((p for p in prints if p.get_username() == finger), None), object()
+        raise CancelledError()
+
+
+class FakeSession:
+    def __init__(self, device):
+        self.device = device
+
+    @contextmanager
+    def operation(self, name):
+        yield self.device
+
+
+class TestKioskRepeatTouch(unittest.TestCase):
+    """identify_and_clock real: un segundo toque del mismo dedo no se informa como huella no reconocida."""
+
+    FIRST = '11111111-1'
+    SECOND = '22222222-2'
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "kiosk.db")
+        db_utils.init_db()
+
+        self.gallery = TemplateGallery(deserializer=FakePrint)
+        for i, rut in enumerate((self.FIRST, self.SECOND)):
+            db_utils.save_template('Alumno', '', f'Apellido{i}', 'Prueba', rut, b'\x00', '23:59:59', 3, '1ro Medio')
+            self.gallery.upsert(rut, b'\x00', '1ro Medio', '23:59:59')
+        self.gallery.is_loaded = True
+        # Modelo de llegadas real, actualizado por el evento 'marcar' de record_attendance
+        self.arrivals = ArrivalModel(self.gallery)
+        self.arrivals.load_from_db()
+        db_utils.register_alumnos_listener(self.arrivals._on_alumnos_change)
+        self.planner = StagedGalleryPlanner(self.gallery, settings=dict(DEFAULT_GALLERY_SETTINGS),
+                                            arrival_model=self.arrivals)
+
+        self.device = FakeDevice()
+        self.session = FakeSession(self.device)
+        self.spooler = MagicMock()
+        self.patches = [patch.object(identify, 'get_gallery', lambda: self.gallery),
+                        patch.object(identify, 'get_gallery_planner', lambda: self.planner),
+                        patch.object(identify, 'get_print_spooler', lambda: self.spooler)]
+        for p in self.patches:
+            p.start()
+        self.executor = TaskExecutor()
+        self.worker = None
+
+    def tearDown(self):
+        if self.worker:
+            self.worker.stop()
+        self.executor.shutdown()
+        for p in self.patches:
+            p.stop()
+        db_utils._alumnos_listeners.remove(self.arrivals._on_alumnos_change)
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def _touch(self, rut, in_cooldown=None):
+        self.device.fingers.put(rut)
+        return identify.identify_and_clock(self.session, FakeCancellable(), in_cooldown)
+
+    def test_second_touch_is_cooldown_in_worker(self):
+        print("\n--- Testing Kiosk Double Tap ---")
+        self.worker = AutoScanWorker(self.session, self.executor, cooldown_seconds=60,
+                                     cancellable_factory=FakeCancellable)
+        self.worker.start()
+        self.worker.resume()
+        self.device.fingers.put(self.FIRST)
+        first = self.worker.results.get(timeout=5)
+        self.assertEqual((first.evento, first.rut), ('marcado', self.FIRST))
+        self.assertTrue(first.resultado.registrado)
+
+        self.device.fingers.put(self.FIRST)
+        self.assertEqual(self.worker.results.get(timeout=5), ScanOutcome('enfriamiento', self.FIRST))
+        # El alumno que ya marcó sigue en la galería, al final
+        self.assertEqual(self.device.galleries[-1][-1], self.FIRST)
+        self.spooler.submit.assert_called_once()
+        print("[PASS] A double tap within the cooldown is reported as cooldown.")
+
+    def test_touch_after_cooldown_is_already_registered(self):
+        print("\n--- Testing Repeat Touch After Cooldown ---")
+        self.assertEqual(self._touch(self.FIRST).evento, 'marcado')
+        self.assertEqual(self.device.galleries[0], [self.FIRST, self.SECOND])
+
+        again = self._touch(self.FIRST)
+        self.assertEqual((again.evento, again.rut), ('marcado', self.FIRST))
+        self.assertFalse(again.resultado.registrado)
+        self.assertEqual(again.resultado.estado, 'ya registrado')
+        self.assertEqual(self.device.galleries[1], [self.SECOND, self.FIRST])
+        with db_utils.db_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM ASISTENCIAS").fetchone()[0], 1)
+        print("[PASS] A later touch resolves to the same student as already registered.")
+
+
+if __name__ == '__main__':
+    unittest.main()
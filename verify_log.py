@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import log_utils
+
+
+class FakeText:
+    """Lo mínimo de un tk.Text que usa LogPanel (sin pantalla)."""
+
+    def __init__(self):
+        self.lines = []
+        self.inserts = 0
+        self.scheduled = []
+
+    def index(self, _index):
+        return f"{len(self.lines) + 1}.0"
+
+    def insert(self, _index, text):
+        self.inserts += 1
+        self.lines.extend(text.splitlines())
+
+    def delete(self, _start, end):
+        del self.lines[:int(end.split('.')[0]) - 1]
+
+    def see(self, _index):
+        pass
+
+    def config(self, **_kwargs):
+        pass
+
+    def winfo_exists(self):
+        return True
+
+    def after(self, _ms, callback):
+        self.scheduled.append(callback)
+        return len(self.scheduled)
+
+    def after_cancel(self, _after_id):
+        self.scheduled.clear()
+
+    def run_pending(self):
+        callbacks, self.scheduled = self.scheduled, []
+        for callback in callbacks:
+            callback()
+
+
+class TestLogPanel(unittest.TestCase):
+    """Panel de log con cola entre hilos, líneas acotadas y archivo rotativo."""
+
+    def test_bounded_batches_from_threads(self):
+        print("\n--- Testing Bounded Log Panel ---")
+        widget = FakeText()
+        panel = log_utils.LogPanel(widget, max_lines=50)
+        threads = [threading.Thread(target=lambda n=n: [panel.log(f"hilo {n} mensaje {i}") for i in range(100)])
+                   for n in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(widget.lines, [])  # Nada se dibuja fuera del bombeo
+
+        panel.start()
+        with patch.object(log_utils, 'PUMP_BATCH', 120):
+            widget.run_pending()
+            self.assertEqual(widget.inserts, 1)
+            self.assertEqual(len(widget.lines), 50)
+            widget.run_pending()
+            widget.run_pending()
+        self.assertEqual(widget.inserts, 3)
+        self.assertEqual(len(widget.lines), 50)
+        self.assertTrue(widget.lines[-1].endswith("mensaje 99"))
+        panel.close()
+        self.assertEqual(widget.scheduled, [])
+        print("[PASS] Messages drained in batches and old lines trimmed.")
+
+    def test_rotating_file(self):
+        print("\n--- Testing Rotating Log File ---")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "marcador.log")
+            panel = log_utils.LogPanel(FakeText(), file_path=path, max_bytes=2000, backups=2)
+            for i in range(200):
+                panel.log(f"Marcación registrada {i:03d}")
+            panel.close()
+            files = sorted(os.listdir(tmp_dir))
+            self.assertEqual(files, ["marcador.log", "marcador.log.1", "marcador.log.2"])
+            with open(path, encoding='utf-8') as f:
+                last = f.read().splitlines()[-1]
+            self.assertTrue(last.endswith("Marcación registrada 199"))
+            self.assertTrue(all(os.path.getsize(os.path.join(tmp_dir, name)) <= 2000 for name in files))
+        print("[PASS] Log file rotated and flushed on close.")
+
+
+if __name__ == '__main__':
+    unittest.main()
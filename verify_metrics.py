@@ -0,0 +1,56 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from metrics_utils import LatencyHistogram, LatencyRecorder, HISTOGRAM_GROWTH
+
+
+class TestLatencyMetrics(unittest.TestCase):
+    """Histogramas de latencia por etapa y traza en JSON lines."""
+
+    def test_percentiles(self):
+        print("\n--- Testing Latency Percentiles ---")
+        histogram = LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.add(ms / 1000.0)
+        for p, expected in ((50, 0.5), (95, 0.95), (99, 0.99)):
+            value = histogram.percentile(p)
+            self.assertGreaterEqual(value, expected)
+            self.assertLessEqual(value, expected * HISTOGRAM_GROWTH)
+        self.assertEqual(histogram.percentile(100), 1.0)
+        print("[PASS] Percentiles within one bucket.")
+
+    def test_daily_reset_and_trace(self):
+        print("\n--- Testing Daily Reset and Trace ---")
+        today = [date(2024, 3, 1)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_path = os.path.join(tmp_dir, "traza.jsonl")
+            recorder = LatencyRecorder(trace_path, today=lambda: today[0])
+            recorder.record('identificar/identify_sync', 0.25, candidatos=10)
+            with self.assertRaises(RuntimeError):
+                with recorder.span('identificar/record_attendance'):
+                    raise RuntimeError("BD bloqueada")
+            summary = recorder.get_summary()
+            self.assertEqual(summary['identificar/identify_sync']['n'], 1)
+            self.assertEqual(summary['identificar/record_attendance']['n'], 1)
+
+            today[0] = date(2024, 3, 2)
+            self.assertEqual(recorder.get_summary(), {})
+            recorder.record('identificar/identify_sync', 0.1)
+            self.assertEqual(list(recorder.get_summary()), ['identificar/identify_sync'])
+            recorder.close()
+
+            with open(trace_path, encoding='utf-8') as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual([line['etapa'] for line in lines],
+                         ['identificar/identify_sync', 'identificar/record_attendance', 'identificar/identify_sync'])
+        self.assertEqual(lines[0]['candidatos'], 10)
+        self.assertEqual(lines[0]['ms'], 250.0)
+        self.assertTrue(lines[1]['error'])
+        print("[PASS] Histograms reset daily and trace lines written.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import base64
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import db_utils
+
+
+class TestTemplateMigration(unittest.TestCase):
+    """Migración de una BD con el esquema original (huella en base64) al esquema actual."""
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "baseline.db")
+        db_utils._schema_ready_for = None
+
+        # Esquema de la versión original: sin PLANTILLAS y con PRAGMA user_version = 0
+        self.templates = {
+            '11111111-1': b'\x00\x01plantilla\xff' * 4,
+            '22222222-2': bytes(range(256)),
+        }
+        conn = sqlite3.connect(db_utils.DB_NAME)
+        conn.executescript("""
+            CREATE TABLE ALUMNOS (
+                id_alumno INTEGER PRIMARY KEY,
+                primer_nombre TEXT NOT NULL,
+                segundo_nombre TEXT,
+                apellido_paterno TEXT NOT NULL,
+                apellido_materno TEXT NOT NULL,
+                rut TEXT UNIQUE NOT NULL,
+                huella_plantilla TEXT,
+                curso TEXT DEFAULT '1ro Medio',
+                hora_max_tardanza TEXT DEFAULT '08:15:00',
+                max_inasistencias INTEGER DEFAULT 3,
+                num_atrasos INTEGER DEFAULT 0,
+                max_atrasos_warning INTEGER DEFAULT 10,
+                activo BOOLEAN DEFAULT 1,
+                fecha_registro DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE ASISTENCIAS (
+                id_asistencia INTEGER PRIMARY KEY,
+                id_alumno INTEGER NOT NULL,
+                fecha DATE NOT NULL,
+                hora_entrada TIME,
+                hora_salida TIME,
+                estado TEXT,
+                notificado BOOLEAN DEFAULT 0,
+                observaciones TEXT,
+                FOREIGN KEY (id_alumno) REFERENCES ALUMNOS(id_alumno),
+                UNIQUE (id_alumno, fecha)
+            );
+        """)
+        students = [(rut, base64.b64encode(data).decode('utf-8')) for rut, data in self.templates.items()]
+        students.append(('33333333-3', 'esto no es base64!'))
+        students.append(('44444444-4', None))
+        for i, (rut, huella) in enumerate(students):
+            conn.execute("""
+                INSERT INTO ALUMNOS (primer_nombre, apellido_paterno, apellido_materno, rut, huella_plantilla)
+                VALUES ('Alumno', ?, 'Prueba', ?, ?)
+            """, (f"Apellido{i}", rut, huella))
+        conn.execute("""
+            INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado)
+            VALUES (1, '2024-03-04', '08:00:00', 'presente')
+        """)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        db_utils._schema_ready_for = None
+        self.tmp_dir.cleanup()
+
+    def _snapshot(self):
+        conn = sqlite3.connect(db_utils.DB_NAME)
+        try:
+            return {
+                'version': conn.execute("PRAGMA user_version").fetchone()[0],
+                'plantillas': conn.execute("""
+                    SELECT A.rut, P.plantilla FROM PLANTILLAS P
+                    JOIN ALUMNOS A ON A.id_alumno = P.id_alumno ORDER BY A.rut
+                """).fetchall(),
+                'huellas': conn.execute(
+                    "SELECT rut, huella_plantilla FROM ALUMNOS ORDER BY rut").fetchall(),
+            }
+        finally:
+            conn.close()
+
+    def test_base64_templates_become_blobs(self):
+        print("\n--- Testing Base64 -> BLOB Migration ---")
+        db_utils.init_db()
+        state = self._snapshot()
+
+        self.assertEqual(state['version'], db_utils.SCHEMA_VERSION)
+        self.assertEqual(dict(state['plantillas']), self.templates)
+        self.assertTrue(all(isinstance(blob, bytes) for _, blob in state['plantillas']))
+        huellas = dict(state['huellas'])
+        # Las migradas quedan vacías; la corrupta se conserva tal cual en la columna antigua
+        self.assertIsNone(huellas['11111111-1'])
+        self.assertIsNone(huellas['22222222-2'])
+        self.assertEqual(huellas['33333333-3'], 'esto no es base64!')
+        self.assertIsNone(huellas['44444444-4'])
+        self.assertEqual(db_utils.get_template_by_rut('22222222-2'), self.templates['22222222-2'])
+        print("[PASS] Templates decoded into PLANTILLAS and user_version bumped.")
+
+    def test_second_init_is_a_no_op(self):
+        print("\n--- Testing Migration Runs Once ---")
+        db_utils.init_db()
+        migrated = self._snapshot()
+
+        # Otro proceso que abre la misma BD: el esquema ya está en la versión actual
+        db_utils._schema_ready_for = None
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            db_utils.init_db()
+        self.assertNotIn("migrado", output.getvalue())
+        self.assertNotIn("convertidas", output.getvalue())
+        self.assertEqual(self._snapshot(), migrated)
+        print("[PASS] A second init_db leaves the database unchanged.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+import db_utils
+
+
+class TestPagedClockings(unittest.TestCase):
+    """Páginas de la tabla de marcaciones ordenadas y filtradas en SQLite."""
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "paged.db")
+        db_utils.init_db()
+
+        with db_utils.db_connection() as conn:
+            cursor = conn.cursor()
+            for i in range(30):
+                cursor.execute("""
+                    INSERT INTO ALUMNOS (primer_nombre, apellido_paterno, apellido_materno, rut, curso)
+                    VALUES ('Alumno', ?, 'Prueba', ?, ?)
+                """, (f"Apellido{i:02d}", f"{1000000 + i}-K", '1ro Medio' if i % 2 else '2do Medio'))
+                user_id = cursor.lastrowid
+                for day in range(1, 11):
+                    # Misma hora para todos: el orden depende del desempate
+                    cursor.execute("""
+                        INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado)
+                        VALUES (?, ?, '08:00:00', ?)
+                    """, (user_id, f"2024-03-{day:02d}", 'atraso' if (i + day) % 5 == 0 else 'presente'))
+            conn.commit()
+
+    def tearDown(self):
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def _all_pages(self, page_size, **kwargs):
+        rows, offset = [], 0
+        while True:
+            page = db_utils.get_clockings_page('2024-03-01', '2024-03-31', offset, page_size, **kwargs)
+            if not page:
+                return rows
+            rows.extend(page)
+            offset += page_size
+
+    def test_pages_cover_every_row_once(self):
+        print("\n--- Testing Clockings Pages ---")
+        self.assertEqual(db_utils.count_clockings('2024-03-01', '2024-03-31'), 300)
+        for order_by in db_utils.CLOCKINGS_PAGE_COLUMNS:
+            for descending in (False, True):
+                rows = self._all_pages(7, order_by=order_by, descending=descending)
+                self.assertEqual(len(set(rows)), 300, (order_by, descending))
+                column = db_utils.CLOCKINGS_PAGE_COLUMNS.index(order_by)
+                keys = [row[column] for row in rows]
+                self.assertEqual(keys, sorted(keys, reverse=descending))
+        print("[PASS] Sorted pages neither overlap nor skip rows.")
+
+    def test_filters(self):
+        print("\n--- Testing Clockings Filters ---")
+        filters = {'curso': '1ro Medio', 'estado': 'tardanza', 'rut': '100001'}
+        rows = self._all_pages(50, **filters)
+        self.assertEqual(len(rows), db_utils.count_clockings('2024-03-01', '2024-03-31', **filters))
+        self.assertTrue(rows)
+        for rut, _nombre, curso, _fecha, _hora, estado in rows:
+            self.assertTrue(rut.startswith('100001'))
+            self.assertEqual(curso, '1ro Medio')
+            self.assertEqual(estado, 'atraso')  # Nombre antiguo de 'tardanza'
+        print("[PASS] Course, status and RUT filters applied in SQL.")
+
+
+if __name__ == '__main__':
+    unittest.main()
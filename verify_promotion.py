@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+import db_utils
+
+
+class TestAnnualPromotion(unittest.TestCase):
+    """Promoción anual por conjuntos según PROGRESION_CURSOS."""
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "promotion.db")
+        db_utils.init_db()
+
+        with db_utils.db_connection() as conn:
+            cursor = conn.cursor()
+            for i, curso in enumerate(['1ro Medio', '2do Medio', '3ro Medio', '4to Medio ', 'Kinder']):
+                cursor.execute("""
+                    INSERT INTO ALUMNOS (primer_nombre, apellido_paterno, apellido_materno, rut, curso)
+                    VALUES ('Alumno', 'Prueba', 'Prueba', ?, ?)
+                """, (f"{1000000 + i}-K", curso))
+                user_id = cursor.lastrowid
+                cursor.execute("INSERT INTO PLANTILLAS (id_alumno, plantilla) VALUES (?, x'00')", (user_id,))
+                cursor.execute("""
+                    INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado)
+                    VALUES (?, '2024-03-01', '08:00:00', 'presente')
+                """, (user_id,))
+            conn.commit()
+
+    def tearDown(self):
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def _cursos(self):
+        with db_utils.db_connection() as conn:
+            return dict(conn.execute("SELECT rut, curso FROM ALUMNOS"))
+
+    def test_dry_run_only_counts(self):
+        print("\n--- Testing Promotion Dry Run ---")
+        before = self._cursos()
+        self.assertEqual(db_utils.promote_students(dry_run=True), (True, 3, 1))
+        self.assertEqual(self._cursos(), before)
+        print("[PASS] Dry run leaves data untouched.")
+
+    def test_promotion(self):
+        print("\n--- Testing Annual Promotion ---")
+        self.assertEqual(db_utils.promote_students(), (True, 3, 1))
+        self.assertEqual(self._cursos(), {
+            '1000000-K': '2do Medio',
+            '1000001-K': '3ro Medio',
+            '1000002-K': '4to Medio',  # Recién promovido: no debe egresar en la misma pasada
+            '1000004-K': 'Kinder',     # Curso no reconocido: sin cambios
+        })
+        with db_utils.db_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM ASISTENCIAS").fetchone()[0], 4)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM PLANTILLAS").fetchone()[0], 4)
+        print("[PASS] Students promoted and graduates removed.")
+
+    def test_custom_progression(self):
+        print("\n--- Testing Custom Course Progression ---")
+        self.assertTrue(db_utils.set_course_progression({'Kinder': '1ro Medio', '1ro Medio': None}))
+        self.assertEqual(db_utils.promote_students(), (True, 1, 1))
+        cursos = self._cursos()
+        self.assertEqual(cursos['1000004-K'], '1ro Medio')
+        self.assertNotIn('1000000-K', cursos)
+        print("[PASS] Custom progression applied.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import db_utils
+
+
+class TestReportingQueryPlans(unittest.TestCase):
+    """Falla si alguna consulta de reportes vuelve a recorrer ASISTENCIAS completa."""
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "plans.db")
+        db_utils.init_db()
+
+        with db_utils.db_connection() as conn:
+            cursor = conn.cursor()
+            # Datos suficientes para que el planificador tenga algo que elegir
+            for i in range(200):
+                cursor.execute("""
+                    INSERT INTO ALUMNOS (primer_nombre, apellido_paterno, apellido_materno, rut, curso)
+                    VALUES ('Alumno', ?, 'Prueba', ?, '1ro Medio')
+                """, (f"Apellido{i:03d}", f"{1000000 + i}-K"))
+                user_id = cursor.lastrowid
+                for day in range(1, 29):
+                    cursor.execute("""
+                        INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado)
+                        VALUES (?, ?, '08:00:00', 'presente')
+                    """, (user_id, f"2024-02-{day:02d}"))
+            conn.commit()
+            conn.execute("ANALYZE")
+
+    def tearDown(self):
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def test_managed_indexes_exist(self):
+        print("\n--- Testing Managed Indexes ---")
+        with db_utils.db_connection() as conn:
+            names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        for index_name in db_utils.MANAGED_INDEXES:
+            self.assertIn(index_name, names)
+        print("[PASS] Managed indexes created.")
+
+    def test_reporting_queries_use_indexes(self):
+        print("\n--- Testing Reporting Query Plans ---")
+        problems = db_utils.check_reporting_query_plans()
+        for name, steps in problems.items():
+            print(f"[FAIL] {name}: {steps}")
+        self.assertEqual(problems, {})
+        print("[PASS] Reporting queries avoid full scans.")
+
+    def test_export_is_sorted_by_index(self):
+        print("\n--- Testing Export Ordering Plan ---")
+        with db_utils.db_connection() as conn:
+            plan = conn.execute("EXPLAIN QUERY PLAN " + db_utils.CLOCKINGS_EXPORT_SQL,
+                                ('2024-01-01', '2024-12-31')).fetchall()
+        details = [row[-1] for row in plan]
+        self.assertFalse([d for d in details if 'TEMP B-TREE' in d], details)
+        print("[PASS] Export order comes from idx_asistencias_fecha_hora.")
+
+    def test_check_detects_full_scan(self):
+        print("\n--- Testing Full Scan Detection ---")
+        # Una consulta que filtra por una columna sin índice debe marcarse como regresión
+        regression_sql = "SELECT id_alumno FROM ASISTENCIAS S WHERE S.observaciones = ?"
+        with patch.dict(db_utils.REPORTING_QUERIES, {'regresion': (regression_sql, ('x',), ('S',))}):
+            problems = db_utils.check_reporting_query_plans()
+        self.assertIn('regresion', problems)
+        self.assertNotIn('get_clockings_for_month', problems)
+        print("[PASS] Full scan detected.")
+
+
+if __name__ == '__main__':
+    unittest.main()
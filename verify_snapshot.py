@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+import db_utils
+import snapshot_utils
+
+
+class TestGallerySnapshot(unittest.TestCase):
+    """Instantánea en disco de la galería validada con el contador de revisión de la BD."""
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "snapshot.db")
+        db_utils.init_db()
+        self.path = os.path.join(self.tmp_dir.name, "gallery.snapshot")
+        self.messages = []
+
+        with db_utils.db_connection() as conn:
+            for i in range(5):
+                self._insert(conn, f"{2000000 + i}-K", bytes([i]) * 10)
+            conn.commit()
+
+    def tearDown(self):
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def _insert(self, conn, rut, template):
+        cursor = conn.execute("""
+            INSERT INTO ALUMNOS (primer_nombre, apellido_paterno, apellido_materno, rut, curso, hora_max_tardanza)
+            VALUES ('Alumno', 'Prueba', 'Prueba', ?, '1ro Medio', '08:00')
+        """, (rut,))
+        conn.execute("INSERT INTO PLANTILLAS (id_alumno, plantilla) VALUES (?, ?)", (cursor.lastrowid, template))
+
+    def _refresh(self):
+        snapshot = snapshot_utils.refresh_snapshot(self.path, self.messages.append)
+        self.assertIsNotNone(snapshot)
+        try:
+            rows = {rut: (template, curso, hora) for chunk in snapshot.iter_chunks(2)
+                    for rut, template, curso, hora in chunk}
+            self.assertEqual(len(rows), snapshot.count)
+            return snapshot.revision, rows
+        finally:
+            snapshot.close()
+
+    def test_full_build_and_lookup(self):
+        print("\n--- Testing Snapshot Build ---")
+        _revision, rows = self._refresh()
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows['2000003-K'], (bytes([3]) * 10, '1ro Medio', '08:00'))
+        snapshot = snapshot_utils.GallerySnapshot.open(self.path)
+        try:
+            self.assertEqual(snapshot.get('2000001-K')[0], bytes([1]) * 10)
+            self.assertIsNone(snapshot.get('9999999-9'))
+        finally:
+            snapshot.close()
+        print("[PASS] Snapshot written and indexed by RUT.")
+
+    def test_incremental_refresh(self):
+        print("\n--- Testing Incremental Snapshot Refresh ---")
+        first_revision, _rows = self._refresh()
+        with db_utils.db_connection() as conn:
+            conn.execute("UPDATE ALUMNOS SET curso = '2do Medio' WHERE rut = '2000000-K'")
+            conn.execute("""
+                DELETE FROM PLANTILLAS WHERE id_alumno = (SELECT id_alumno FROM ALUMNOS WHERE rut = '2000001-K')
+            """)
+            self._insert(conn, '3000000-K', b'nueva')
+            # Cambios que no afectan a la galería no cambian la revisión
+            conn.execute("UPDATE ALUMNOS SET num_atrasos = 3 WHERE rut = '2000002-K'")
+            conn.commit()
+
+        revision, rows = self._refresh()
+        self.assertEqual(revision, first_revision + 3)
+        self.assertIn("3 alumnos modificados", self.messages[-1])
+        self.assertEqual(rows['2000000-K'][1], '2do Medio')
+        self.assertNotIn('2000001-K', rows)
+        self.assertEqual(rows['3000000-K'][0], b'nueva')
+        self.assertEqual(len(rows), 5)
+
+        # Sin cambios, la instantánea se usa tal cual
+        self.assertEqual(self._refresh()[0], revision)
+        print("[PASS] Only modified rows were re-read.")
+
+    def test_rejects_foreign_or_damaged_snapshot(self):
+        print("\n--- Testing Snapshot Validation ---")
+        self._refresh()
+        with db_utils.db_connection() as conn:
+            conn.execute("UPDATE META SET valor = 'otra' WHERE clave = 'instancia'")
+            conn.commit()
+        self._refresh()
+        self.assertIn("no corresponde", self.messages[-2])
+
+        with open(self.path, 'r+b') as f:
+            f.seek(-3, os.SEEK_END)
+            f.write(b'xxx')
+            f.seek(100)
+            f.write(b'\xff')
+        self.assertIsNone(snapshot_utils.GallerySnapshot.open(self.path))
+        _revision, rows = self._refresh()
+        self.assertEqual(len(rows), 5)
+        print("[PASS] Foreign and damaged snapshots are rebuilt.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import queue
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# La impresora USB real no participa: el spooler recibe una función de impresión simulada
+sys.modules.setdefault('escpos.printer.usb', MagicMock())
+
+import printer_utils
+from printer_utils import PrintSpooler
+
+
+class TestPrintSpooler(unittest.TestCase):
+    """Cola de impresión en segundo plano con impresora y chequeo de salud simulados."""
+
+    def setUp(self):
+        self.printed = []
+        self.messages = queue.Queue()
+        self.results = []  # Respuestas de la impresora simulada, en orden (luego siempre True)
+        self.spooler = None
+
+    def tearDown(self):
+        if self.spooler:
+            self.spooler.stop()
+
+    def _print(self, username, num_atrasos, max_atrasos_warning):
+        ok = self.results.pop(0) if self.results else True
+        if ok:
+            self.printed.append((username, num_atrasos, max_atrasos_warning))
+        return ok
+
+    def _make(self, **kwargs):
+        self.spooler = PrintSpooler(print_func=self._print, status_callback=self.messages.put, **kwargs)
+        return self.spooler
+
+    def _next_message(self):
+        return self.messages.get(timeout=5)
+
+    def test_pending_tickets_merge_by_rut(self):
+        print("\n--- Testing Ticket Merging ---")
+        spooler = self._make()
+        spooler.submit('11111111-1', 'Ana Pérez', 1, 10)
+        spooler.submit('11111111-1', 'Ana Pérez', 2, 10)
+        # Mismo nombre, otro alumno: no debe fusionarse
+        spooler.submit('22222222-2', 'Ana Pérez', 0, 10)
+        self.assertEqual(spooler.pending_count(), 2)
+
+        spooler.start()
+        self.assertEqual(self._next_message(), "Ticket impreso para Ana Pérez.")
+        self.assertEqual(self._next_message(), "Ticket impreso para Ana Pérez.")
+        self.assertEqual(self.printed, [('Ana Pérez', 2, 10), ('Ana Pérez', 0, 10)])
+        print("[PASS] Only the latest ticket per RUT is printed.")
+
+    def test_retries_with_exponential_backoff(self):
+        print("\n--- Testing Retry Backoff ---")
+        spooler = self._make(max_retries=3, backoff=0.5)
+        self.results = [False, False, True]
+        with patch.object(printer_utils.time, 'sleep') as sleep:
+            spooler.submit('11111111-1', 'Ana Pérez', 0, 10)
+            spooler.start()
+            self.assertEqual(self._next_message(), "Ticket impreso para Ana Pérez.")
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [0.5, 1.0])
+        self.assertTrue(spooler.printer_available)
+        print("[PASS] Failed prints are retried after 0.5 s and 1.0 s.")
+
+    def test_absent_printer_drops_tickets(self):
+        print("\n--- Testing Absent Printer ---")
+        spooler = self._make(max_retries=3, backoff=0.5)
+        self.results = [False] * 10
+        with patch.object(printer_utils.time, 'sleep') as sleep:
+            spooler.submit('11111111-1', 'Ana Pérez', 0, 10)
+            spooler.start()
+            self.assertEqual(self._next_message(), "Impresora no disponible. Ticket de Ana Pérez descartado.")
+            self.assertFalse(spooler.printer_available)
+            self.assertEqual(len(self.results), 7)  # Se usaron los 3 intentos
+
+            # Con la impresora ausente cada ticket se intenta una sola vez
+            spooler.submit('22222222-2', 'Luis Soto', 0, 10)
+            self.assertEqual(self._next_message(), "Impresora no disponible. Ticket de Luis Soto descartado.")
+            self.assertEqual(len(self.results), 6)
+            self.assertEqual(sleep.call_count, 2)
+
+            # Al volver, se informa y se imprime normalmente
+            self.results = []
+            spooler.submit('33333333-3', 'Eva Rojas', 0, 10)
+            self.assertEqual(self._next_message(), "Impresora disponible nuevamente.")
+            self.assertEqual(self._next_message(), "Ticket impreso para Eva Rojas.")
+        self.assertEqual(self.printed, [('Eva Rojas', 0, 10)])
+        print("[PASS] Tickets are dropped after one attempt while the printer is absent.")
+
+    def test_full_queue_evicts_oldest(self):
+        print("\n--- Testing Bounded Queue ---")
+        spooler = self._make(maxsize=2)
+        spooler.submit('11111111-1', 'Ana Pérez', 0, 10)
+        spooler.submit('22222222-2', 'Luis Soto', 0, 10)
+        spooler.submit('33333333-3', 'Eva Rojas', 0, 10)
+        self.assertEqual(self._next_message(), "Cola de impresión llena. Ticket de Ana Pérez descartado.")
+        self.assertEqual(spooler.pending_count(), 2)
+
+        spooler.start()
+        self._next_message()
+        self._next_message()
+        self.assertEqual([job[0] for job in self.printed], ['Luis Soto', 'Eva Rojas'])
+        print("[PASS] The oldest pending ticket is evicted when the queue is full.")
+
+    def test_health_check_reports_recovery(self):
+        print("\n--- Testing Health Check ---")
+        answers = [False, True]  # Luego la impresora sigue disponible
+        spooler = self._make(health_check_func=lambda: answers.pop(0) if answers else True,
+                             health_interval=0.01)
+        spooler.start()
+        self.assertEqual(self._next_message(), "Impresora no disponible (chequeo de salud).")
+        self.assertEqual(self._next_message(), "Impresora disponible nuevamente.")
+        print("[PASS] Idle health checks report printer state changes.")
+
+
+if __name__ == '__main__':
+    unittest.main()
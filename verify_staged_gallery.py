@@ -0,0 +1,146 @@
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+# Sin lector ni impresora reales: las plantillas y el lector se simulan
+sys.modules.setdefault('gi', MagicMock())
+sys.modules.setdefault('gi.repository', MagicMock())
+sys.modules.setdefault('escpos.printer.usb', MagicMock())
+
+import db_utils
+import identify
+from gallery_utils import DEFAULT_GALLERY_SETTINGS, StagedGalleryPlanner, TemplateGallery
+
+
+class FakePrint:
+    """Reemplazo de FPrint.Print: solo guarda el RUT."""
+
+    def __init__(self, data):
+        self.username = None
+
+    def set_username(self, rut):
+        self.username = rut
+
+    def get_username(self):
+        return self.username
+
+
+class FakeDevice:
+    """identify_sync simulado: coincide si la huella del dedo apoyado está entre los candidatos."""
+
+    def __init__(self):
+        self.finger = None
+        self.galleries = []  # Tamaño de la galería de cada captura
+
+    def identify_sync(self, prints, cancellable=None):
+        self.galleries.append(len(prints))
+        match = next((p for p in prints if p.get_username() == self.finger), None)
+        return match, object()
+
+
+class FakeSession:
+    def __init__(self, device):
+        self.device = device
+
+    @contextmanager
+    def operation(self, name):
+        yield self.device
+
+
+class TestStagedGallery(unittest.TestCase):
+    """Galerías por etapas: un alumno fuera de la primera etapa se identifica en el siguiente toque."""
+
+    RECENT = '11111111-1'
+    OTHER = '22222222-2'
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "staged.db")
+        db_utils.init_db()
+
+        self.gallery = TemplateGallery(deserializer=FakePrint)
+        for i, rut in enumerate((self.RECENT, self.OTHER, '33333333-3')):
+            db_utils.save_template('Alumno', '', f'Apellido{i}', 'Prueba', rut, b'\x00', '23:59:59', 3, '1ro Medio')
+            self.gallery.upsert(rut, b'\x00', '1ro Medio', '23:59:59')
+        self.gallery.is_loaded = True
+
+        settings = dict(DEFAULT_GALLERY_SETTINGS, etapas=('recientes', 'completa'))
+        self.planner = StagedGalleryPlanner(self.gallery, settings=settings)
+        self.planner.note_identified(self.RECENT)
+
+        self.device = FakeDevice()
+        self.session = FakeSession(self.device)
+        self.spooler = MagicMock()
+        self.patches = [patch.object(identify, 'get_gallery', lambda: self.gallery),
+                        patch.object(identify, 'get_gallery_planner', lambda: self.planner),
+                        patch.object(identify, 'get_print_spooler', lambda: self.spooler)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def _touch(self, rut):
+        self.device.finger = rut
+        return identify.identify_and_clock(self.session)
+
+    def test_full_gallery_is_the_default(self):
+        print("\n--- Testing Default Stages ---")
+        self.assertEqual(DEFAULT_GALLERY_SETTINGS['etapas'], ('completa',))
+        planner = StagedGalleryPlanner(self.gallery, settings=dict(DEFAULT_GALLERY_SETTINGS))
+        planner.note_identified(self.RECENT)
+        stage, prints = planner.next_gallery()
+        self.assertEqual((stage, len(prints)), ('completa', 3))
+        print("[PASS] Staged galleries are opt-in.")
+
+    def test_kiosk_identifies_on_following_touch(self):
+        print("\n--- Testing Kiosk Next-Stage Touch ---")
+        first = self._touch(self.OTHER)
+        # Fallo en la galería parcial: estado neutro, sin marcación ni ticket
+        self.assertEqual(first.evento, 'reintentar')
+        self.assertIn("apoye el dedo de nuevo", first.mensaje)
+        with db_utils.db_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM ASISTENCIAS").fetchone()[0], 0)
+        self.spooler.submit.assert_not_called()
+
+        second = self._touch(self.OTHER)
+        self.assertEqual((second.evento, second.rut), ('marcado', self.OTHER))
+        self.assertEqual(self.device.galleries, [1, 3])
+        self.spooler.submit.assert_called_once()
+
+        # Tras el acierto se vuelve a la primera etapa (ahora con ambos alumnos recientes)
+        self.assertEqual(self._touch(self.RECENT).evento, 'marcado')
+        self.assertEqual(self.device.galleries[-1], 2)
+        print("[PASS] A student outside the first stage is clocked on the next touch.")
+
+    def test_unknown_finger_is_rejected_only_by_full_gallery(self):
+        print("\n--- Testing Unknown Finger ---")
+        self.assertEqual(self._touch('99999999-9').evento, 'reintentar')
+        self.assertEqual(self._touch('99999999-9').evento, 'no_reconocido')
+        self.assertEqual(self.device.galleries, [1, 3])
+        print("[PASS] Only a full-gallery miss is reported as not recognized.")
+
+    def test_manual_identification_asks_for_another_touch(self):
+        print("\n--- Testing Manual Identification ---")
+        self.device.finger = self.OTHER
+        self.assertEqual(identify.identify_user_automatically(None, session=self.session), self.OTHER)
+        self.assertEqual(self.device.galleries, [1, 3])
+        self.spooler.submit.assert_called_once()
+
+        self.device.finger = '99999999-9'
+        self.assertIsNone(identify.identify_user_automatically(None, session=self.session))
+        self.assertEqual(self.device.galleries[2:], [2, 3])
+        print("[PASS] One manual identification covers every stage.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+import db_utils
+
+
+class TestStudentDirectory(unittest.TestCase):
+    """Directorio de alumnos paginado con búsqueda por palabras en SQLite."""
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "directory.db")
+        db_utils.init_db()
+
+        with db_utils.db_connection() as conn:
+            conn.executemany("""
+                INSERT INTO ALUMNOS (primer_nombre, segundo_nombre, apellido_paterno, apellido_materno, rut, curso)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [
+                ('Ana', None, 'Pérez', 'Soto', '11111111-1', '1ro Medio'),
+                ('Juan', 'Pablo', 'Pérez', 'Rojas', '22222222-2', '2do Medio'),
+                ('Pedro', None, 'Muñoz', 'Soto', '12345678-5', '1ro Medio'),
+                ('Luisa', None, 'Soto_Díaz', 'Vera', '33333333-3', '3ro Medio'),
+            ] + [('Alumno', None, f"Apellido{i:03d}", 'Prueba', f"{40000000 + i}-K", '4to Medio') for i in range(120)])
+            conn.commit()
+
+    def tearDown(self):
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def _ruts(self, **filters):
+        return [row[0] for row in db_utils.get_alumnos_page(0, 500, 'rut', False, **filters)]
+
+    def test_search_by_words(self):
+        print("\n--- Testing Student Directory Search ---")
+        self.assertEqual(self._ruts(texto='pérez'), ['11111111-1', '22222222-2'])
+        self.assertEqual(self._ruts(texto='pérez pablo'), ['22222222-2'])
+        self.assertEqual(self._ruts(texto='soto', curso='1ro Medio'), ['11111111-1', '12345678-5'])
+        self.assertEqual(self._ruts(texto='345678'), ['12345678-5'])
+        self.assertEqual(self._ruts(texto='3ro'), ['33333333-3'])
+        # '_' y '%' se buscan literalmente
+        self.assertEqual(self._ruts(texto='o_d'), ['33333333-3'])
+        self.assertEqual(self._ruts(texto='%'), [])
+        self.assertEqual(db_utils.count_alumnos(texto='soto'), 3)
+        self.assertEqual(db_utils.get_alumnos_page(0, 1, texto='pablo')[0][1], 'Juan Pablo Pérez Rojas')
+        print("[PASS] Every word must match a name, RUT or course.")
+
+    def test_pages(self):
+        print("\n--- Testing Student Directory Pages ---")
+        self.assertEqual(db_utils.count_alumnos(), 124)
+        for order_by in db_utils.STUDENTS_PAGE_COLUMNS:
+            rows = []
+            for offset in range(0, 124, 50):
+                rows.extend(db_utils.get_alumnos_page(offset, 50, order_by, True))
+            self.assertEqual(len({row[0] for row in rows}), 124, order_by)
+        self.assertEqual(db_utils.get_course_names(), ['1ro Medio', '2do Medio', '3ro Medio', '4to Medio'])
+        print("[PASS] Pages cover every student once.")
+
+
+if __name__ == '__main__':
+    unittest.main()
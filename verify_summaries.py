@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+import db_utils
+
+
+class TestAttendanceSummaries(unittest.TestCase):
+    """Resúmenes por alumno/mes y curso/día mantenidos por triggers en ASISTENCIAS."""
+
+    def setUp(self):
+        # BD temporal para no tocar fingerprints.db
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.original_db_name = db_utils.DB_NAME
+        db_utils.DB_NAME = os.path.join(self.tmp_dir.name, "summaries.db")
+        db_utils.init_db()
+
+        estados = ['presente', 'tardanza', 'ausente', 'atraso', None]
+        with db_utils.db_connection() as conn:
+            cursor = conn.cursor()
+            for i, curso in enumerate(['1ro Medio', '4to Medio', '4to Medio', '2do Medio']):
+                cursor.execute("""
+                    INSERT INTO ALUMNOS (primer_nombre, apellido_paterno, apellido_materno, rut, curso)
+                    VALUES ('Alumno', ?, 'Prueba', ?, ?)
+                """, (f"Apellido{i}", f"{1000000 + i}-K", curso))
+                user_id = cursor.lastrowid
+                for day in range(1, 11):
+                    fecha = f"2024-{3 + day % 2:02d}-{day:02d}"
+                    # Sin curso: el trigger debe tomar el curso actual del alumno
+                    cursor.execute("""
+                        INSERT INTO ASISTENCIAS (id_alumno, fecha, hora_entrada, estado)
+                        VALUES (?, ?, '08:00:00', ?)
+                    """, (user_id, fecha, estados[(i + day) % len(estados)]))
+            conn.commit()
+
+    def tearDown(self):
+        db_utils.close_db_pool()
+        db_utils.DB_NAME = self.original_db_name
+        self.tmp_dir.cleanup()
+
+    def _summaries(self):
+        with db_utils.db_connection() as conn:
+            return (conn.execute("SELECT * FROM RESUMEN_ALUMNO_MES ORDER BY mes, id_alumno").fetchall(),
+                    conn.execute("SELECT * FROM RESUMEN_CURSO_DIA ORDER BY fecha, curso").fetchall())
+
+    def _assert_matches_rebuild(self):
+        incremental = self._summaries()
+        self.assertTrue(db_utils.rebuild_attendance_summaries()[0])
+        self.assertEqual(incremental, self._summaries())
+
+    def test_incremental_matches_rebuild(self):
+        print("\n--- Testing Incremental Summaries ---")
+        self._assert_matches_rebuild()
+        totals = db_utils.get_attendance_totals('2024-03-01', '2024-04-30')
+        self.assertEqual(totals['total'], 40)
+        self.assertEqual(totals['presentes'] + totals['tardanzas'] + totals['ausentes'], 32)
+
+        # Marcación nueva, "perdón" de atrasos al re-enrolar y borrado manual
+        result = db_utils.record_attendance('1000000-K')
+        self.assertTrue(result.registrado)
+        db_utils.save_template('Alumno', '', 'Apellido1', 'Prueba', '1000001-K', b'\x00', '08:00', 3, '4to Medio')
+        with db_utils.db_connection() as conn:
+            conn.execute("DELETE FROM ASISTENCIAS WHERE fecha = '2024-03-03'")
+            conn.commit()
+        self._assert_matches_rebuild()
+
+        summary = {row[0]: row for row in db_utils.get_student_summary('2024-01', '2024-12')}
+        self.assertEqual(summary['1000001-K'][4], 0)  # Sin tardanzas tras el re-enrolamiento
+        print("[PASS] Triggers keep summaries equal to a full rebuild.")
+
+    def test_promotion_keeps_course_history(self):
+        print("\n--- Testing Summaries Across Promotion ---")
+        before = dict((row[0], row[5]) for row in db_utils.get_course_summary('2024-01-01', '2024-12-31'))
+        self.assertEqual(db_utils.promote_students(), (True, 2, 2))
+        after = dict((row[0], row[5]) for row in db_utils.get_course_summary('2024-01-01', '2024-12-31'))
+        # Los egresados desaparecen; los promovidos conservan el curso con que marcaron
+        self.assertNotIn('4to Medio', after)
+        self.assertEqual(after, {c: n for c, n in before.items() if c != '4to Medio'})
+        with db_utils.db_connection() as conn:
+            flag = conn.execute("SELECT valor FROM META WHERE clave = 'resumen_en_lote'").fetchone()[0]
+        self.assertEqual(flag, 0)
+        self._assert_matches_rebuild()
+        print("[PASS] Graduates subtracted and course history preserved.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+
+from task_utils import TaskExecutor, TaskCancelled, current_token
+
+
+class TestTaskExecutor(unittest.TestCase):
+    """Colas con límite de concurrencia, callbacks en el hilo que hace poll() y cancelación."""
+
+    def setUp(self):
+        self.executor = TaskExecutor({'hardware': 1, 'reporting': 2})
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def _poll_until(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "La tarea no terminó a tiempo")
+            self.executor.poll()
+            time.sleep(0.005)
+
+    def test_limits_and_ui_thread_callbacks(self):
+        print("\n--- Testing Queue Limits and Callbacks ---")
+        running = {'hardware': 0, 'reporting': 0}
+        peak = {'hardware': 0, 'reporting': 0}
+        lock = threading.Lock()
+        callback_threads = []
+        results = []
+
+        def _work(queue_name, value):
+            with lock:
+                running[queue_name] += 1
+                peak[queue_name] = max(peak[queue_name], running[queue_name])
+            time.sleep(0.02)
+            with lock:
+                running[queue_name] -= 1
+            return value
+
+        def _on_success(value):
+            callback_threads.append(threading.current_thread())
+            results.append(value)
+
+        for i in range(4):
+            for queue_name in ('hardware', 'reporting'):
+                self.executor.submit(queue_name, _work, queue_name, i, on_success=_on_success)
+        self.assertEqual(self.executor.pending_count(), 8)
+        self._poll_until(lambda: len(results) == 8 and self.executor.pending_count() == 0)
+        self.assertEqual(peak, {'hardware': 1, 'reporting': 2})
+        self.assertEqual(set(callback_threads), {threading.current_thread()})
+        with self.assertRaises(ValueError):
+            self.executor.submit('correo', _work)
+        print("[PASS] Concurrency limits respected; callbacks run on the polling thread.")
+
+    def test_cancellation_and_errors(self):
+        print("\n--- Testing Cancellation and Errors ---")
+        started = threading.Event()
+        release = threading.Event()
+        events = []
+
+        def _blocking():
+            token = current_token()
+            token.on_cancel(release.set)  # Como Gio.Cancellable.cancel en la espera del dedo
+            started.set()
+            release.wait(5)
+            token.raise_if_cancelled()
+            events.append('no debería llegar aquí')
+
+        first = self.executor.submit('hardware', _blocking, on_done=lambda: events.append('primera terminada'))
+        queued = self.executor.submit('hardware', events.append, 'no debería ejecutarse',
+                                      on_done=lambda: events.append('segunda terminada'))
+        self.assertTrue(started.wait(5))
+        queued.cancel()
+        first.cancel()
+        self._poll_until(lambda: first.done and queued.done)
+        self.assertEqual(sorted(events), ['primera terminada', 'segunda terminada'])
+
+        errors = []
+        def _fail():
+            raise RuntimeError("lector desconectado")
+        self.executor.submit('reporting', _fail, on_error=errors.append)
+        self._poll_until(lambda: errors)
+        self.assertIsInstance(errors[0], RuntimeError)
+        self.assertFalse(isinstance(errors[0], TaskCancelled))
+        print("[PASS] Cancelled tasks skipped or interrupted; errors delivered to on_error.")
+
+
+if __name__ == '__main__':
+    unittest.main()